@@ -18,6 +18,7 @@ import { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import axios from "axios";
 import Cookies from "js-cookie";
+import { fetchAllPages } from "../utils/pagination";
 import ArticleForm from "../components/blog/ArticleForm";
 
 const AdminDashboard = () => {
@@ -283,12 +284,12 @@ const AdminDashboard = () => {
   const fetchArticles = async () => {
     try {
       const token = Cookies.get("token");
-      const response = await axios.get(`${API_URL}/articles/`, {
+      const articles = await fetchAllPages(`${API_URL}/articles/`, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
-      setArticles(response.data);
+      setArticles(articles);
     } catch (error) {
       console.error("Error fetching articles:", error);
     }
@@ -381,13 +382,13 @@ const AdminDashboard = () => {
     setCommentLoading(true);
     try {
       const token = Cookies.get("token");
-      const response = await axios.get(`${API_URL}/comments/`, {
+      const comments = await fetchAllPages(`${API_URL}/comments/`, {
         headers: {
           Authorization: `Bearer ${token}`,
         },
       });
-      setComments(response.data);
-      filterComments(response.data, commentFilter);
+      setComments(comments);
+      filterComments(comments, commentFilter);
       setCommentLoading(false);
     } catch (error) {
       console.error("Error fetching comments:", error);
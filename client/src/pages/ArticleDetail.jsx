@@ -145,7 +145,7 @@ const ArticleDetail = () => {
 
           <div
             className="article-content"
-            dangerouslySetInnerHTML={{ __html: article.content }}
+            dangerouslySetInnerHTML={{ __html: article.content_html }}
           />
         </Col>
       </Row>
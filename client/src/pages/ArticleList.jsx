@@ -10,7 +10,7 @@ import {
   InputGroup,
 } from "react-bootstrap";
 import { Link, useLocation, useNavigate } from "react-router-dom";
-import axios from "axios";
+import { fetchAllPages } from "../utils/pagination";
 
 const ArticleList = () => {
   const [articles, setArticles] = useState([]);
@@ -42,8 +42,7 @@ const ArticleList = () => {
       const url = search
         ? `${API_URL}/articles/search/?q=${encodeURIComponent(search)}`
         : `${API_URL}/articles/`;
-      const response = await axios.get(url);
-      setArticles(response.data);
+      setArticles(await fetchAllPages(url));
       setLoading(false);
     } catch (err) {
       console.error("Error fetching articles:", err);
@@ -132,11 +131,11 @@ const ArticleList = () => {
                 <Card.Body>
                   <Card.Title>{article.title}</Card.Title>
                   <Card.Subtitle className="mb-2 text-muted">
-                    {article.author?.username || "Anonymous"} |{" "}
+                    {article.author_username || "Anonymous"} |{" "}
                     {formatDate(article.created_at)}
                   </Card.Subtitle>
                   <Card.Text>
-                    {truncateText(article.content.replace(/<[^>]*>/g, ""))}
+                    {truncateText(article.excerpt)}
                   </Card.Text>
                 </Card.Body>
                 <Card.Footer className="bg-white">
@@ -3,6 +3,7 @@ import { Container, Row, Col, Card, Button, Spinner, Badge, Modal, Form, Alert }
 import axios from 'axios';
 import { Link } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
+import { fetchAllPages, fetchFirstPage } from '../utils/pagination';
 
 const Home = () => {
   const { user } = useAuth();
@@ -33,11 +34,8 @@ const Home = () => {
     const fetchData = async () => {
       setLoading(true);
       try {
-        // Fetch articles
-        const articlesResponse = await axios.get(`${API_URL}/articles/`);
-        
-        // Get all articles
-        const allArticles = articlesResponse.data;
+        // Fetch the first page of articles, the newest ones
+        const allArticles = await fetchFirstPage(`${API_URL}/articles/`);
         
         // Sort by created_at for recent articles (newest first)
         const sortedArticles = [...allArticles].sort((a, b) => 
@@ -73,10 +71,17 @@ const Home = () => {
   }, []);
 
   // Handler for opening article modal
-  const handleArticleClick = (article) => {
+  const handleArticleClick = async (article) => {
     setSelectedArticle(article);
     setShowModal(true);
     fetchComments(article.id);
+    // Listings only carry an excerpt; the modal shows the whole article
+    try {
+      const response = await axios.get(`${API_URL}/articles/${article.id}/`);
+      setSelectedArticle(response.data);
+    } catch (err) {
+      console.error("Error fetching article:", err);
+    }
   };
 
   // Handler for closing article modal
@@ -96,16 +101,16 @@ const Home = () => {
     try {
       console.log("Fetching comments for article ID:", articleId);
       
-      const response = await axios.get(`${API_URL}/comments/`, {
+      const allComments = await fetchAllPages(`${API_URL}/comments/`, {
         params: {
           article: articleId
         }
       });
       
-      console.log("Comments data from server:", response.data);
+      console.log("Comments data from server:", allComments);
       
       // Filter approved comments for this article
-      const articleComments = response.data.filter(comment => 
+      const articleComments = allComments.filter(comment => 
         comment.article === articleId && comment.is_approved === true
       );
       
@@ -321,9 +326,9 @@ const Home = () => {
                   <Card.Body>
                     <Badge bg="primary" className="mb-2">{article.category_name}</Badge>
                     <Card.Title>{article.title}</Card.Title>
-                    <Card.Text>{truncateText(article.content, 150)}</Card.Text>
+                    <Card.Text>{truncateText(article.excerpt, 150)}</Card.Text>
                     <div className="d-flex justify-content-between align-items-center">
-                      <small className="text-muted">By {article.author?.username || 'Unknown'}</small>
+                      <small className="text-muted">By {article.author_username || 'Unknown'}</small>
                       <small className="text-muted">{formatDate(article.created_at)}</small>
                     </div>
                     <div className="mt-3">
@@ -358,7 +363,7 @@ const Home = () => {
                     <Card.Body>
                       <Badge bg="primary" className="mb-2">{article.category_name}</Badge>
                       <Card.Title>{article.title}</Card.Title>
-                      <Card.Text>{truncateText(article.content, 100)}</Card.Text>
+                      <Card.Text>{truncateText(article.excerpt, 100)}</Card.Text>
                       
                       <div className="mt-3 d-flex justify-content-between align-items-center">
                         <small className="text-muted">
@@ -451,7 +456,7 @@ const Home = () => {
 
               <div className="article-content">
                 {/* Parse content paragraphs */}
-                {selectedArticle.content.split('\n').map((paragraph, index) => (
+                {(selectedArticle.content || selectedArticle.excerpt || '').split('\n').map((paragraph, index) => (
                   paragraph ? <p key={index} className="mb-4">{paragraph}</p> : <br key={index} />
                 ))}
               </div>
@@ -0,0 +1,27 @@
+import axios from "axios";
+
+// Article and comment listings are paginated: { next, previous, results }.
+// Fetch one listing and follow `next` until every page has been read.
+// Unpaginated endpoints (search, tags, categories) return their array as is.
+export const fetchAllPages = async (url, config = {}) => {
+  const items = [];
+  let nextUrl = url;
+  let requestConfig = config;
+  while (nextUrl) {
+    const response = await axios.get(nextUrl, requestConfig);
+    if (Array.isArray(response.data)) {
+      return response.data;
+    }
+    items.push(...response.data.results);
+    nextUrl = response.data.next;
+    // `next` already carries the query string
+    requestConfig = { ...config, params: undefined };
+  }
+  return items;
+};
+
+// Only the first page: the newest items
+export const fetchFirstPage = async (url, config = {}) => {
+  const response = await axios.get(url, config);
+  return Array.isArray(response.data) ? response.data : response.data.results;
+};
@@ -51,7 +51,7 @@ ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', 'localhost,127.0.0.1').split(','
 # Application definition
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'myapp.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -63,6 +63,30 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Keyset pagination for article and comment listings (see myapp.pagination)
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 20))
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 100))
+ARTICLE_PAGE_SIZE = int(os.environ.get('ARTICLE_PAGE_SIZE', API_PAGE_SIZE))
+COMMENT_PAGE_SIZE = int(os.environ.get('COMMENT_PAGE_SIZE', API_PAGE_SIZE))
+REPLY_PAGE_SIZE = int(os.environ.get('REPLY_PAGE_SIZE', 10))
+
+# Comment moderation queue (see myapp.moderation)
+MODERATION_LEASE_SECONDS = int(os.environ.get('MODERATION_LEASE_SECONDS', 300))  # How long a claim lasts
+MODERATION_CLAIM_SIZE = int(os.environ.get('MODERATION_CLAIM_SIZE', API_PAGE_SIZE))  # Default comments per claim
+MODERATION_MAX_IDS = int(os.environ.get('MODERATION_MAX_IDS', 1000))  # Ids accepted by one bulk request
+
+# Full-text search (see myapp.search)
+SEARCH_RESULT_LIMIT = int(os.environ.get('SEARCH_RESULT_LIMIT', 50))
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'english')  # PostgreSQL text search configuration
+
+# Characters of rendered text kept in Article.excerpt for listings (see myapp.rendering)
+EXCERPT_LENGTH = int(os.environ.get('EXCERPT_LENGTH', 300))
+
+# Rows fetched per round trip by the streaming exports (see myapp.export)
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+# Rows written per transaction by the bulk importer (see myapp.importer)
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=int(os.environ.get('JWT_ACCESS_TOKEN_LIFETIME', 1))),
@@ -94,6 +118,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.InstrumentationMiddleware',
+    'myapp.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,6 +130,16 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request instrumentation (see myapp.middleware)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'True').lower() == 'true'
+DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('DUPLICATE_QUERY_THRESHOLD', 5))
+
+# Prometheus metrics (see myapp.metrics). With several worker processes set
+# METRICS_DIR to a directory they share; METRICS_TOKEN protects /metrics.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'TomerKaravaniDjangoApp.urls'
 CORS_ALLOW_ALL_ORIGINS = os.environ.get('CORS_ALLOW_ALL_ORIGINS', 'True').lower() == 'true'
 
@@ -114,13 +150,21 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'myapp', 'templates')],
-        'APP_DIRS': True,
+        # Loaders are listed explicitly so templates are always parsed once per process
+        'APP_DIRS': False,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'myapp.context_processors.fragment_cache',
+            ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -132,12 +176,129 @@ WSGI_APPLICATION = 'TomerKaravaniDjangoApp.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# DB_ENGINE=sqlite (default) or postgresql (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+# Seconds a connection is kept open between requests (0 closes it after every
+# request); with health checks a kept connection is pinged before it is reused
+CONN_MAX_AGE = int(os.environ.get('CONN_MAX_AGE', 60))
+CONN_HEALTH_CHECKS = os.environ.get('CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+
+if DB_ENGINE == 'postgresql':
+    # DB_POOL=True uses psycopg 3's connection pool, shared by the threads of a
+    # process; pooled connections replace persistent ones
+    DB_POOL = os.environ.get('DB_POOL', 'False').lower() == 'true'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'platevite'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DB_POOL else CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if DB_POOL:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    # WAL lets readers run alongside the writer; synchronous=NORMAL is safe in
+    # WAL mode and skips an fsync per commit. cache_size is in KiB when negative.
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024)),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'temp_store': 'MEMORY',
+    }
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            # Not DB_NAME, which names the PostgreSQL database
+            'NAME': os.environ.get('SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
+            'OPTIONS': {
+                'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+                # IMMEDIATE takes the write lock when a transaction starts, so
+                # concurrent writers wait busy_timeout instead of failing
+                'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE') or None,
+            },
+        }
+    }
+
+# Read replicas (see myapp.routers): DB_REPLICA_HOSTS=host1,host2 with PostgreSQL.
+# For local testing SQLITE_REPLICAS=2 adds db.replica1.sqlite3 and
+# db.replica2.sqlite3, which `manage.py sync_replicas` copies from the primary.
+DATABASE_REPLICAS = []
+if DB_ENGINE == 'postgresql':
+    replica_settings = [{'HOST': host} for host in os.environ.get('DB_REPLICA_HOSTS', '').split(',') if host]
+else:
+    sqlite_root, sqlite_ext = os.path.splitext(DATABASES['default']['NAME'])
+    replica_settings = [
+        {'NAME': f'{sqlite_root}.replica{index}{sqlite_ext}'}
+        for index in range(1, int(os.environ.get('SQLITE_REPLICAS', 0)) + 1)
+    ]
+for index, overrides in enumerate(replica_settings, start=1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        # Tests read "replica" rows through the primary's connection
+        'TEST': {'MIRROR': 'default'},
+        **overrides,
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['myapp.routers.ReplicaRouter']
+
+# After a write, the client reads from the primary for this many seconds. JWT
+# clients are tracked per user in this cache, which must be shared by every
+# worker (CACHE_BACKEND=file or better); others get the cookie.
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_STICKY_COOKIE = 'primary_reads'
+REPLICA_STICKY_CACHE_ALIAS = 'default'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# CACHE_BACKEND=locmem (per process) or file (shared by every worker on the host)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', 'platevite'),
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 10000))},
+        }
     }
-}
+
+# Serialized API responses (see myapp.cache); 0 disables response caching
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Rendered template fragments ({% cache %} blocks); 0 disables fragment caching
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 300))
+
+# How long JWT authentication trusts a cached active/role check (see myapp.authentication)
+AUTH_STATUS_CACHE_ALIAS = 'default'
+AUTH_STATUS_TIMEOUT = int(os.environ.get('AUTH_STATUS_TIMEOUT', 60))
 
 
 # Password validation
@@ -158,6 +319,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hasher for new passwords: pbkdf2 (default), argon2 (needs argon2-cffi), scrypt or
+# bcrypt (needs bcrypt). The others still verify existing hashes, which are
+# upgraded to the chosen one on the user's next login.
+PASSWORD_HASHER_CLASSES = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
@@ -181,7 +357,36 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Profile picture thumbnails (see myapp.thumbnails): square sizes in pixels and
+# output formats. THUMBNAIL_WORKERS background threads generate them; 0 does it inline
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_SIZES = {'small': 48, 'medium': 96, 'large': 256}
+THUMBNAIL_FORMATS = ('webp', 'jpeg')
+THUMBNAIL_QUALITY = int(os.environ.get('THUMBNAIL_QUALITY', 80))
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', 2))
+# The thumbnail nested users (comment and article authors) carry as their avatar
+AVATAR_THUMBNAIL_SIZE = 'small'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Logging: request metrics and duplicate query warnings are JSON lines on stderr
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'ERROR' if TESTING else 'INFO')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'myapp': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
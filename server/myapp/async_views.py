@@ -0,0 +1,100 @@
+"""
+Async variants of the hot read endpoints, under /api/async/.
+
+Plain Django async views using the async ORM, so under an ASGI server a
+request waiting on the database does not hold a worker thread. DRF views
+are sync only, hence JsonResponse instead of Response; the payloads match
+their sync counterparts:
+
+- /api/async/articles/                  ArticleViewSet.list
+- /api/async/articles/<id>/             ArticleViewSet.retrieve
+- /api/async/articles/<id>/comments/    ArticleViewSet.comments
+- /api/async/tags/<slug>/               TagDetailView (JSON)
+
+The article list and tag payloads are cached in response_cache like their
+sync counterparts; the single article and its comments are not cached,
+nor are the sync versions. Everything is public and read-only, so no
+authentication is involved. Under WSGI the views still work, Django runs
+them through async_to_sync.
+"""
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound
+
+from . import cache
+from .cache import response_cache
+from .comment_tree import CommentTree
+from .models import Article, Tag
+from .pagination import ArticleCursorPagination
+from .querysets import article_queryset
+from .serializers import ArticleListSerializer, ArticleSerializer, CommentSerializer, TagSerializer
+from .views import ARTICLE_LIST_CACHE_TAGS
+
+
+def not_found(detail='Not found.'):
+    return JsonResponse({'detail': detail}, status=404)
+
+
+async def cached_data(request, endpoint, build, tags=(), key_parts=()):
+    key = response_cache.make_key(endpoint, request, *key_parts)
+    data, _ = await response_cache.aget_or_set(endpoint, key, build, tags)
+    return data
+
+
+@require_GET
+async def article_list(request):
+    """ Newest articles first, one keyset page at a time """
+    paginator = ArticleCursorPagination()
+
+    async def build():
+        page = await paginator.apaginate_queryset(article_queryset(ArticleListSerializer), request)
+        data = {
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': ArticleListSerializer(page, many=True, context={'request': request}).data,
+        }
+        return data, ()
+    try:
+        data = await cached_data(request, 'async-article-list', build, tags=ARTICLE_LIST_CACHE_TAGS)
+    except NotFound as e:
+        return not_found(str(e.detail))
+    return JsonResponse(data)
+
+
+@require_GET
+async def article_detail(request, pk):
+    article = await article_queryset(ArticleSerializer).filter(pk=pk).afirst()
+    if article is None:
+        return not_found()
+    return JsonResponse(ArticleSerializer(article).data)
+
+
+@require_GET
+async def article_comments(request, pk):
+    """ Every comment of the article, newest first, with nested replies """
+    article = await Article.objects.filter(pk=pk).afirst()
+    if article is None:
+        return not_found()
+    tree = await CommentTree.afor_article(article)
+    return JsonResponse(CommentSerializer(tree.newest_first(), many=True).data, safe=False)
+
+
+@require_GET
+async def tag_detail(request, slug):
+    """ The tag and every article carrying it """
+    tag = await Tag.objects.filter(slug=slug).afirst()
+    if tag is None:
+        return not_found()
+
+    async def build():
+        articles = article_queryset(ArticleListSerializer, Article.objects.filter(tags=tag))
+        # aiterator() streams from the cursor; prefetching needs an explicit chunk size
+        articles = [article async for article in articles.aiterator(chunk_size=settings.EXPORT_CHUNK_SIZE)]
+        data = {
+            'tag': TagSerializer(tag).data,
+            'articles': ArticleListSerializer(articles, many=True, context={'request': request}).data,
+        }
+        return data, ()
+    tags = [cache.tag_tag(tag.slug), cache.ARTICLES, cache.CATEGORIES, cache.USERS]
+    return JsonResponse(await cached_data(request, 'async-tag-detail', build, tags=tags, key_parts=[tag.slug]))
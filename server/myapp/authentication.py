@@ -0,0 +1,178 @@
+"""
+JWT authentication without a database query per request.
+
+Tokens issued by ClaimsRefreshToken carry the username, user_type and
+is_staff/is_superuser flags besides the user id. ClaimsJWTAuthentication
+builds request.user from those claims with User.from_db(), leaving every
+other field deferred: reading user.email or user.userprofile still works
+but loads the row at that point, so only views that need more than the
+claims pay for it.
+
+Claims are a snapshot taken at login. Whether the user is still active,
+and their current role, come from a short-lived cache entry per user
+(AUTH_STATUS_TIMEOUT seconds) which the signal handlers drop whenever the
+User or UserProfile changes. On a hit, authentication runs no queries at
+all; a deactivated user or a changed role takes effect at the latest when
+the entry expires. Tokens without the claims, issued before this module
+existed, fall back to loading the user as simplejwt does.
+"""
+from django.conf import settings
+from django.contrib.auth import authenticate, user_login_failed
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db.models import Case, Q, Value, When
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+ADMIN_USER_TYPES = ('admin', 'owner')
+
+# check_credentials() does what this backend does, in fewer queries and hashes
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+
+# Fields set from the claims; everything else on the user is deferred
+CLAIM_FIELDS = ('username', 'is_staff', 'is_superuser')
+
+
+def get_user_type(user):
+    """The user's UserProfile.user_type, from the token when authenticated by one"""
+    user_type = getattr(user, 'user_type', None)
+    if user_type is None:
+        user_type = getattr(getattr(user, 'userprofile', None), 'user_type', 'regular')
+    return user_type
+
+
+def is_admin(user):
+    """Admin and owner profiles may manage everyone's content"""
+    return bool(user and user.is_authenticated and get_user_type(user) in ADMIN_USER_TYPES)
+
+
+def check_credentials(password, username=None, email=None, request=None):
+    """
+    The active user with this username or email and password, else None.
+
+    One query finds the account (a username match wins over an email
+    match) and the password is hashed exactly once, also for unknown
+    accounts, so a failed login costs the same whichever way it fails.
+    check_password() upgrades the stored hash when PASSWORD_HASHERS
+    prefers a different algorithm or more iterations.
+
+    That replaces ModelBackend only: with other AUTHENTICATION_BACKENDS
+    configured, authenticate() runs them. Either way a failure sends
+    user_login_failed, for auditing and rate limiting hooks.
+    """
+    if list(settings.AUTHENTICATION_BACKENDS) != [MODEL_BACKEND]:
+        return authenticate_with_backends(password, username, email, request)
+    user = find_user(password, username, email)
+    if user is None:
+        user_login_failed.send(sender=__name__, credentials={'username': username or email}, request=request)
+    return user
+
+
+def find_user(password, username, email):
+    lookup = Q()
+    if username:
+        lookup |= Q(username=username)
+    if email:
+        lookup |= Q(email=email)
+    user = None
+    if lookup:
+        user = (
+            User.objects.filter(lookup)
+            .select_related('userprofile')
+            .order_by(Case(When(username=username or None, then=Value(0)), default=Value(1)), 'id')
+            .first()
+        )
+    if user is None:
+        User().set_password(password)
+        return None
+    if not user.check_password(password) or not user.is_active:
+        return None
+    return user
+
+
+def authenticate_with_backends(password, username, email, request):
+    """authenticate() by username, or by the username of the account with this email"""
+    user = None
+    if username:
+        user = authenticate(request, username=username, password=password)
+    if user is None and email:
+        account = User.objects.filter(email=email).values_list('username', flat=True).first()
+        if account is not None:
+            user = authenticate(request, username=account, password=password)
+        else:
+            user_login_failed.send(sender=__name__, credentials={'username': email}, request=request)
+    return user
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens describe the user well enough to skip the User query"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.get_username()
+        token['user_type'] = get_user_type(user)
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        return token
+
+
+# Per-user status cache
+
+def status_key(user_id):
+    return f'auth-status:{user_id}'
+
+
+def user_status(user_id):
+    """
+    {'is_active', 'is_staff', 'is_superuser', 'user_type'} for the user,
+    None if it no longer exists. Cached for AUTH_STATUS_TIMEOUT seconds.
+    """
+    cache = caches[settings.AUTH_STATUS_CACHE_ALIAS]
+    key = status_key(user_id)
+    status = cache.get(key)
+    if status is None:
+        row = User.objects.filter(pk=user_id).values(
+            'is_active', 'is_staff', 'is_superuser', 'userprofile__user_type').first()
+        # Deleted users are cached too, as a falsy placeholder
+        status = {}
+        if row is not None:
+            status = {
+                'is_active': row['is_active'],
+                'is_staff': row['is_staff'],
+                'is_superuser': row['is_superuser'],
+                'user_type': row['userprofile__user_type'] or 'regular',
+            }
+        cache.set(key, status, settings.AUTH_STATUS_TIMEOUT)
+    return status or None
+
+
+def forget_status(user_id):
+    caches[settings.AUTH_STATUS_CACHE_ALIAS].delete(status_key(user_id))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication building request.user from the token claims"""
+
+    def get_user(self, validated_token):
+        if 'username' not in validated_token or 'user_type' not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        status = user_status(user_id)
+        if status is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not status['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+        # The status entry is fresher than the token; it wins on the role flags
+        values = [user_id, validated_token['username'], status['is_staff'], status['is_superuser'], True]
+        user = User.from_db(None, ['id', *CLAIM_FIELDS, 'is_active'], values)
+        user.user_type = status['user_type']
+        return user
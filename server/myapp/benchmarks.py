@@ -0,0 +1,471 @@
+"""
+In-process API benchmarks.
+
+BenchmarkRunner drives each endpoint through the Django test client against
+a seeded dataset (see myapp.synthetic). For every endpoint it records
+latency percentiles, SQL query count and SQL time per request, serializer
+and render time from the Server-Timing header (see myapp.middleware), plus peak
+Python memory for one request traced separately with tracemalloc, so the
+tracing does not skew the timings. Results are plain JSON, and compare()
+diffs two result files to catch regressions between commits.
+
+login_throughput() measures logins per second on one core for each
+password hasher, since hashing dominates the cost of a login.
+
+server_throughput() compares the sync endpoints served through Django's
+WSGI handler from a thread pool (like gunicorn's threaded workers) with
+their async counterparts (see myapp.async_views) served through the ASGI
+handler from one event loop (like uvicorn), at the same concurrency. An
+optional delay per SQL query stands in for a remote database, which is
+where async views pay off.
+
+Run through the run_benchmarks management command, which sets up a
+throwaway test database first.
+"""
+import asyncio
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+
+from .models import Article, Comment, Tag, UserProfile
+
+BENCHMARK_USERNAME = 'benchmark'
+BENCHMARK_PASSWORD = 'Benchmark123!'
+
+
+class Endpoint:
+    """
+    One benchmarked request.
+
+    `path` is a URL or a callable taking the runner's random generator and
+    the sample rows and returning one, so detail endpoints cycle through
+    many rows instead of hitting one hot row.
+    """
+
+    def __init__(self, name, path, method='get', data=None, authenticated=False, accept='application/json'):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.authenticated = authenticated
+        self.accept = accept
+
+    def url(self, rng, samples):
+        return self.path(rng, samples) if callable(self.path) else self.path
+
+
+ENDPOINTS = [
+    Endpoint('article-list-api', '/api/articles/'),
+    Endpoint('article-list-page', '/articles/', accept='text/html'),
+    Endpoint('article-retrieve-api', lambda rng, s: f"/api/articles/{rng.choice(s['article_ids'])}/"),
+    Endpoint('article-detail', lambda rng, s: f"/articles/{rng.choice(s['article_slugs'])}/", authenticated=True),
+    Endpoint('article-detail-page', lambda rng, s: f"/articles/{rng.choice(s['article_slugs'])}/",
+             authenticated=True, accept='text/html'),
+    Endpoint('article-search', lambda rng, s: f"/api/articles/search/?q={rng.choice(s['words'])}"),
+    Endpoint('tag-list', '/api/tags/', authenticated=True),
+    Endpoint('tag-detail', lambda rng, s: f"/tags/{rng.choice(s['tag_slugs'])}/"),
+    Endpoint('tag-detail-page', lambda rng, s: f"/tags/{rng.choice(s['tag_slugs'])}/", accept='text/html'),
+    Endpoint('home-page', '/', authenticated=True, accept='text/html'),
+    Endpoint('category-list', '/api/categories/'),
+    Endpoint('article-comments', lambda rng, s: f"/api/articles/{rng.choice(s['commented_article_ids'])}/comments/"),
+    Endpoint('comment-list', lambda rng, s: f"/api/comments/?article={rng.choice(s['commented_article_ids'])}&parent=null"),
+    Endpoint('comment-replies', lambda rng, s: f"/api/comments/{rng.choice(s['parent_comment_ids'])}/replies/"),
+    Endpoint('login', '/api/auth/login/', method='post',
+             data={'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Linear-interpolated percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (position - low)
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() hook counting queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def server_timing(response):
+    """{metric: milliseconds} from a Server-Timing header"""
+    timings = {}
+    for entry in response.get('Server-Timing', '').split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                timings[name] = float(value)
+    return timings
+
+
+def create_benchmark_user():
+    user = User.objects.filter(username=BENCHMARK_USERNAME).first()
+    if user is None:
+        user = User.objects.create_superuser(BENCHMARK_USERNAME, 'benchmark@example.com', BENCHMARK_PASSWORD)
+        UserProfile.objects.create(user=user, user_type='admin')
+    return user
+
+
+def sample_rows(rng, size=200):
+    """Ids and slugs the detail endpoints pick from"""
+    def sample(values):
+        values = list(values)
+        return rng.sample(values, min(size, len(values))) or [0]
+
+    article_ids = list(Article.objects.values_list('pk', flat=True))
+    return {
+        'article_ids': sample(article_ids),
+        'article_slugs': sample(Article.objects.filter(pk__in=sample(article_ids)).values_list('slug', flat=True)),
+        'tag_slugs': sample(Tag.objects.values_list('slug', flat=True)),
+        'commented_article_ids': sample(Article.objects.filter(comment_count__gt=0).values_list('pk', flat=True)),
+        'parent_comment_ids': sample(Comment.objects.filter(reply_count__gt=0).values_list('pk', flat=True)[:10000]),
+        'words': ['django', 'cache', 'query', 'travel', 'pattern', 'latency', 'async', 'replica'],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class BenchmarkRunner:
+    def __init__(self, endpoints=None, iterations=50, warmup=5, seed=0, client=None):
+        self.endpoints = endpoints or ENDPOINTS
+        self.iterations = iterations
+        self.warmup = warmup
+        self.seed = seed
+        self.client = client or Client()
+        self.anonymous = Client()
+
+    @contextmanager
+    def recording(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            yield recorder
+
+    def request(self, endpoint, url):
+        client = self.client if endpoint.authenticated else self.anonymous
+        kwargs = {'HTTP_ACCEPT': endpoint.accept}
+        if endpoint.method == 'get':
+            return client.get(url, **kwargs)
+        return getattr(client, endpoint.method)(url, endpoint.data, content_type='application/json', **kwargs)
+
+    def run_endpoint(self, endpoint, samples):
+        rng = random.Random(f'{self.seed}:{endpoint.name}')
+        statuses = set()
+        for _ in range(self.warmup):
+            self.request(endpoint, endpoint.url(rng, samples))
+
+        latencies, query_counts, sql_times, serializer_times, render_times = [], [], [], [], []
+        for _ in range(self.iterations):
+            url = endpoint.url(rng, samples)
+            with self.recording() as recorder:
+                started = time.perf_counter()
+                response = self.request(endpoint, url)
+                latencies.append(time.perf_counter() - started)
+            statuses.add(response.status_code)
+            query_counts.append(recorder.count)
+            sql_times.append(recorder.seconds)
+            timings = server_timing(response)
+            serializer_times.append(timings.get('serialize', 0.0))
+            render_times.append(timings.get('render', 0.0))
+
+        # Memory is measured on a separate request; tracemalloc slows everything down
+        tracemalloc.start()
+        try:
+            self.request(endpoint, endpoint.url(rng, samples))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'iterations': self.iterations,
+            'status_codes': sorted(statuses),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+            'queries': round(statistics.fmean(query_counts), 2),
+            'max_queries': max(query_counts),
+            'sql_ms': round(statistics.fmean(sql_times) * 1000, 3),
+            'serializer_ms': round(statistics.fmean(serializer_times), 3),
+            'render_ms': round(statistics.fmean(render_times), 3),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def run(self, log=None):
+        user = create_benchmark_user()
+        self.client.force_login(user)
+        samples = sample_rows(random.Random(self.seed))
+        results = {}
+        for endpoint in self.endpoints:
+            results[endpoint.name] = self.run_endpoint(endpoint, samples)
+            if log:
+                log(endpoint.name, results[endpoint.name])
+        return {'meta': self.meta(), 'endpoints': results}
+
+    def meta(self):
+        return {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'articles': Article.objects.count(),
+            'comments': Comment.objects.count(),
+            'iterations': self.iterations,
+            'seed': self.seed,
+        }
+
+
+def hashers_preferring(name):
+    """PASSWORD_HASHERS with the named hasher (see settings.PASSWORD_HASHER_CLASSES) first"""
+    preferred = settings.PASSWORD_HASHER_CLASSES[name]
+    return [preferred] + [hasher for hasher in settings.PASSWORD_HASHER_CLASSES.values() if hasher != preferred]
+
+
+def login_rate(client, data, duration):
+    """(logins per wall-clock second, per CPU second, status codes) for `duration` seconds of logins"""
+    count, statuses = 0, set()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    while time.perf_counter() - started < duration:
+        response = client.post('/api/auth/login/', data, content_type='application/json',
+                               HTTP_ACCEPT='application/json')
+        statuses.add(response.status_code)
+        count += 1
+    elapsed, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+    return round(count / elapsed, 1), round(count / cpu, 1) if cpu else None, sorted(statuses)
+
+
+def login_throughput(hashers=('pbkdf2',), duration=2.0):
+    """
+    Successful and failed logins per second for each hasher name.
+
+    Requests run one after another in this process, so the rates are per
+    core; `per_cpu_second` excludes time the process was not running.
+    Hashers whose library is not installed report an error instead.
+    """
+    client = Client()
+    user = create_benchmark_user()
+    results = {}
+    for name in hashers:
+        with override_settings(PASSWORD_HASHERS=hashers_preferring(name)):
+            try:
+                user.set_password(BENCHMARK_PASSWORD)
+            except ValueError as e:
+                results[name] = {'error': str(e)}
+                continue
+            user.save(update_fields=['password'])
+            ok, ok_cpu, ok_statuses = login_rate(
+                client, {'username': BENCHMARK_USERNAME, 'password': BENCHMARK_PASSWORD}, duration)
+            failed, failed_cpu, _ = login_rate(
+                client, {'email': 'nobody@example.com', 'password': BENCHMARK_PASSWORD}, duration)
+        results[name] = {
+            'per_second': ok, 'per_cpu_second': ok_cpu, 'status_codes': ok_statuses,
+            'failed_per_second': failed, 'failed_per_cpu_second': failed_cpu,
+        }
+    return results
+
+
+# (name, sync path, async path); paths as in Endpoint
+SERVER_PAIRS = [
+    ('article-list', '/api/articles/', '/api/async/articles/'),
+    ('article-retrieve', lambda rng, s: f"/api/articles/{rng.choice(s['article_ids'])}/",
+     lambda rng, s: f"/api/async/articles/{rng.choice(s['article_ids'])}/"),
+    ('article-comments', lambda rng, s: f"/api/articles/{rng.choice(s['commented_article_ids'])}/comments/",
+     lambda rng, s: f"/api/async/articles/{rng.choice(s['commented_article_ids'])}/comments/"),
+    ('tag-detail', lambda rng, s: f"/tags/{rng.choice(s['tag_slugs'])}/",
+     lambda rng, s: f"/api/async/tags/{rng.choice(s['tag_slugs'])}/"),
+]
+
+
+class QueryDelay:
+    """Sleep before every query on every connection, as if the database were `seconds` away"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.insert(0, self)
+
+    @contextmanager
+    def active(self):
+        # Server threads open their own connections; hook those as they are created
+        connection_created.connect(self.install)
+        self.install(None, connection)
+        try:
+            yield
+        finally:
+            connection_created.disconnect(self.install)
+            connection.execute_wrappers.remove(self)
+
+
+def call_wsgi(handler, url):
+    """One GET through the WSGI handler; returns the status code"""
+    parts = urlsplit(url)
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': parts.path, 'QUERY_STRING': parts.query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver', 'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': BytesIO(), 'wsgi.errors': BytesIO(), 'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False, 'wsgi.version': (1, 0),
+    }
+    status = []
+    body = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        b''.join(body)
+    finally:
+        body.close()
+    return int(status[0].split()[0])
+
+
+async def call_asgi(application, url):
+    """One GET through the ASGI application, as a server would make it; returns the status code"""
+    parts = urlsplit(url)
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': parts.path, 'raw_path': parts.path.encode(), 'query_string': parts.query.encode(),
+        'root_path': '', 'headers': [(b'host', b'testserver'), (b'accept', b'application/json')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    done = asyncio.Event()
+    messages = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+    status = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Django listens for a disconnect while the view runs
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body'):
+            done.set()
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+def server_throughput(pairs=None, requests=200, concurrency=32, query_delay=0.0, seed=0):
+    """
+    Requests per second for each (name, sync path, async path) pair, WSGI
+    vs ASGI, with `concurrency` requests in flight.
+    """
+    pairs = pairs or SERVER_PAIRS
+    samples = sample_rows(random.Random(seed))
+    wsgi, asgi = WSGIHandler(), ASGIHandler()
+    results = {}
+    with QueryDelay(query_delay).active() if query_delay else nullcontext():
+        for name, sync_path, async_path in pairs:
+            rng = random.Random(f'{seed}:{name}')
+            sync_urls = [Endpoint(name, sync_path).url(rng, samples) for _ in range(requests)]
+            async_urls = [Endpoint(name, async_path).url(rng, samples) for _ in range(requests)]
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                sync_statuses = set(pool.map(lambda url: call_wsgi(wsgi, url), sync_urls))
+            sync_elapsed = time.perf_counter() - started
+
+            async def run_async():
+                semaphore = asyncio.Semaphore(concurrency)
+
+                async def one(url):
+                    async with semaphore:
+                        return await call_asgi(asgi, url)
+                return set(await asyncio.gather(*(one(url) for url in async_urls)))
+            started = time.perf_counter()
+            async_statuses = asyncio.run(run_async())
+            async_elapsed = time.perf_counter() - started
+
+            results[name] = {
+                'wsgi_per_second': round(requests / sync_elapsed, 1),
+                'asgi_per_second': round(requests / async_elapsed, 1),
+                'wsgi_status_codes': sorted(sync_statuses),
+                'asgi_status_codes': sorted(async_statuses),
+            }
+    return results
+
+
+# (metric, relative increase tolerated before it counts as a regression)
+COMPARED_METRICS = [('p50_ms', None), ('p95_ms', None), ('queries', 0.0), ('sql_ms', None), ('peak_memory_kb', None)]
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    Diff two result dicts.
+
+    Returns (rows, regressions): rows are (endpoint, metric, baseline,
+    current, relative change) for every compared metric; regressions are
+    the rows whose increase exceeds `threshold` (any increase for query
+    counts, which do not vary between runs).
+    """
+    rows, regressions = [], []
+    for name, result in current['endpoints'].items():
+        before = baseline['endpoints'].get(name)
+        if before is None:
+            continue
+        for metric, tolerance in COMPARED_METRICS:
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else (0.0 if new == old else float('inf'))
+            row = (name, metric, old, new, change)
+            rows.append(row)
+            if change > (threshold if tolerance is None else tolerance):
+                regressions.append(row)
+    return rows, regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def dump(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
@@ -0,0 +1,232 @@
+"""
+Response cache for read-heavy endpoints.
+
+Serialized response data is cached per endpoint and query string. Each
+entry records the dependency tags it was built from (`article:<id>`,
+`tag:<slug>`, `category:<id>`, `articles`, ...) together with the current
+version of every tag. Invalidating a tag just gives it a new version, so any
+entry built from the old version is treated as a miss from then on. This
+works with any Django cache backend, including local-memory and file-based
+caches, because it only needs get/set/get_many/set_many.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .routers import use_primary
+
+# Collection tags, invalidated whenever any member changes
+ARTICLES = 'articles'
+TAGS = 'tags'
+CATEGORIES = 'categories'
+USERS = 'users'
+
+
+def article_tag(article_id):
+    return f'article:{article_id}'
+
+
+def tag_tag(slug):
+    return f'tag:{slug}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
+
+
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def article_dependencies(article):
+    """Tags for a payload built from one article and its related rows"""
+    tags = [article_tag(article.pk), category_tag(article.category_id), user_tag(article.author_id)]
+    tags.extend(tag_tag(tag.slug) for tag in article.tags.all())
+    return tags
+
+
+class CacheStats:
+    """Process-local hit/miss counters, per endpoint"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def record(self, endpoint, event):
+        with self.lock:
+            self.counts[(endpoint, event)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            counts = dict(self.counts)
+        invalidations = counts.pop((None, 'invalidations'), 0)
+        endpoints = {}
+        for (endpoint, event), value in counts.items():
+            endpoints.setdefault(endpoint, {'hits': 0, 'misses': 0})[event] = value
+        hits = sum(stats['hits'] for stats in endpoints.values())
+        misses = sum(stats['misses'] for stats in endpoints.values())
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+            'invalidations': invalidations,
+            'endpoints': endpoints,
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+class ResponseCache:
+    key_prefix = 'response'
+    tag_prefix = 'cachetag'
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    @property
+    def cache(self):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    @property
+    def enabled(self):
+        return settings.RESPONSE_CACHE_TIMEOUT > 0
+
+    def tag_key(self, tag):
+        return f'{self.tag_prefix}:{tag}'
+
+    def make_key(self, endpoint, request, *parts):
+        """Key an entry on the endpoint, its arguments and the query string"""
+        # DRF requests, or plain Django ones from the async views, which only render JSON
+        query = getattr(request, 'query_params', request.GET)
+        renderer = getattr(request, 'accepted_renderer', None)
+        params = sorted((key, sorted(values)) for key, values in query.lists())
+        # Pagination links are absolute, so the host is part of the key too
+        raw = repr((request.scheme, request.get_host(), parts, params, renderer.format if renderer else 'json'))
+        digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+        return f'{self.key_prefix}:{endpoint}:{digest}'
+
+    def current_versions(self, tags, create=False):
+        keys = {self.tag_key(tag): tag for tag in tags}
+        found = self.cache.get_many(keys)
+        versions = {keys[key]: version for key, version in found.items()}
+        if create:
+            for key, tag in keys.items():
+                if tag not in versions:
+                    # Versions are timestamps, so a version evicted from the
+                    # cache can never come back with a value an old entry used
+                    self.cache.add(key, time.time_ns(), timeout=None)
+                    versions[tag] = self.cache.get(key)
+        return versions
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        if self.current_versions(entry['tags']) != entry['tags']:
+            return None
+        return entry['data']
+
+    def get_or_set(self, endpoint, key, build, tags=()):
+        """
+        Return (data, hit) for `key`, calling build() on a miss.
+
+        build() returns a (data, extra_tags) pair. Versions of the `tags`
+        known up front are read before the data is built, so an
+        invalidation that races with the build leaves the new entry stale
+        instead of being lost.
+        """
+        if not self.enabled:
+            data, extra_tags = build()
+            return data, False
+        data = self.get(key)
+        if data is not None:
+            self.stats.record(endpoint, 'hits')
+            return data, True
+
+        self.stats.record(endpoint, 'misses')
+        versions = self.current_versions(set(tags), create=True)
+        # A replica may not have the write behind the invalidation yet
+        with use_primary():
+            data, extra_tags = build()
+        extra_tags = set(extra_tags) - set(versions)
+        if extra_tags:
+            versions.update(self.current_versions(extra_tags, create=True))
+        self.cache.set(key, {'data': data, 'tags': versions}, settings.RESPONSE_CACHE_TIMEOUT)
+        return data, False
+
+    async def aget_or_set(self, endpoint, key, build, tags=()):
+        """get_or_set() for async views, where build is a coroutine function"""
+        if not self.enabled:
+            data, extra_tags = await build()
+            return data, False
+        data = await sync_to_async(self.get)(key)
+        if data is not None:
+            self.stats.record(endpoint, 'hits')
+            return data, True
+
+        self.stats.record(endpoint, 'misses')
+        versions = await sync_to_async(self.current_versions)(set(tags), create=True)
+        with use_primary():
+            data, extra_tags = await build()
+        extra_tags = set(extra_tags) - set(versions)
+        if extra_tags:
+            versions.update(await sync_to_async(self.current_versions)(extra_tags, create=True))
+        await self.cache.aset(key, {'data': data, 'tags': versions}, settings.RESPONSE_CACHE_TIMEOUT)
+        return data, False
+
+    def invalidate(self, *tags):
+        tags = {tag for tag in tags if tag}
+        if not tags:
+            return
+        version = time.time_ns()
+        self.cache.set_many({self.tag_key(tag): version for tag in tags}, timeout=None)
+        self.stats.record(None, 'invalidations')
+
+
+response_cache = ResponseCache()
+
+
+def invalidate(*tags):
+    """Invalidate `tags` now and again once the current transaction commits"""
+    response_cache.invalidate(*tags)
+    # A reader may re-cache the old rows before the transaction commits
+    transaction.on_commit(lambda: response_cache.invalidate(*tags))
+
+
+class CachedResponseMixin:
+    """
+    Helpers for views that cache their JSON payloads in `response_cache`.
+
+    Only JSON responses are cached; template responses depend on the user
+    and the CSRF token.
+    """
+    cache_endpoint = None
+
+    def cached_data(self, build, tags=(), key_parts=()):
+        """
+        Return this request's payload, building it with build() on a miss.
+
+        build() returns (data, extra_tags); see ResponseCache.get_or_set().
+        """
+        endpoint = self.cache_endpoint or type(self).__name__
+        if self.request.accepted_renderer.format != 'json':
+            data, extra_tags = build()
+            return data
+        key = response_cache.make_key(endpoint, self.request, *key_parts)
+        data, self.cache_hit = response_cache.get_or_set(endpoint, key, build, tags)
+        return data
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        hit = getattr(self, 'cache_hit', None)
+        if hit is not None:
+            response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
@@ -0,0 +1,68 @@
+from .models import Comment
+
+
+class CommentTree:
+    """
+    Threaded view of an article's comments built from a single query.
+
+    Every comment in the tree gets two attributes that the serializers and
+    templates read instead of querying `comment.replies`:
+
+    - `tree_children`: direct replies, oldest first
+    - `tree_reply_count`: number of approved direct replies, like reply_count
+
+    Threads can be nested to any depth.
+    """
+
+    def __init__(self, comments):
+        self.comments = list(comments)
+        self.roots = []
+        by_id = {}
+        for comment in self.comments:
+            comment.tree_children = []
+            by_id[comment.id] = comment
+
+        # Comments arrive oldest first, so children end up in order too
+        for comment in self.comments:
+            parent = by_id.get(comment.parent_id)
+            if parent is None:
+                self.roots.append(comment)
+            else:
+                parent.tree_children.append(comment)
+                # Reuse the loaded parent instead of lazily fetching it again
+                comment.parent = parent
+
+        for comment in self.comments:
+            comment.tree_reply_count = sum(reply.is_approved for reply in comment.tree_children)
+
+    @classmethod
+    def for_article(cls, article, queryset=None):
+        """Load every comment of `article` in one query and build the tree"""
+        if queryset is None:
+            queryset = Comment.objects.all()
+        queryset = queryset.filter(article=article).select_related('user__userprofile').order_by('created_at', 'id')
+        comments = list(queryset)
+        for comment in comments:
+            comment.article = article
+        return cls(comments)
+
+    @classmethod
+    async def afor_article(cls, article, queryset=None):
+        """for_article() using the async ORM"""
+        if queryset is None:
+            queryset = Comment.objects.all()
+        queryset = queryset.filter(article=article).select_related('user__userprofile').order_by('created_at', 'id')
+        comments = [comment async for comment in queryset]
+        for comment in comments:
+            comment.article = article
+        return cls(comments)
+
+    def newest_first(self):
+        """All comments, newest first"""
+        return self.comments[::-1]
+
+    def __len__(self):
+        return len(self.comments)
+
+    def __iter__(self):
+        return iter(self.comments)
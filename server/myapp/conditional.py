@@ -0,0 +1,74 @@
+"""
+HTTP conditional GET support.
+
+A payload's ETag is built from the current versions of the response cache
+tags it depends on (see myapp.cache) and the request's query string, so
+every invalidation that makes a cached payload stale also changes its
+ETag. Reading the versions is one cache lookup and no queries, so a
+request whose If-None-Match still matches gets a 304 without touching the
+database or building the body.
+
+The payloads are sent without Last-Modified: tag versions say that
+something changed, not when, and a deleted row never shows up in a
+max(updated_at).
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+from .cache import response_cache
+
+
+class Validators:
+    """An ETag"""
+
+    def __init__(self, *parts):
+        digest = hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+        self.etag = f'"{digest}"'
+
+
+def cache_validators(request, endpoint, tags, *key_parts):
+    """
+    Validators for the payload `endpoint` builds from `tags` for `request`.
+
+    None when a cache backend that stores nothing (such as DummyCache) can't
+    tell the versions, so nothing is ever answered with a 304.
+    """
+    versions = response_cache.current_versions(set(tags), create=True)
+    if None in versions.values():
+        return None
+    key = response_cache.make_key(endpoint, request, *key_parts)
+    return Validators(key, sorted(versions.items()))
+
+
+class ConditionalGetMixin:
+    """
+    Answer repeat GETs of JSON payloads with 304 Not Modified.
+
+    Views call not_modified() with their validators before building the
+    response body and return its result when it isn't None; the validators
+    are then added to the final response.
+    """
+    conditional_validators = None
+
+    def not_modified(self, validators):
+        request = self.request
+        if validators is None or request.method not in ('GET', 'HEAD') or request.accepted_renderer.format != 'json':
+            return None
+        self.conditional_validators = validators
+        response = get_conditional_response(request._request, etag=validators.etag)
+        if response is not None:
+            self.add_validators(response)
+        return response
+
+    def add_validators(self, response):
+        validators = self.conditional_validators
+        if validators is None or response.status_code not in (200, 304):
+            return
+        response['ETag'] = validators.etag
+        patch_vary_headers(response, ['Accept'])
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        self.add_validators(response)
+        return response
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def fragment_cache(request):
+    """Timeout for the {% cache %} fragments in the templates (see myapp.templatetags.fragments)"""
+    return {'FRAGMENT_CACHE_TIMEOUT': settings.FRAGMENT_CACHE_TIMEOUT}
@@ -0,0 +1,76 @@
+"""
+Denormalized counters.
+
+Tag.article_count, Category.article_count, Article.comment_count and
+Comment.reply_count (approved replies only, as /replies/ lists) are kept up
+to date by the signal handlers in myapp.signals using F() expressions, so
+concurrent writers never lose an update. reconcile() recomputes them from scratch to repair any drift, for
+example after raw SQL or bulk operations that bypass signals.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Article, Category, Comment, Tag
+
+
+def adjust(model, field, delta, **filters):
+    """Atomically add `delta` to `field` on the rows matching `filters`"""
+    if not delta:
+        return 0
+    return model.objects.filter(**filters).update(**{field: F(field) + delta})
+
+
+def adjust_tags(tag_ids, delta):
+    tag_ids = list(tag_ids)
+    if tag_ids:
+        adjust(Tag, 'article_count', delta, pk__in=tag_ids)
+
+
+def approved_replies():
+    """Subquery counting the approved direct replies of the outer comment"""
+    return (Comment.objects.filter(parent_id=OuterRef('pk'), is_approved=True)
+            .order_by().values('parent_id').annotate(total=Count('*')).values('total'))
+
+
+def recount_replies(comment_ids):
+    """Recompute reply_count of the given comments with one UPDATE, after bulk changes"""
+    comment_ids = [pk for pk in comment_ids if pk]
+    if comment_ids:
+        Comment.objects.filter(pk__in=comment_ids).update(
+            reply_count=Coalesce(Subquery(approved_replies()), Value(0))
+        )
+
+
+def actual_counts():
+    """
+    (model, counter field, subquery computing the true value) for each counter
+
+    Subqueries instead of joins keep the GROUP BY off the outer table.
+    """
+    through = Article.tags.through
+    return [
+        (Tag, 'article_count', through.objects.filter(tag_id=OuterRef('pk'))
+            .values('tag_id').annotate(total=Count('*')).values('total')),
+        (Category, 'article_count', Article.objects.filter(category_id=OuterRef('pk'))
+            .order_by().values('category_id').annotate(total=Count('*')).values('total')),
+        (Article, 'comment_count', Comment.objects.filter(article_id=OuterRef('pk'))
+            .order_by().values('article_id').annotate(total=Count('*')).values('total')),
+        (Comment, 'reply_count', approved_replies()),
+    ]
+
+
+def reconcile(dry_run=False):
+    """
+    Compare every counter with the real count and fix the ones that drifted.
+
+    Returns a {'Model.field': number of drifted rows} dict.
+    """
+    drift = {}
+    for model, field, subquery in actual_counts():
+        actual = Coalesce(Subquery(subquery), Value(0))
+        drifted = model.objects.annotate(actual=actual).exclude(**{field: F('actual')})
+        count = drifted.count()
+        drift[f'{model.__name__}.{field}'] = count
+        if count and not dry_run:
+            model.objects.filter(pk__in=drifted.values('pk')).update(**{field: actual})
+    return drift
@@ -0,0 +1,68 @@
+"""
+Database connection statistics for monitoring.
+
+database_stats() describes every configured database alias: how
+connections are kept (CONN_MAX_AGE, health checks), the PostgreSQL pool
+statistics when DB_POOL is on and the effective SQLite pragmas. Pools and
+connections belong to one process, so the numbers are for the process
+that answers.
+"""
+from django.db import connections
+
+# psycopg_pool statistics reported as gauges on /metrics (see views.metrics_view)
+POOL_GAUGES = {
+    'pool_size': 'Connections currently managed by the pool',
+    'pool_available': 'Idle connections in the pool',
+    'requests_waiting': 'Requests waiting for a pool connection',
+}
+
+SQLITE_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout')
+
+
+def pool_stats(connection):
+    """psycopg_pool's get_stats() for a pooled PostgreSQL connection, else None"""
+    if connection.vendor != 'postgresql' or not connection.settings_dict['OPTIONS'].get('pool'):
+        return None
+    return connection.pool.get_stats()
+
+
+def sqlite_pragmas(connection):
+    with connection.cursor() as cursor:
+        pragmas = {}
+        for name in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}')
+            row = cursor.fetchone()
+            # In-memory databases report nothing for mmap_size
+            pragmas[name] = row[0] if row else None
+    return pragmas
+
+
+def database_stats():
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        entry = {
+            'vendor': connection.vendor,
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+            'connected': connection.connection is not None,
+        }
+        pool = pool_stats(connection)
+        if pool is not None:
+            entry['pool'] = pool
+        if connection.vendor == 'sqlite':
+            entry['pragmas'] = sqlite_pragmas(connection)
+        stats[alias] = entry
+    return stats
+
+
+def pool_gauges():
+    """(name, help, value, labels) for each pooled alias, for metrics.render()"""
+    gauges = []
+    for alias in connections:
+        stats = pool_stats(connections[alias])
+        if stats is None:
+            continue
+        for key, help_text in POOL_GAUGES.items():
+            gauges.append((f'db_{key}', help_text, stats.get(key, 0), (('alias', alias),)))
+    return gauges
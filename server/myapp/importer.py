@@ -0,0 +1,207 @@
+"""
+Bulk import of articles from NDJSON.
+
+Each line is one article object:
+
+    {"title": "...", "content": "...", "category": "<slug>",
+     "tags": ["<slug>", ...], "author": "<username>", "slug": "<optional>"}
+
+which is also the shape myapp.export produces, so an export can be imported
+again. Rows are handled in batches of IMPORT_BATCH_SIZE: categories, tags,
+authors and slugs are resolved with one lookup per batch, then the articles
+and their tag rows are written with bulk_create() in a single transaction.
+Invalid rows are reported and skipped without affecting the rest of the
+batch.
+
+bulk_create() bypasses the signal handlers, so the counters, search index
+and response cache are updated here once per batch instead.
+"""
+import json
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+from . import cache, counters
+from .models import Article, Category, Tag, unique_slugs
+from .search import get_backend as get_search_backend
+
+TITLE_MAX_LENGTH = Article._meta.get_field('title').max_length
+SLUG_MAX_LENGTH = Article._meta.get_field('slug').max_length
+
+
+def parse(row):
+    """Decode one NDJSON line; already decoded objects are passed through"""
+    if isinstance(row, bytes):
+        row = row.decode('utf-8')
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError('Expected a JSON object')
+    return row
+
+
+class ArticleImporter:
+    """
+    Import articles in batches and collect per-row errors.
+
+    `author` is used for rows that do not name one; with
+    allow_author=False it is used for every row.
+    """
+
+    def __init__(self, author=None, allow_author=True, batch_size=None):
+        self.author = author
+        self.allow_author = allow_author
+        self.batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+        self.created = 0
+        self.errors = []
+
+    def run(self, lines):
+        """Import every line of `lines` and return the summary"""
+        numbered = (
+            (number, line) for number, line in enumerate(lines, start=1)
+            if not isinstance(line, (str, bytes)) or line.strip()
+        )
+        while True:
+            batch = list(islice(numbered, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        return self.summary()
+
+    def summary(self):
+        return {'created': self.created, 'failed': len(self.errors), 'errors': self.errors}
+
+    def error(self, line, message):
+        self.errors.append({'line': line, 'error': message})
+
+    def import_batch(self, batch):
+        rows = []
+        for line, raw in batch:
+            try:
+                rows.append((line, parse(raw)))
+            except ValueError as e:
+                self.error(line, f'Invalid JSON: {e}')
+
+        categories = Category.objects.in_bulk(
+            {row.get('category') for _, row in rows if isinstance(row.get('category'), str)},
+            field_name='slug',
+        )
+        # Rows are not validated yet; validate() reports a `tags` that is not a list
+        tags = Tag.objects.in_bulk(
+            {slug for _, row in rows if isinstance(row.get('tags'), list)
+             for slug in row['tags'] if isinstance(slug, str)},
+            field_name='slug',
+        )
+        authors = {}
+        if self.allow_author:
+            authors = User.objects.in_bulk(
+                {row['author'] for _, row in rows if isinstance(row.get('author'), str)},
+                field_name='username',
+            )
+        existing_slugs = set(Article.objects.filter(
+            slug__in=[row['slug'] for _, row in rows if isinstance(row.get('slug'), str)]
+        ).values_list('slug', flat=True))
+
+        valid = []
+        for line, row in rows:
+            message = self.validate(row, categories, tags, authors, existing_slugs)
+            if message:
+                self.error(line, message)
+                continue
+            if row.get('slug'):
+                existing_slugs.add(row['slug'])
+            valid.append((line, row))
+        if not valid:
+            return
+
+        explicit_slugs = {row['slug'] for _, row in valid if row.get('slug')}
+        generated = iter(unique_slugs(
+            Article, [slugify(row['title']) for _, row in valid if not row.get('slug')],
+            fallback='article', reserved=explicit_slugs,
+        ))
+        articles = []
+        article_tags = []
+        for _, row in valid:
+            author = authors.get(row.get('author')) if self.allow_author and row.get('author') else self.author
+            articles.append(Article(
+                title=row['title'],
+                slug=row.get('slug') or next(generated),
+                content=row['content'],
+                author=author,
+                category=categories[row['category']],
+            ))
+            article_tags.append([tags[slug] for slug in dict.fromkeys(row.get('tags') or [])])
+        # bulk_create() skips Article.save(), which renders the Markdown
+        for article in articles:
+            article.render_content()
+
+        try:
+            with transaction.atomic():
+                Article.objects.bulk_create(articles)
+                through = Article.tags.through
+                through.objects.bulk_create([
+                    through(article_id=article.pk, tag_id=tag.pk)
+                    for article, tag_list in zip(articles, article_tags) for tag in tag_list
+                ], batch_size=self.batch_size)
+                self.after_import(articles, article_tags)
+        except IntegrityError as e:
+            # Typically a slug taken by a concurrent writer; nothing in this batch was saved
+            for line, _ in valid:
+                self.error(line, f'Batch rolled back: {e}')
+            return
+        self.created += len(articles)
+
+    def validate(self, row, categories, tags, authors, existing_slugs):
+        """Return an error message for an invalid row, None otherwise"""
+        title = row.get('title')
+        if not isinstance(title, str) or not title.strip():
+            return 'title is required'
+        if len(title) > TITLE_MAX_LENGTH:
+            return f'title is longer than {TITLE_MAX_LENGTH} characters'
+        if not isinstance(row.get('content'), str) or not row['content'].strip():
+            return 'content is required'
+        category = row.get('category')
+        if not isinstance(category, str) or category not in categories:
+            return f'unknown category {category!r}'
+        tag_slugs = row.get('tags') or []
+        if not isinstance(tag_slugs, list) or not all(isinstance(slug, str) for slug in tag_slugs):
+            return 'tags must be a list of tag slugs'
+        missing = [slug for slug in tag_slugs if slug not in tags]
+        if missing:
+            return f'unknown tags {missing!r}'
+        if self.allow_author and row.get('author'):
+            if not isinstance(row['author'], str) or row['author'] not in authors:
+                return f'unknown author {row["author"]!r}'
+        elif self.author is None:
+            return 'author is required'
+        slug = row.get('slug')
+        if slug:
+            if not isinstance(slug, str) or slug != slugify(slug) or len(slug) > SLUG_MAX_LENGTH:
+                return f'invalid slug {slug!r}'
+            if slug in existing_slugs:
+                return f'slug {slug!r} already exists'
+        return None
+
+    def after_import(self, articles, article_tags):
+        """Do what the signal handlers would have done for each article"""
+        for category_id, count in Counter(article.category_id for article in articles).items():
+            counters.adjust(Category, 'article_count', count, pk=category_id)
+        tag_counts = Counter(tag.pk for tag_list in article_tags for tag in tag_list)
+        for delta in set(tag_counts.values()):
+            counters.adjust_tags([pk for pk, count in tag_counts.items() if count == delta], delta)
+
+        get_search_backend().index([article.pk for article in articles])
+
+        tags = {cache.ARTICLES, cache.CATEGORIES, cache.TAGS}
+        tags.update(cache.category_tag(article.category_id) for article in articles)
+        tags.update(cache.tag_tag(tag.slug) for tag_list in article_tags for tag in tag_list)
+        cache.invalidate(*tags)
+
+
+def import_articles(lines, author=None, allow_author=True, batch_size=None):
+    """Import NDJSON `lines`; see ArticleImporter"""
+    return ArticleImporter(author, allow_author, batch_size).run(lines)
@@ -0,0 +1,95 @@
+"""
+Per-request performance metrics.
+
+InstrumentationMiddleware (see myapp.middleware) puts a RequestMetrics in
+`current_metrics` for every request. While the request runs it collects:
+
+- SQL: query count, time spent in the database and how often each query
+  shape ran. Shapes are the parameterized SQL with IN lists collapsed, so
+  the same query run in a loop (an N+1) shows up as one signature with a
+  high count.
+- Serializer time: top-level to_representation() calls of serializers
+  using TimedSerializerMixin; nested serializers are part of their parent.
+- Render time: rendering the TemplateResponse/DRF Response, i.e. the HTML
+  template or the JSON encoding.
+
+Code outside a request sees `current_metrics` as None and is not measured.
+
+Queries reach the request's RequestMetrics through record_query(), an
+execute wrapper installed on every database connection when it is opened
+(see myapp.signals). Being a ContextVar, `current_metrics` follows the
+request into the threads where the async ORM runs its queries, so async
+views are measured like sync ones.
+"""
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+# "IN (%s, %s, %s)", so queries differing only in list length match
+PLACEHOLDER_LIST_RE = re.compile(r'\bIN \((?:\s*%s\s*,)*\s*%s\s*\)', re.IGNORECASE)
+
+
+def query_signature(sql):
+    return PLACEHOLDER_LIST_RE.sub('IN (...)', sql)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.render_time = 0.0
+        self.signatures = Counter()
+        self.serializer_depth = 0
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def record_query(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+            self.signatures[query_signature(sql)] += 1
+
+    def duplicate_queries(self, threshold):
+        """(count, signature) for every query shape that ran `threshold` or more times"""
+        return [(count, sql) for sql, count in self.signatures.most_common() if count >= threshold]
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper passing the query to the current request's metrics, if any"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.record_query(execute, sql, params, many, context)
+
+
+def install_query_hook(connection):
+    # First in the list, so connection.execute_wrapper() blocks still pop their own wrapper
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedSerializerMixin:
+    """Count this serializer's to_representation() towards the request's serializer time"""
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
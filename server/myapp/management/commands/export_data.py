@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.export import EXPORTS, FORMATS, export
+
+
+class Command(BaseCommand):
+    help = 'Stream all articles or comments to stdout or a file as NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', help='File to write to (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows fetched per database round trip (default: EXPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        try:
+            lines = export(options['kind'], options['fmt'], options['chunk_size'])
+        except ValueError as e:
+            raise CommandError(e)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
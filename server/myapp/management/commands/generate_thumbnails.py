@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp import thumbnails
+from myapp.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Generate the profile picture thumbnails (see myapp.thumbnails) of profiles that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Regenerate every profile, e.g. after changing THUMBNAIL_SIZES')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(profile_pic='').exclude(profile_pic__isnull=True)
+        if not options['all']:
+            profiles = profiles.filter(thumbnails={})
+        pks = list(profiles.values_list('pk', flat=True))
+        if settings.THUMBNAIL_WORKERS > 0:
+            # Spread over the worker pool like uploads, but wait for the results
+            results = thumbnails.executor().map(thumbnails.run, pks)
+        else:
+            results = map(thumbnails.generate, pks)
+        done = sum(result is not None for result in results)
+        self.stdout.write(f'Generated thumbnails for {done} of {len(pks)} profiles')
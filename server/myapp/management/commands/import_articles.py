@@ -0,0 +1,38 @@
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.importer import import_articles
+
+
+class Command(BaseCommand):
+    help = 'Bulk import articles from an NDJSON file (one article object per line)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file to read, or '-' for stdin")
+        parser.add_argument('--author', help='Username used for rows that do not name an author')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows written per transaction (default: IMPORT_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            try:
+                author = User.objects.get(username=options['author'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user {options['author']!r}")
+
+        if options['path'] == '-':
+            result = import_articles(sys.stdin, author=author, batch_size=options['batch_size'])
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as f:
+                    result = import_articles(f, author=author, batch_size=options['batch_size'])
+            except OSError as e:
+                raise CommandError(e)
+
+        for error in result['errors']:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(f"Imported {result['created']} article(s), {result['failed']} failed"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from myapp.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the article full-text search index from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of articles to read and index per batch')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['database'])
+        total = backend.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} articles with {type(backend).__name__}'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from myapp.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized article/comment counters and repair any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report drifted counters, do not fix them')
+
+    def handle(self, *args, **options):
+        drift = reconcile(dry_run=options['dry_run'])
+        for counter, rows in drift.items():
+            if rows:
+                verb = 'drifted' if options['dry_run'] else 'repaired'
+                self.stdout.write(self.style.WARNING(f'{counter}: {rows} row(s) {verb}'))
+            else:
+                self.stdout.write(f'{counter}: ok')
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp import cache
+from myapp.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Render Article.content into content_html and excerpt (see myapp.rendering) for existing articles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render every article, e.g. after changing the Markdown extensions')
+        parser.add_argument('--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE,
+                            help='Articles rendered and written per UPDATE')
+
+    def handle(self, *args, **options):
+        articles = Article.objects.order_by('pk').only('pk', 'content')
+        if not options['all']:
+            articles = articles.filter(content_html='')
+        batch_size = options['batch_size']
+        batch = []
+        rendered = 0
+        for article in articles.iterator(chunk_size=batch_size):
+            article.render_content()
+            batch.append(article)
+            if len(batch) >= batch_size:
+                rendered += self.write(batch)
+                batch = []
+        if batch:
+            rendered += self.write(batch)
+        self.stdout.write(f'Rendered {rendered} article(s)')
+
+    def write(self, batch):
+        # bulk_update() leaves updated_at alone: the content itself did not change
+        Article.objects.bulk_update(batch, ['content_html', 'excerpt'])
+        cache.invalidate(cache.ARTICLES, *[cache.article_tag(article.pk) for article in batch])
+        return len(batch)
@@ -0,0 +1,129 @@
+import logging
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from myapp import benchmarks
+from myapp.synthetic import SyntheticDataGenerator
+
+
+class Command(BaseCommand):
+    help = ('Seed a throwaway test database and benchmark the API endpoints '
+            '(latency percentiles, SQL queries and time, peak memory)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=2000, help='Size of the seeded dataset')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the dataset and request order')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint first')
+        parser.add_argument('--endpoint', action='append', dest='endpoints', metavar='NAME',
+                            help='Only run this endpoint (repeatable); choices: '
+                                 + ', '.join(endpoint.name for endpoint in benchmarks.ENDPOINTS))
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Keep the response and template fragment caches on '
+                                 '(by default every request is a cache miss)')
+        parser.add_argument('--logins', metavar='HASHERS', nargs='?', const='pbkdf2,scrypt,argon2',
+                            help='Also measure logins per second per core for these password hashers '
+                                 '(comma-separated; default pbkdf2,scrypt,argon2)')
+        parser.add_argument('--login-seconds', type=float, default=2.0,
+                            help='How long to run logins for each hasher')
+        parser.add_argument('--servers', action='store_true',
+                            help='Also compare sync views under WSGI with the async views under ASGI')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Requests in flight for --servers (WSGI threads / ASGI tasks)')
+        parser.add_argument('--server-requests', type=int, default=200, help='Requests per endpoint for --servers')
+        parser.add_argument('--query-delay', type=float, default=0.0, metavar='MS',
+                            help='Add this much latency to every SQL query in --servers, like a remote database')
+        parser.add_argument('--output', '-o', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', metavar='BASELINE', help='Compare with an earlier results file')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Relative increase counted as a regression (default 0.2 = 20%%)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error if --compare finds regressions')
+
+    def handle(self, *args, **options):
+        endpoints = benchmarks.ENDPOINTS
+        if options['endpoints']:
+            known = {endpoint.name: endpoint for endpoint in endpoints}
+            unknown = set(options['endpoints']) - set(known)
+            if unknown:
+                raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+            endpoints = [known[name] for name in options['endpoints']]
+        baseline = benchmarks.load(options['compare']) if options['compare'] else None
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            overrides = {} if options['with_cache'] else {'RESPONSE_CACHE_TIMEOUT': 0, 'FRAGMENT_CACHE_TIMEOUT': 0}
+            with override_settings(**overrides):
+                caches['default'].clear()
+                self.stdout.write(f"Seeding {options['articles']} articles (seed {options['seed']})")
+                SyntheticDataGenerator(options['articles'], seed=options['seed'], log=lambda message: None).run()
+                runner = benchmarks.BenchmarkRunner(endpoints, options['iterations'], options['warmup'], options['seed'])
+                self.stdout.write(f"{'endpoint':24} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'sql':>9} {'render':>9} {'peak':>10}")
+                # One log line per request (or failed login) would drown the report
+                loggers = [logging.getLogger(name) for name in ('myapp.requests', 'myapp.views', 'django.request')]
+                levels = [logger.level for logger in loggers]
+                for logger in loggers:
+                    logger.setLevel(logging.ERROR)
+                try:
+                    results = runner.run(log=self.log_result)
+                    if options['logins']:
+                        results['logins'] = benchmarks.login_throughput(
+                            options['logins'].split(','), options['login_seconds'])
+                        self.log_logins(results['logins'])
+                    if options['servers']:
+                        results['servers'] = benchmarks.server_throughput(
+                            requests=options['server_requests'], concurrency=options['concurrency'],
+                            query_delay=options['query_delay'] / 1000, seed=options['seed'])
+                        self.log_servers(results['servers'])
+                finally:
+                    for logger, level in zip(loggers, levels):
+                        logger.setLevel(level)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options['output']:
+            benchmarks.dump(results, options['output'])
+            self.stdout.write(f"Results written to {options['output']}")
+        if baseline is not None:
+            self.report_comparison(baseline, results, options)
+
+    def log_result(self, name, result):
+        self.stdout.write(
+            f"{name:24} {result['p50_ms']:>7.2f}ms {result['p95_ms']:>7.2f}ms {result['p99_ms']:>7.2f}ms "
+            f"{result['queries']:>8g} {result['sql_ms']:>7.2f}ms {result['render_ms']:>7.2f}ms "
+            f"{result['peak_memory_kb']:>8.0f}KB"
+        )
+        if any(code >= 400 for code in result['status_codes']):
+            self.stdout.write(self.style.WARNING(f"  {name} returned {result['status_codes']}"))
+
+    def log_logins(self, logins):
+        self.stdout.write(f"{'hasher':24} {'logins/s':>9} {'per cpu':>9} {'failed/s':>9}")
+        for name, result in logins.items():
+            if 'error' in result:
+                self.stdout.write(self.style.WARNING(f"{name:24} {result['error']}"))
+                continue
+            self.stdout.write(f"{name:24} {result['per_second']:>9g} {result['per_cpu_second'] or 0:>9g} "
+                              f"{result['failed_per_second']:>9g}")
+
+    def log_servers(self, servers):
+        self.stdout.write(f"{'endpoint':24} {'wsgi req/s':>11} {'asgi req/s':>11}")
+        for name, result in servers.items():
+            self.stdout.write(f"{name:24} {result['wsgi_per_second']:>11g} {result['asgi_per_second']:>11g}")
+            codes = result['wsgi_status_codes'] + result['asgi_status_codes']
+            if any(code >= 400 for code in codes):
+                self.stdout.write(self.style.WARNING(f'  {name} returned {sorted(set(codes))}'))
+
+    def report_comparison(self, baseline, results, options):
+        _, regressions = benchmarks.compare(baseline, results, options['threshold'])
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+            return
+        for name, metric, old, new, change in regressions:
+            self.stdout.write(self.style.ERROR(f'{name} {metric}: {old:g} -> {new:g} ({change:+.0%})'))
+        if options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} regression(s) against {options["compare"]}')
@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite primary onto the SQLite replica files (SQLITE_REPLICAS), '
+            'standing in for replication when testing read replica routing locally')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep copying every INTERVAL seconds, simulating replication lag')
+
+    def handle(self, *args, **options):
+        primary = settings.DATABASES['default']
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Only SQLite replicas are copied; real replicas are kept in sync by the database')
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured; set SQLITE_REPLICAS')
+        while True:
+            self.sync(primary['NAME'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def sync(self, path):
+        source = sqlite3.connect(path)
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    # The backup API copies a consistent snapshot while the primary stays writable
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f'{alias}: copied')
+        finally:
+            source.close()
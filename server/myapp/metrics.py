@@ -0,0 +1,229 @@
+"""
+Prometheus metrics.
+
+Counters and histograms are kept in memory per process by `registry` and
+written to METRICS_DIR as one JSON file per process at most every
+METRICS_FLUSH_INTERVAL seconds (and at exit). /metrics merges the files of
+every process, so the totals are right with several gunicorn workers;
+clear the directory when the service is redeployed, as with
+prometheus_client's multiprocess mode. Without METRICS_DIR the registry is
+process-local.
+
+Gauges that describe the database (the moderation queue) are computed
+when /metrics is scraped.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .cache import response_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by route name, method and status', None),
+    'http_request_duration_seconds': ('histogram', 'Request latency by route name', LATENCY_BUCKETS),
+    'db_queries_per_request': ('histogram', 'SQL queries per request by route name', QUERY_BUCKETS),
+    'db_query_seconds_total': ('counter', 'Time spent in SQL queries by route name', None),
+    'login_attempts_total': ('counter', 'Login attempts', None),
+    'login_failures_total': ('counter', 'Failed login attempts', None),
+}
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.counters = defaultdict(float)
+        # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.histograms = {}
+        self.file_name = f'{self.pid}-{time.time_ns()}.json'
+        self.last_flush = 0.0
+
+    def check_process(self):
+        # A worker forked from a preloaded master starts with the master's
+        # registry; give it its own numbers and file
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, amount=1, **labels):
+        with self.lock:
+            self.check_process()
+            self.counters[(name, label_key(labels))] += amount
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, label_key(labels))
+        with self.lock:
+            self.check_process()
+            values = self.histograms.setdefault(key, [0] * (len(buckets) + 1) + [0.0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            else:
+                values[len(buckets)] += 1
+            values[-1] += value
+        self.maybe_flush()
+
+    def observe_request(self, route, view, method, status, duration, queries, query_seconds):
+        """
+        Record one request; called by InstrumentationMiddleware.
+
+        `view` is the view class: the API router and the template pages
+        reuse route names such as article-list.
+        """
+        route = route or 'unmatched'
+        view = view or 'unmatched'
+        self.inc('http_requests_total', route=route, view=view, method=method, status=str(status))
+        self.observe('http_request_duration_seconds', duration, route=route, view=view, method=method)
+        self.observe('db_queries_per_request', queries, route=route, view=view)
+        self.inc('db_query_seconds_total', query_seconds, route=route, view=view)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+                'cache': response_cache.stats.snapshot()['endpoints'],
+            }
+
+    # Multi-process store
+
+    @property
+    def directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def maybe_flush(self):
+        if self.directory and time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        directory = self.directory
+        if not directory:
+            return
+        self.last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.file_name)
+        # Write then rename, so a scrape never reads a half-written file
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(path + '.tmp', path)
+
+    def snapshots(self):
+        """This process's live snapshot plus the last flush of every other process"""
+        snapshots = [self.snapshot()]
+        directory = self.directory
+        if directory and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if not name.endswith('.json') or name == self.file_name:
+                    continue
+                try:
+                    with open(os.path.join(directory, name), encoding='utf-8') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return snapshots
+
+
+def merge(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    cache = defaultdict(lambda: {'hits': 0, 'misses': 0})
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[(name, tuple(map(tuple, labels)))] += value
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+        for endpoint, stats in snapshot.get('cache', {}).items():
+            cache[endpoint]['hits'] += stats.get('hits', 0)
+            cache[endpoint]['misses'] += stats.get('misses', 0)
+    return counters, histograms, cache
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels) + '}'
+
+
+def format_number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(gauges=()):
+    """
+    Prometheus text exposition of every process's metrics.
+
+    `gauges` are extra (name, help, value) or (name, help, value, labels)
+    entries computed by the caller; labels is a tuple of (name, value).
+    """
+    counters, histograms, cache = merge(registry.snapshots())
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+        else:
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], values):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else format_number(bound)
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_number(values[-1])}')
+                lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+
+    lines += ['# HELP response_cache_requests_total Response cache lookups by endpoint and result',
+              '# TYPE response_cache_requests_total counter']
+    hits = misses = 0
+    for endpoint, stats in sorted(cache.items()):
+        hits += stats['hits']
+        misses += stats['misses']
+        for result, key in (('hit', 'hits'), ('miss', 'misses')):
+            labels = (('endpoint', endpoint), ('result', result))
+            lines.append(f'response_cache_requests_total{format_labels(labels)} {stats[key]}')
+    lines += ['# HELP response_cache_hit_ratio Share of response cache lookups that were hits',
+              '# TYPE response_cache_hit_ratio gauge',
+              f'response_cache_hit_ratio {format_number(hits / (hits + misses) if hits + misses else 0)}']
+
+    described = set()
+    for name, help_text, value, *labels in gauges:
+        if name not in described:
+            described.add(name)
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        lines.append(f'{name}{format_labels(labels[0] if labels else ())} {format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
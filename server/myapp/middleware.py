@@ -0,0 +1,192 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .instrumentation import RequestMetrics, current_metrics
+from .metrics import registry as metrics_registry
+from .routers import replica_reads
+
+request_logger = logging.getLogger('myapp.requests')
+query_logger = logging.getLogger('myapp.queries')
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+class InstrumentationMiddleware:
+    """
+    Measure every request (see myapp.instrumentation) and report it.
+
+    Adds a Server-Timing header (total, db, serialize, render), logs one
+    JSON line per request to `myapp.requests` and warns on `myapp.queries`
+    when a query shape ran DUPLICATE_QUERY_THRESHOLD or more times in one
+    request. The same numbers feed the /metrics histograms (see
+    myapp.metrics). Put it first in MIDDLEWARE so the total covers the
+    others.
+
+    Sync and async capable, so under ASGI it does not force the async
+    views onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.report(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        self.report(request, response, metrics)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered; the callback runs right after
+        metrics = current_metrics.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+            response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, response, metrics):
+        total = metrics.total_time
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else None
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={milliseconds(metrics.sql_time)};desc="{metrics.sql_count} queries"',
+                f'serialize;dur={milliseconds(metrics.serializer_time)}',
+                f'render;dur={milliseconds(metrics.render_time)}',
+                f'total;dur={milliseconds(total)}',
+            ])
+
+        request_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'total_ms': milliseconds(total),
+            'sql_queries': metrics.sql_count,
+            'sql_ms': milliseconds(metrics.sql_time),
+            'serializer_ms': milliseconds(metrics.serializer_time),
+            'render_ms': milliseconds(metrics.render_time),
+        }))
+
+        view_class = getattr(match.func, 'cls', match.func).__name__ if match else None
+        metrics_registry.observe_request(
+            view, view_class, request.method, response.status_code, total, metrics.sql_count, metrics.sql_time)
+
+        for count, sql in metrics.duplicate_queries(settings.DUPLICATE_QUERY_THRESHOLD):
+            query_logger.warning(json.dumps({
+                'event': 'duplicate_query',
+                'view': view,
+                'path': request.path,
+                'count': count,
+                'sql': sql[:1000],
+            }))
+
+
+def token_user_id(request):
+    """The user id in a valid JWT access token sent with the request, without a query"""
+    header = request.headers.get('Authorization', '').split()
+    if len(header) != 2 or header[0] not in jwt_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return AccessToken(header[1])[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Decide whether this request may read from a replica (see myapp.routers).
+
+    Safe requests may, unless the client wrote within the last
+    REPLICA_STICKY_SECONDS. Requests with a JWT (the React client, which
+    calls the API cross-origin and keeps no cookies) are sticky per user: a
+    successful write stores a short-lived entry under the user id in the
+    REPLICA_STICKY_CACHE_ALIAS cache. Other clients get a cookie marking
+    the window instead.
+    """
+    sync_capable = True
+    async_capable = True
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    key_prefix = 'replica-sticky'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @property
+    def cache(self):
+        return caches[settings.REPLICA_STICKY_CACHE_ALIAS]
+
+    def sticky_key(self, user_id):
+        return f'{self.key_prefix}:{user_id}'
+
+    def allows_replica(self, request):
+        if request.method not in self.safe_methods or settings.REPLICA_STICKY_COOKIE in request.COOKIES:
+            return False
+        if not settings.DATABASE_REPLICAS:
+            return True
+        user_id = token_user_id(request)
+        return user_id is None or self.cache.get(self.sticky_key(user_id)) is None
+
+    def stick(self, request, response):
+        if request.method in self.safe_methods or response.status_code >= 400 or not settings.REPLICA_STICKY_SECONDS:
+            return response
+        user_id = token_user_id(request)
+        if user_id is not None:
+            self.cache.set(self.sticky_key(user_id), 1, timeout=settings.REPLICA_STICKY_SECONDS)
+        else:
+            response.set_cookie(settings.REPLICA_STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica_reads.set(self.allows_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.stick(request, response)
+
+    async def __acall__(self, request):
+        token = replica_reads.set(self.allows_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.stick(request, response)
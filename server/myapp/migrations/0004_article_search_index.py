@@ -0,0 +1,70 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS myapp_article_search USING fts5(
+        title, tags, author, content,
+        tokenize = 'porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    INSERT INTO myapp_article_search (rowid, title, tags, author, content)
+    SELECT a.id, a.title,
+           COALESCE((SELECT group_concat(t.tag_name || ' ' || t.slug, ' ')
+                     FROM myapp_tag t
+                     JOIN myapp_article_tags at ON at.tag_id = t.id
+                     WHERE at.article_id = a.id), ''),
+           u.username, a.content
+    FROM myapp_article a
+    JOIN auth_user u ON u.id = a.author_id
+    """,
+]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE IF NOT EXISTS myapp_article_search (
+        article_id bigint PRIMARY KEY REFERENCES myapp_article (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS myapp_article_search_document_gin ON myapp_article_search USING GIN (document)",
+    """
+    INSERT INTO myapp_article_search (article_id, document)
+    SELECT a.id,
+           setweight(to_tsvector('english', a.title), 'A') ||
+           setweight(to_tsvector('english', COALESCE((
+               SELECT string_agg(t.tag_name || ' ' || t.slug, ' ')
+               FROM myapp_tag t
+               JOIN myapp_article_tags at ON at.tag_id = t.id
+               WHERE at.article_id = a.id), '')), 'B') ||
+           setweight(to_tsvector('english', u.username), 'B') ||
+           setweight(to_tsvector('english', a.content), 'D')
+    FROM myapp_article a
+    JOIN auth_user u ON u.id = a.author_id
+    ON CONFLICT (article_id) DO NOTHING
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS myapp_article_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
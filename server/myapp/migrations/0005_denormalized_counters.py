@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-18 19:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, column):
+    return Coalesce(Subquery(
+        queryset.filter(**{column: OuterRef('pk')}).order_by().values(column).annotate(total=Count('*')).values('total')
+    ), Value(0))
+
+
+def backfill_counters(apps, schema_editor):
+    Article = apps.get_model('myapp', 'Article')
+    Category = apps.get_model('myapp', 'Category')
+    Comment = apps.get_model('myapp', 'Comment')
+    Tag = apps.get_model('myapp', 'Tag')
+
+    Tag.objects.update(article_count=count_of(Article.tags.through.objects.all(), 'tag_id'))
+    Category.objects.update(article_count=count_of(Article.objects.all(), 'category_id'))
+    Article.objects.update(comment_count=count_of(Comment.objects.all(), 'article_id'))
+    Comment.objects.update(reply_count=count_of(Comment.objects.all(), 'parent_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_article_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Comment Count'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='article_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Article Count'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Reply Count'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='article_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False, verbose_name='Article Count'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index auth_user.email for logins by email (see
+    myapp.authentication.check_credentials). auth_user belongs to
+    django.contrib.auth, so the index is created with plain SQL.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('myapp', '0006_comment_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS myapp_auth_user_email_idx ON auth_user (email)',
+            'DROP INDEX IF EXISTS myapp_auth_user_email_idx',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_article_rendered_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='claimed_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Claimed By'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Claimed Until'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='moderated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Moderated At'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='moderated_by',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Moderated By'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_approved', False), ('moderated_at__isnull', True)), fields=['-created_at', '-id'], name='comment_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def recount_replies(apps, schema_editor):
+    Comment = apps.get_model('myapp', 'Comment')
+    # reply_count now counts approved replies only
+    approved = (Comment.objects.filter(parent_id=OuterRef('pk'), is_approved=True)
+                .order_by().values('parent_id').annotate(total=Count('*')).values('total'))
+    Comment.objects.update(reply_count=Coalesce(Subquery(approved), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_comment_moderation_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_replies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+
+def render_articles(apps, schema_editor):
+    # 0010 added content_html and excerpt empty; render what existing articles show
+    # (the same as the render_articles command, which historical models can't run)
+    from myapp import rendering
+
+    Article = apps.get_model('myapp', 'Article')
+    articles = Article.objects.filter(content_html='').order_by('pk').only('pk', 'content')
+    batch = []
+    for article in articles.iterator(chunk_size=BATCH_SIZE):
+        article.content_html = rendering.render_html(article.content)
+        article.excerpt = rendering.excerpt(article.content_html)
+        batch.append(article)
+        if len(batch) >= BATCH_SIZE:
+            Article.objects.bulk_update(batch, ['content_html', 'excerpt'])
+            batch = []
+    if batch:
+        Article.objects.bulk_update(batch, ['content_html', 'excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_recount_approved_replies'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_articles, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,60 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 # Create your models here.
 from django.utils.text import slugify
 
+from . import rendering
+
+
+def unique_slugs(model, bases, fallback='item', reserved=()):
+    """
+    Turn each base slug into one that is not taken yet in `model`.
+
+    Taken slugs, and those in `reserved`, get a -2, -3, ... suffix; repeated
+    bases in the same call get distinct slugs too. Existing slugs are looked
+    up with one query per 200 distinct bases.
+    """
+    max_length = model._meta.get_field('slug').max_length
+    # Leave room for the suffix
+    bases = [(base or fallback)[:max_length - 8].strip('-') or fallback for base in bases]
+    distinct = sorted(set(bases))
+    taken = set(reserved)
+    for start in range(0, len(distinct), 200):
+        condition = Q()
+        for base in distinct[start:start + 200]:
+            condition |= Q(slug=base) | Q(slug__startswith=base + '-')
+        taken.update(model.objects.filter(condition).values_list('slug', flat=True))
+
+    slugs = []
+    for base in bases:
+        slug, suffix = base, 2
+        while slug in taken:
+            slug, suffix = f'{base}-{suffix}', suffix + 1
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+class CounterFieldsMixin:
+    """
+    Keeps save() from overwriting denormalized counters.
+
+    The counters in `counter_fields` are only changed with F() updates (see
+    myapp.counters). A plain save() of an existing row would write back
+    whatever value was loaded earlier and undo concurrent increments, so
+    they are left out of the UPDATE.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and self.counter_fields:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
 
 class UserProfile(models.Model):
     USER_TYPE_CHOICES = (
@@ -15,6 +67,8 @@ class UserProfile(models.Model):
     user_type = models.CharField(max_length=10, choices=USER_TYPE_CHOICES, default='regular')
     bio = models.TextField(max_length=500, blank=True, verbose_name="Bio")
     profile_pic = models.ImageField(upload_to='profile_pics', blank=True, verbose_name="Profile Picture")
+    # Generated from profile_pic in the background (see myapp.thumbnails)
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Thumbnails")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
 
@@ -27,10 +81,12 @@ class UserProfile(models.Model):
         return f'{self.user.username} Profile'
 
 
-class Category(models.Model):
+class Category(CounterFieldsMixin, models.Model):
     name = models.CharField(max_length=100, verbose_name="Category Name")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="Category Slug")
     description = models.TextField(max_length=500, verbose_name="Category Description")
+    article_count = models.PositiveIntegerField(default=0, db_index=True, editable=False, verbose_name="Article Count")
+    counter_fields = ('article_count',)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
 
@@ -48,9 +104,11 @@ class Category(models.Model):
         super(Category, self).save(*args, **kwargs)
 
 
-class Tag(models.Model):
+class Tag(CounterFieldsMixin, models.Model):
     tag_name = models.CharField(max_length=100, verbose_name="Tag Name")
     slug = models.SlugField(max_length=100, unique=True, verbose_name="Tag Slug")
+    article_count = models.PositiveIntegerField(default=0, db_index=True, editable=False, verbose_name="Article Count")
+    counter_fields = ('article_count',)
 
     class Meta:
         verbose_name = 'Tag'
@@ -66,13 +124,18 @@ class Tag(models.Model):
         super(Tag, self).save(*args, **kwargs)
 
 
-class Article(models.Model):
+class Article(CounterFieldsMixin, models.Model):
     title = models.CharField(max_length=200, verbose_name="Article Title")
     slug = models.SlugField(max_length=200, unique=True, verbose_name="Article Slug")
     content = models.TextField(verbose_name="Article Content")
+    # Rendered from content on save (see myapp.rendering)
+    content_html = models.TextField(blank=True, editable=False, verbose_name="Rendered Content")
+    excerpt = models.TextField(blank=True, editable=False, verbose_name="Excerpt")
     author = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Author")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, verbose_name="Category")
     tags = models.ManyToManyField(Tag, verbose_name="Tags")
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Comment Count")
+    counter_fields = ('comment_count',)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
     
@@ -80,28 +143,73 @@ class Article(models.Model):
         verbose_name = 'Article'
         verbose_name_plural = 'Articles'
         ordering = ['-created_at']
+        indexes = [
+            # Backs keyset pagination on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='article_created_id_idx'),
+            # Newest first within a category (?category=) or an author (my_articles)
+            models.Index(fields=['category', '-created_at', '-id'], name='article_category_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='article_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What content_html was rendered from, so save() can tell whether content changed
+        instance._rendered_content = instance.__dict__.get('content')
+        return instance
+
+    def render_content(self):
+        """Fill content_html and excerpt from content"""
+        self.content_html = rendering.render_html(self.content)
+        self.excerpt = rendering.excerpt(self.content_html)
+        self._rendered_content = self.content
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.title)
+            self.slug = unique_slugs(Article, [slugify(self.title)], fallback='article')[0]
+        update_fields = kwargs.get('update_fields')
+        content_loaded = 'content' not in self.get_deferred_fields()
+        if content_loaded and self.content != getattr(self, '_rendered_content', None):
+            self.render_content()
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'content_html', 'excerpt'}
         super(Article, self).save(*args, **kwargs)
 
 
-class Comment(models.Model):
+class Comment(CounterFieldsMixin, models.Model):
     article = models.ForeignKey(Article, on_delete=models.CASCADE, verbose_name="Article", related_name="comments")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="User")   
     content = models.TextField(verbose_name="Comment Content")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies', verbose_name="Parent Comment")
     is_approved = models.BooleanField(default=True, verbose_name="Is Approved")
+    reply_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Reply Count")
+    # Moderation (see myapp.moderation); comments nobody has moderated yet have no moderated_at
+    moderated_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Moderated At")
+    moderated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                     related_name='+', verbose_name="Moderated By")
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, editable=False,
+                                   related_name='+', verbose_name="Claimed By")
+    claimed_until = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Claimed Until")
+    counter_fields = ('reply_count',)
     
     class Meta:
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
         ordering = ['-created_at']
+        indexes = [
+            # Backs keyset pagination on (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='comment_created_id_idx'),
+            # An article's top-level comments (parent IS NULL) newest first
+            models.Index(fields=['article', 'parent', '-created_at', '-id'], name='comment_article_parent_idx'),
+            # The moderation queue; only the unapproved, unmoderated rows are indexed
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_approved=False, moderated_at__isnull=True),
+                         name='comment_pending_idx'),
+        ]
     
     def __str__(self):
         return f'Comment by {self.user.username} on {self.article.title}'
@@ -113,9 +221,4 @@ class Comment(models.Model):
     @property
     def is_reply(self):
         """Check if this comment is a reply to another comment"""
-        return self.parent is not None
-        
-    @property
-    def reply_count(self):
-        """Count the number of replies to this comment"""
-        return self.replies.count()
\ No newline at end of file
+        return self.parent is not None
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Comment moderation queue.
+
+The queue is every unapproved comment nobody has moderated yet. The
+partial index comment_pending_idx holds exactly those rows, newest first,
+so paging through the queue with CommentCursorPagination reads the index
+in order however many comments a spam wave leaves in it. Moderated
+comments record when and by whom in moderated_at/moderated_by and drop out
+of the index.
+
+Several moderators work the queue at once by claiming batches: claim()
+leases up to `count` comments nobody else holds to one moderator for
+MODERATION_LEASE_SECONDS with a single UPDATE. Until a lease runs out, its
+comments are skipped by everyone else's claim(), approve() and reject(),
+so no comment is handled twice, and a moderator who walks away blocks
+nothing for long.
+
+approve() and reject() settle any queryset of comments, a list of ids or
+the queue narrowed by queue_filter(), with one UPDATE. That bypasses
+save() and its signals, so the reply_count of the affected parents (which
+only counts approved replies) is recomputed with one more UPDATE, and the
+cached payloads of the affected articles are invalidated here.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache, counters
+from .models import Comment
+
+
+def pending():
+    """The moderation queue, in the order of comment_pending_idx"""
+    return Comment.objects.filter(is_approved=False, moderated_at__isnull=True).order_by('-created_at', '-id')
+
+
+def available_to(user, now=None):
+    """Comments nobody else holds a live claim on"""
+    now = now or timezone.now()
+    return Q(claimed_by__isnull=True) | Q(claimed_until__lte=now) | Q(claimed_by=user)
+
+
+def queue_filter(article=None, user=None, created_after=None, created_before=None, contains=None):
+    """Q narrowing comments to the given article, author, creation window and text"""
+    q = Q()
+    if article is not None:
+        q &= Q(article_id=article)
+    if user is not None:
+        q &= Q(user_id=user)
+    if created_after is not None:
+        q &= Q(created_at__gte=created_after)
+    if created_before is not None:
+        q &= Q(created_at__lt=created_before)
+    if contains:
+        q &= Q(content__icontains=contains)
+    return q
+
+
+def claim(moderator, count=None, queryset=None):
+    """
+    Lease up to `count` (MODERATION_CLAIM_SIZE) queued comments to `moderator`.
+
+    The moderator's own live claims count as free, so claiming again also
+    renews them. Returns (claimed comments, lease expiry).
+    """
+    now = timezone.now()
+    until = now + timedelta(seconds=settings.MODERATION_LEASE_SECONDS)
+    queue = (pending() if queryset is None else queryset).filter(available_to(moderator, now))
+    batch = queue.values('pk')[:count or settings.MODERATION_CLAIM_SIZE]
+    # The outer condition is checked again as each row is written, so a
+    # concurrent claim that got there first wins the row and this one skips it
+    Comment.objects.filter(available_to(moderator, now), pk__in=batch).update(
+        claimed_by=moderator, claimed_until=until
+    )
+    claimed = Comment.objects.filter(claimed_by=moderator, claimed_until=until).order_by('-created_at', '-id')
+    return claimed, until
+
+
+def release(moderator, queryset=None):
+    """Give up the moderator's claims, all of them or those in `queryset`; returns how many"""
+    queryset = Comment.objects.all() if queryset is None else queryset
+    return queryset.filter(claimed_by=moderator).update(claimed_by=None, claimed_until=None)
+
+
+def moderate(queryset, moderator, approved):
+    """
+    Approve or reject the comments in `queryset` that others hold no claim
+    on, with one UPDATE. Returns how many were moderated.
+    """
+    now = timezone.now()
+    queryset = queryset.filter(available_to(moderator, now)).order_by()
+    with transaction.atomic():
+        affected = set(queryset.values_list('article_id', 'parent_id').distinct())
+        count = queryset.update(
+            is_approved=approved, moderated_at=now, moderated_by=moderator,
+            claimed_by=None, claimed_until=None,
+            # update() skips auto_now
+            updated_at=now,
+        )
+        counters.recount_replies({parent_id for _, parent_id in affected})
+    article_ids = {article_id for article_id, _ in affected}
+    if count:
+        # Article payloads embed comments (see myapp.signals.invalidate_comment_article)
+        cache.invalidate(cache.ARTICLES, *[cache.article_tag(pk) for pk in article_ids])
+    return count
+
+
+def approve(queryset, moderator):
+    return moderate(queryset, moderator, approved=True)
+
+
+def reject(queryset, moderator):
+    return moderate(queryset, moderator, approved=False)
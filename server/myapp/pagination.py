@@ -0,0 +1,189 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor pagination keyed on (created_at, id).
+
+    Every page is fetched with a WHERE on the last seen key instead of an
+    OFFSET, so deep pages cost the same as the first one and rows inserted
+    while a client is paging never shift or duplicate results.
+
+    Also works with plain Django requests; apaginate_queryset() is the
+    async ORM version for async views.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size_setting = 'API_PAGE_SIZE'
+    # Both fields must share the same direction; id breaks ties on created_at
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    @staticmethod
+    def query_params(request):
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        default = getattr(settings, self.page_size_setting, None) or settings.API_PAGE_SIZE
+        try:
+            size = int(self.query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return default
+        if size <= 0:
+            return default
+        return min(size, settings.API_MAX_PAGE_SIZE)
+
+    @property
+    def descending(self):
+        return self.ordering[0].startswith('-')
+
+    def encode_cursor(self, obj, reverse=False):
+        payload = {'c': obj.created_at.isoformat(), 'i': obj.pk}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, separators=(',', ':')).encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = self.query_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            created_at = parse_datetime(payload['c'])
+            pk = int(payload['i'])
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk, reverse
+
+    def keyset_filter(self, created_at, pk, forward):
+        """Rows strictly after (or before) the given key in page order"""
+        if forward == self.descending:
+            return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+    def page_queryset(self, queryset, request):
+        """The rows of the requested page plus one, which tells whether another page exists"""
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor[2])
+
+        if self.reverse:
+            ordering = [field[1:] if field.startswith('-') else '-' + field for field in self.ordering]
+        else:
+            ordering = list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.cursor:
+            created_at, pk, reverse = self.cursor
+            queryset = queryset.filter(self.keyset_filter(created_at, pk, forward=not reverse))
+        return queryset[:self.page_size_value + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size_value
+        results = results[:self.page_size_value]
+        if self.reverse:
+            results.reverse()
+
+        self.page = results
+        self.has_next = has_more if not self.reverse else self.cursor is not None
+        self.has_previous = self.cursor is not None if not self.reverse else has_more
+        return results
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        return self.set_page([obj async for obj in self.page_queryset(queryset, request)])
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_previous_cursor(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def build_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self.build_link(self.get_next_cursor())
+
+    def get_previous_link(self):
+        return self.build_link(self.get_previous_cursor())
+
+    def get_first_link(self):
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+
+class ArticleCursorPagination(KeysetPagination):
+    """ Newest articles first """
+    page_size_setting = 'ARTICLE_PAGE_SIZE'
+
+
+class CommentCursorPagination(KeysetPagination):
+    """ Newest comments first """
+    page_size_setting = 'COMMENT_PAGE_SIZE'
+
+
+class ReplyCursorPagination(KeysetPagination):
+    """ Replies to a comment, oldest first so threads read top to bottom """
+    page_size_setting = 'REPLY_PAGE_SIZE'
+    ordering = ('created_at', 'id')
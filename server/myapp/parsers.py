@@ -0,0 +1,15 @@
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline-delimited JSON request bodies.
+
+    Returns a lazy iterator over the raw lines, so a large upload is read
+    as it is consumed instead of being loaded into memory up front; decoding
+    each line is left to the consumer (see myapp.importer).
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter(stream.readline, b'')
@@ -0,0 +1,119 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import serializers
+
+from .models import Article
+
+
+def _relation(model, name):
+    """Return the relation field called `name` on `model`, or None"""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation else None
+
+
+def _walk(serializer, model, prefix, select, prefetch, in_prefetch):
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        bits = field.source.split('.')
+        relation = _relation(model, bits[0])
+        if relation is None:
+            continue
+        path = prefix + bits[0]
+        many = relation.many_to_many or relation.one_to_many
+
+        if many:
+            prefetch.add(path)
+            if isinstance(field, serializers.ListSerializer):
+                _walk(field.child, relation.related_model, path + '__', select, prefetch, True)
+            continue
+
+        # PrimaryKeyRelatedField only reads the *_id column
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and len(bits) == 1:
+            continue
+
+        (prefetch if in_prefetch else select).add(path)
+        if isinstance(field, serializers.BaseSerializer):
+            _walk(field, relation.related_model, path + '__', select, prefetch, in_prefetch)
+        elif len(bits) > 1:
+            # Dotted sources such as 'category.name' follow one FK per step
+            model_step = relation.related_model
+            for bit in bits[1:]:
+                step = _relation(model_step, bit)
+                if step is None or step.many_to_many or step.one_to_many:
+                    break
+                path = path + '__' + bit
+                (prefetch if in_prefetch else select).add(path)
+                model_step = step.related_model
+
+
+@lru_cache(maxsize=None)
+def related_lookups(serializer_class):
+    """
+    Work out which relations a serializer reads, based on its declared fields.
+
+    Returns a (select_related, prefetch_related) pair of sorted tuples:
+    forward foreign keys are joined, many-valued relations are prefetched.
+    """
+    serializer = serializer_class()
+    select, prefetch = set(), set()
+    _walk(serializer, serializer.Meta.model, '', select, prefetch, False)
+    # A nested path already implies its parents
+    select = {path for path in select if not any(other.startswith(path + '__') for other in select)}
+    return tuple(sorted(select)), tuple(sorted(prefetch))
+
+
+@lru_cache(maxsize=None)
+def unread_text_fields(serializer_class):
+    """
+    Text columns of the serializer's model that none of its fields read.
+
+    Article bodies dominate the row size, so a listing that only shows
+    the excerpt leaves them out of the SELECT.
+    """
+    serializer = serializer_class()
+    sources = set()
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            # Method fields may read anything
+            return ()
+        sources.add(field.source.split('.')[0])
+    return tuple(sorted(
+        field.name for field in serializer.Meta.model._meta.concrete_fields
+        if isinstance(field, models.TextField) and field.name not in sources
+    ))
+
+
+def optimize_queryset(queryset, serializer_class):
+    """ Attach the joins and prefetches `serializer_class` needs to `queryset` """
+    select, prefetch = related_lookups(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    unread = unread_text_fields(serializer_class)
+    if unread:
+        queryset = queryset.defer(*unread)
+    return queryset
+
+
+def article_queryset(serializer_class=None, queryset=None):
+    """
+    Shared queryset builder for every view that returns articles.
+
+    Pass the serializer the view renders with so the related rows it reads
+    are fetched up front instead of once per article.
+    """
+    if serializer_class is None:
+        from .serializers import ArticleSerializer
+        serializer_class = ArticleSerializer
+    if queryset is None:
+        queryset = Article.objects.all()
+    return optimize_queryset(queryset, serializer_class).order_by('-created_at', '-id')
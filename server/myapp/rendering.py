@@ -0,0 +1,36 @@
+"""
+Article content rendering.
+
+Article.content is Markdown. render_html() compiles it to HTML and cleans
+the result with nh3, so raw HTML inside the Markdown cannot smuggle in
+scripts, event handlers or javascript: links. excerpt() is the start of
+the rendered text, without markup, for listings.
+
+Article.save() stores both in content_html and excerpt whenever content
+changes, so no request ever renders Markdown. bulk_create() skips save(),
+so bulk writers call Article.render_content() themselves; the
+render_articles command rebuilds the stored versions of existing rows.
+"""
+import html
+import re
+
+import markdown
+import nh3
+from django.conf import settings
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'sane_lists']
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def render_html(text):
+    """Sanitized HTML for Markdown `text`"""
+    return nh3.clean(markdown.markdown(text or '', extensions=MARKDOWN_EXTENSIONS))
+
+
+def excerpt(content_html, length=None):
+    """The rendered text without markup, shortened to `length` (EXCERPT_LENGTH) characters"""
+    text = WHITESPACE_RE.sub(' ', html.unescape(strip_tags(content_html))).strip()
+    return Truncator(text).chars(length or settings.EXCERPT_LENGTH)
@@ -0,0 +1,65 @@
+"""
+Read replica routing.
+
+Writes always go to `default`, the primary. Reads go to one of the
+DATABASE_REPLICAS only while ReplicaRoutingMiddleware allows it for the
+current request, which is when:
+
+- the request is a GET, HEAD or OPTIONS; a POST/PUT/PATCH/DELETE reads
+  from the primary too, so it validates against current data, and
+- the client has not written in the last REPLICA_STICKY_SECONDS (the
+  middleware remembers each successful write per JWT user, or with a
+  cookie for other clients), so users see their own edits despite
+  replication lag, and
+- no transaction is open on the primary.
+
+Everything outside a request (management commands, seed_db.py, the
+shell) reads from the primary. use_primary() pins a block of code to it;
+the response cache (myapp.cache) builds its entries inside it, so a
+lagging replica never re-caches rows an invalidation has just dropped.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside this block"""
+    token = replica_reads.set(False)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not replica_reads.get():
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            # The transaction's own writes are only visible on the primary
+            return PRIMARY
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,254 @@
+"""
+Full-text search over articles.
+
+Articles are kept in an inverted index that is updated whenever an article,
+its tags or its author change (see myapp.signals). The index lives in the
+database itself:
+
+- SQLite: an FTS5 virtual table using the porter stemmer, ranked with bm25()
+- PostgreSQL: a weighted tsvector column with a GIN index, ranked with ts_rank_cd()
+
+Other databases fall back to unranked icontains matching.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+
+from .models import Article
+
+SEARCH_TABLE = 'myapp_article_search'
+
+# Relative weight of each field; title matches rank highest, then tags and author
+FIELD_WEIGHTS = {'title': 10.0, 'tags': 6.0, 'author': 6.0, 'content': 1.0}
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+
+def article_documents(articles):
+    """Yield (id, title, tags, author, content) tuples for `articles`"""
+    for article in articles:
+        tags = ' '.join(f'{tag.tag_name} {tag.slug}' for tag in article.tags.all())
+        yield (article.pk, article.title, tags, article.author.username, article.content)
+
+
+def documents_queryset(article_ids=None, using='default'):
+    queryset = Article.objects.using(using).select_related('author').prefetch_related('tags').order_by('pk')
+    if article_ids is not None:
+        queryset = queryset.filter(pk__in=article_ids)
+    return queryset
+
+
+class BaseSearchBackend:
+    """Interface shared by the search backends"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, article_ids):
+        """(Re)index the given articles"""
+        article_ids = list(article_ids)
+        if article_ids:
+            documents = article_documents(documents_queryset(article_ids, self.connection.alias))
+            self.write(documents, replace=article_ids)
+
+    def remove(self, article_ids):
+        raise NotImplementedError
+
+    def write(self, documents, replace=None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        """Return up to `limit` article ids, most relevant first"""
+        raise NotImplementedError
+
+    def rebuild(self, chunk_size=1000):
+        """Drop every entry and index all articles again; returns the count"""
+        total = 0
+        batch = []
+        # One transaction so searches never see a half-built index
+        with transaction.atomic(using=self.connection.alias):
+            self.clear()
+            articles = documents_queryset(using=self.connection.alias).iterator(chunk_size=chunk_size)
+            for document in article_documents(articles):
+                batch.append(document)
+                if len(batch) >= chunk_size:
+                    self.write(batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                self.write(batch)
+                total += len(batch)
+        return total
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 virtual table keyed by article id (the table's rowid)"""
+
+    def remove(self, article_ids):
+        article_ids = list(article_ids)
+        if not article_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(article_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})', article_ids)
+
+    def write(self, documents, replace=None):
+        documents = list(documents)
+        self.remove(replace if replace is not None else [doc[0] for doc in documents])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, title, tags, author, content) VALUES (%s, %s, %s, %s, %s)',
+                documents,
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def match_expression(self, tokens):
+        # Quote every token so user input can't inject FTS5 syntax; the last
+        # one is a prefix match so results update while the user types
+        terms = ['"%s"' % token.replace('"', '""') for token in tokens]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        weights = ', '.join(str(FIELD_WEIGHTS[field]) for field in ('title', 'tags', 'author', 'content'))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s',
+                [self.match_expression(tokens), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector per article, GIN indexed"""
+
+    # tsvector weight classes, in FIELD_WEIGHTS order
+    DOCUMENT_SQL = (
+        "setweight(to_tsvector(%(config)s, %(title)s), 'A') || "
+        "setweight(to_tsvector(%(config)s, %(tags)s), 'B') || "
+        "setweight(to_tsvector(%(config)s, %(author)s), 'B') || "
+        "setweight(to_tsvector(%(config)s, %(content)s), 'D')"
+    )
+
+    @property
+    def config(self):
+        return getattr(settings, 'SEARCH_CONFIG', 'english')
+
+    def remove(self, article_ids):
+        article_ids = list(article_ids)
+        if article_ids:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE article_id = ANY(%s)', [article_ids])
+
+    def write(self, documents, replace=None):
+        rows = [
+            {'id': pk, 'config': self.config, 'title': title, 'tags': tags, 'author': author, 'content': content}
+            for pk, title, tags, author, content in documents
+        ]
+        if not rows:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (article_id, document) '
+                f'VALUES (%(id)s, {self.DOCUMENT_SQL}) '
+                f'ON CONFLICT (article_id) DO UPDATE SET document = EXCLUDED.document',
+                rows,
+            )
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        tokens[-1] += ':*'
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT article_id FROM {SEARCH_TABLE}, to_tsquery(%s, %s) query '
+                f'WHERE document @@ query ORDER BY ts_rank_cd(document, query) DESC, article_id DESC LIMIT %s',
+                [self.config, ' & '.join(tokens), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackSearchBackend(BaseSearchBackend):
+    """Unindexed icontains matching for databases without full-text support"""
+
+    def index(self, article_ids):
+        pass
+
+    def remove(self, article_ids):
+        pass
+
+    def write(self, documents, replace=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, chunk_size=1000):
+        return 0
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        condition = Q()
+        for token in tokens:
+            condition &= (
+                Q(title__icontains=token) |
+                Q(content__icontains=token) |
+                Q(author__username__icontains=token) |
+                Q(tags__tag_name__icontains=token)
+            )
+        queryset = Article.objects.filter(condition).distinct().order_by('-created_at', '-id')
+        return list(queryset.values_list('pk', flat=True)[:limit])
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(using='default'):
+    connection = connections[using]
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)(connection)
+
+
+def search_articles(query, limit=None, queryset=None):
+    """
+    Return the articles matching `query` as a list, most relevant first.
+
+    `queryset` can be used to add select_related/prefetch_related or extra
+    filters to the final lookup.
+    """
+    if limit is None:
+        limit = settings.SEARCH_RESULT_LIMIT
+    # A negative LIMIT means no limit on SQLite and is an error on PostgreSQL
+    limit = max(1, min(limit, settings.SEARCH_RESULT_LIMIT))
+    article_ids = get_backend().search(query, limit)
+    if not article_ids:
+        return []
+    if queryset is None:
+        queryset = Article.objects.all()
+    articles = queryset.filter(pk__in=article_ids).in_bulk()
+    return [articles[pk] for pk in article_ids if pk in articles]
@@ -1,34 +1,60 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import UserProfile, Category, Tag, Article, Comment
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import ClaimsRefreshToken, check_credentials
 
+from .instrumentation import TimedSerializerMixin
+from . import thumbnails
+
+
+class ThumbnailsField(serializers.Field):
+    """
+    URLs of a UserProfile.thumbnails value: {size: {format: url}}, or just
+    {format: url} for one `size`. Null until the thumbnails are generated.
+    """
+
+    def __init__(self, size=None, **kwargs):
+        kwargs['read_only'] = True
+        self.size = size
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        urls = thumbnails.urls(value, self.context.get('request'))
+        if self.size is not None:
+            return urls.get(self.size)
+        return urls or None
+
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    avatar = ThumbnailsField(source='userprofile.thumbnails', size=settings.AVATAR_THUMBNAIL_SIZE)
 
-class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email')
+        fields = ('id', 'username', 'email', 'avatar')
         read_only_fields = ['id']
 
-class UserBasicSerializer(serializers.ModelSerializer):
+class UserBasicSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Simple User serializer for nested representations"""
+    avatar = ThumbnailsField(source='userprofile.thumbnails', size=settings.AVATAR_THUMBNAIL_SIZE)
+
     class Meta:
         model = User
-        fields = ['id', 'username']
+        fields = ['id', 'username', 'avatar']
         
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    thumbnails = ThumbnailsField()
     
     class Meta:
         model = UserProfile
-        fields = ('id', 'user', 'user_type', 'bio', 'profile_pic', 'created_at', 'updated_at')
+        fields = ('id', 'user', 'user_type', 'bio', 'profile_pic', 'thumbnails', 'created_at', 'updated_at')
         read_only_fields = ['id', 'created_at', 'updated_at']
 
 
-class RegisterSerializer(serializers.ModelSerializer):
+class RegisterSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -71,20 +97,8 @@ class LoginSerializer(serializers.Serializer):
                 'password': ['Password is required']
             })
         
-        # Try to authenticate with username if provided
-        user = None
-        if username:
-            user = authenticate(username=username, password=password)
-        
-        # If username authentication failed or wasn't provided, try with email
-        if not user and email:
-            try:
-                # Find the user with this email
-                user_obj = User.objects.get(email=email)
-                # Try to authenticate with the username
-                user = authenticate(username=user_obj.username, password=password)
-            except User.DoesNotExist:
-                pass
+        # One query for the username or email, one password hash
+        user = check_credentials(password, username=username, email=email, request=self.context.get('request'))
         
         if not user:
             raise serializers.ValidationError({
@@ -92,31 +106,32 @@ class LoginSerializer(serializers.Serializer):
             })
         
         # Use JWT token instead of auth token
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         
         data['token'] = str(refresh.access_token)
+        data['refresh'] = str(refresh)
         data['user_id'] = user.id
         data['email'] = user.email
         data['user'] = user
         
         return data
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for tags """
     class Meta:
         model = Tag
-        fields = ('id', 'tag_name', 'slug')
-        read_only_fields = ('slug',)
+        fields = ('id', 'tag_name', 'slug', 'article_count')
+        read_only_fields = ('slug', 'article_count')
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """ Serializer for categories """
     class Meta:
         model = Category
-        fields = ('id', 'name', 'description', 'slug')
-        read_only_fields = ('slug',)
+        fields = ('id', 'name', 'description', 'slug', 'article_count')
+        read_only_fields = ('slug', 'article_count')
 
 
-class ArticleSerializer(serializers.ModelSerializer):
+class ArticleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """" Serializer for articles """
     author = UserSerializer(read_only=True)
     category_name=serializers.ReadOnlyField(source='category.name')
@@ -125,8 +140,9 @@ class ArticleSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Article
-        fields = ('id', 'title', 'content', 'author', 'category', 'category_name', 'tags', 'created_at', 'updated_at')
-        read_only_fields = ('created_at', 'updated_at')
+        fields = ('id', 'title', 'content', 'content_html', 'excerpt', 'author', 'category', 'category_name', 'tags',
+                  'comment_count', 'created_at', 'updated_at')
+        read_only_fields = ('content_html', 'excerpt', 'comment_count', 'created_at', 'updated_at')
 
     def create(self, validated_data):
         """Handle the creation of an article with tags"""
@@ -156,12 +172,54 @@ class ArticleSerializer(serializers.ModelSerializer):
         return instance
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Lets clients pick the fields they need with ?fields=id,title,...
+
+    Names that are not fields are ignored; without the parameter, or when
+    none of the names match, every field is returned.
+    """
+    fields_query_param = 'fields'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None:
+            return fields
+        # DRF requests, or plain Django ones from the async views
+        query = getattr(request, 'query_params', request.GET)
+        requested = {name.strip() for name in query.get(self.fields_query_param, '').split(',')}
+        if requested & set(fields):
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+
+class ArticleListSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Compact read-only representation for article listings.
+
+    The excerpt instead of the content, and the author, category and tags
+    as ids/slugs instead of nested objects, plus the author and category
+    names listings display. The full article is at its detail endpoint.
+    """
+    author_username = serializers.ReadOnlyField(source='author.username')
+    category = serializers.SlugRelatedField(slug_field='slug', read_only=True)
+    category_name = serializers.ReadOnlyField(source='category.name')
+    tags = serializers.SlugRelatedField(slug_field='slug', many=True, read_only=True)
+
+    class Meta:
+        model = Article
+        fields = ('id', 'title', 'slug', 'excerpt', 'author', 'author_username', 'category', 'category_name',
+                  'tags', 'comment_count', 'created_at')
+        read_only_fields = fields
+
+
+class CommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for the Comment model"""
     user = UserBasicSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
     is_reply = serializers.ReadOnlyField()
-    reply_count = serializers.ReadOnlyField()
+    reply_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
@@ -171,9 +229,21 @@ class CommentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'is_approved']
     
+    def get_reply_count(self, obj):
+        """Use the count computed by CommentTree when available"""
+        if hasattr(obj, 'tree_reply_count'):
+            return obj.tree_reply_count
+        return obj.reply_count
+
     def get_replies(self, obj):
         """Get approved replies for a comment, sorted by creation date"""
-        if self.context.get('include_replies', True) and hasattr(obj, 'replies'):
+        if not self.context.get('include_replies', True):
+            return []
+        if hasattr(obj, 'tree_children'):
+            # Comment loaded through CommentTree: replies are already in memory
+            replies = [reply for reply in obj.tree_children if reply.is_approved]
+            return CommentSerializer(replies, many=True, context=self.context).data
+        if hasattr(obj, 'replies'):
             replies = obj.replies.filter(is_approved=True).order_by('created_at')
             # Pass context with include_replies=False to prevent infinite recursion
             serializer = CommentSerializer(
@@ -204,7 +274,7 @@ class CommentSerializer(serializers.ModelSerializer):
         return Comment.objects.create(**validated_data)
 
 
-class CommentCreateSerializer(serializers.ModelSerializer):
+class CommentCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for creating a comment with minimal fields"""
     class Meta:
         model = Comment
@@ -213,4 +283,54 @@ class CommentCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         """Create a new comment and set the current user"""
         user = self.context['request'].user
-        return Comment.objects.create(user=user, **validated_data)
\ No newline at end of file
+        return Comment.objects.create(user=user, **validated_data)
+
+class ModerationCommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """A comment in the moderation queue (see myapp.moderation), without replies"""
+    user = UserBasicSerializer(read_only=True)
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'article', 'parent', 'user', 'content', 'created_at', 'claimed_by', 'claimed_until']
+        read_only_fields = fields
+
+
+class ModerationFilterSerializer(serializers.Serializer):
+    """Narrows the moderation queue; the arguments of moderation.queue_filter()"""
+    article = serializers.IntegerField(required=False)
+    user = serializers.IntegerField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+    contains = serializers.CharField(required=False, max_length=200)
+
+
+class ModerationClaimSerializer(serializers.Serializer):
+    """How many queued comments to claim, optionally from part of the queue"""
+    count = serializers.IntegerField(required=False, min_value=1)
+    filters = ModerationFilterSerializer(required=False)
+
+    def validate_count(self, value):
+        return min(value, settings.API_MAX_PAGE_SIZE)
+
+
+class ModerationReleaseSerializer(serializers.Serializer):
+    """The claimed comments to give up; without `ids`, all of them"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+    def validate_ids(self, value):
+        if len(value) > settings.MODERATION_MAX_IDS:
+            raise serializers.ValidationError(f"At most {settings.MODERATION_MAX_IDS} ids per request")
+        return value
+
+
+class ModerationActionSerializer(ModerationReleaseSerializer):
+    """
+    The comments a bulk approve/reject applies to: a list of `ids`, or
+    `filters` selecting from the queue ({} for all of it)
+    """
+    filters = ModerationFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filters' in attrs):
+            raise serializers.ValidationError("Send either ids or filters")
+        return attrs
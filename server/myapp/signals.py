@@ -0,0 +1,242 @@
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Article, Category, Comment, Tag, UserProfile
+from . import authentication, cache, counters, instrumentation, search, thumbnails
+
+
+# Denormalized counters (see myapp.counters)
+
+@receiver(pre_save, sender=Article)
+def remember_article_category(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and 'category' not in update_fields:
+        return
+    instance._previous_category_id = (
+        Article.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Article)
+def count_article_category(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.adjust(Category, 'article_count', 1, pk=instance.category_id)
+        return
+    previous = instance.__dict__.pop('_previous_category_id', None)
+    if previous is not None and previous != instance.category_id:
+        counters.adjust(Category, 'article_count', -1, pk=previous)
+        counters.adjust(Category, 'article_count', 1, pk=instance.category_id)
+
+
+@receiver(pre_delete, sender=Article)
+def uncount_article_tags(sender, instance, **kwargs):
+    # The through rows are removed by the cascade, which sends no m2m_changed
+    counters.adjust_tags(instance.tags.values_list('pk', flat=True), -1)
+
+
+@receiver(post_delete, sender=Article)
+def uncount_article_category(sender, instance, **kwargs):
+    counters.adjust(Category, 'article_count', -1, pk=instance.category_id)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_parents(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and not {'article', 'parent', 'is_approved'} & set(update_fields):
+        return
+    instance._previous_parents = (
+        Comment.objects.filter(pk=instance.pk).values_list('article_id', 'parent_id', 'is_approved').first()
+    )
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.adjust(Article, 'comment_count', 1, pk=instance.article_id)
+        # reply_count only counts the replies /replies/ lists: approved ones
+        if instance.parent_id and instance.is_approved:
+            counters.adjust(Comment, 'reply_count', 1, pk=instance.parent_id)
+        return
+    previous = instance.__dict__.pop('_previous_parents', None)
+    if previous is None:
+        return
+    article_id, parent_id, was_approved = previous
+    if article_id != instance.article_id:
+        counters.adjust(Article, 'comment_count', -1, pk=article_id)
+        counters.adjust(Article, 'comment_count', 1, pk=instance.article_id)
+    if (parent_id, was_approved) != (instance.parent_id, instance.is_approved):
+        if parent_id and was_approved:
+            counters.adjust(Comment, 'reply_count', -1, pk=parent_id)
+        if instance.parent_id and instance.is_approved:
+            counters.adjust(Comment, 'reply_count', 1, pk=instance.parent_id)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.adjust(Article, 'comment_count', -1, pk=instance.article_id)
+    if instance.parent_id and instance.is_approved:
+        counters.adjust(Comment, 'reply_count', -1, pk=instance.parent_id)
+
+
+# Article tags: counters and search index
+
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # clear() reports no pk_set; remember what is about to be removed
+        related = instance.article_set if reverse else instance.tags
+        instance._cleared_pks = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_pks', set())
+        delta = -1
+    elif action in ('post_add', 'post_remove'):
+        delta = 1 if action == 'post_add' else -1
+    else:
+        return
+    if not pk_set:
+        return
+
+    # Tags are part of the article, so mark it as modified (the article_body fragment is keyed on it)
+    touched = pk_set if reverse else [instance.pk]
+    Article.objects.filter(pk__in=touched).update(updated_at=timezone.now())
+
+    if reverse:
+        # tag.article_set.add()/remove()/clear(): one tag, several articles
+        counters.adjust(Tag, 'article_count', delta * len(pk_set), pk=instance.pk)
+        search.get_backend().index(pk_set)
+        cache.invalidate(cache.ARTICLES, cache.TAGS, cache.tag_tag(instance.slug),
+                         *[cache.article_tag(pk) for pk in pk_set])
+    else:
+        counters.adjust_tags(pk_set, delta)
+        search.get_backend().index([instance.pk])
+        slugs = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+        cache.invalidate(cache.ARTICLES, cache.TAGS, cache.article_tag(instance.pk),
+                         *[cache.tag_tag(slug) for slug in slugs])
+
+
+# Search index maintenance
+
+@receiver(post_save, sender=Article)
+def index_article(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.get_backend().index([instance.pk])
+
+
+@receiver(post_delete, sender=Article)
+def unindex_article(sender, instance, **kwargs):
+    search.get_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+def reindex_tag_articles(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        search.get_backend().index(instance.article_set.values_list('pk', flat=True))
+        # A renamed tag changes every article showing it
+        instance.article_set.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def reindex_author_articles(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    search.get_backend().index(Article.objects.filter(author=instance).values_list('pk', flat=True))
+
+
+# Response cache invalidation (see myapp.cache)
+
+@receiver(post_save, sender=Article)
+def invalidate_article(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    slugs = instance.tags.values_list('slug', flat=True)
+    cache.invalidate(
+        cache.ARTICLES, cache.CATEGORIES, cache.article_tag(instance.pk),
+        cache.category_tag(instance.category_id), *[cache.tag_tag(slug) for slug in slugs]
+    )
+
+
+@receiver(pre_delete, sender=Article)
+def invalidate_deleted_article(sender, instance, **kwargs):
+    # Before the cascade removes the tag rows
+    slugs = instance.tags.values_list('slug', flat=True)
+    cache.invalidate(
+        cache.ARTICLES, cache.CATEGORIES, cache.TAGS, cache.article_tag(instance.pk),
+        cache.category_tag(instance.category_id), *[cache.tag_tag(slug) for slug in slugs]
+    )
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment_article(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Article payloads embed comments and comment_count
+        cache.invalidate(cache.ARTICLES, cache.article_tag(instance.article_id))
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.invalidate(cache.TAGS, cache.ARTICLES, cache.tag_tag(instance.slug))
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.invalidate(cache.CATEGORIES, cache.ARTICLES, cache.category_tag(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins only touch last_login, which no cached payload includes
+    if raw or update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    cache.invalidate(cache.USERS, cache.user_tag(instance.pk))
+
+
+# JWT status cache (see myapp.authentication)
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_status(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    authentication.forget_status(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def forget_profile_status(sender, instance, **kwargs):
+    authentication.forget_status(instance.user_id)
+
+
+# Profile picture thumbnails (see myapp.thumbnails)
+
+@receiver(post_save, sender=UserProfile)
+def generate_profile_thumbnails(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or update_fields is not None and 'profile_pic' not in update_fields:
+        return
+    # A save with stale thumbnails from before the worker finished just schedules them again
+    if instance.profile_pic.name == instance.thumbnails.get('source'):
+        return
+    if instance.profile_pic:
+        thumbnails.schedule(instance)
+    elif instance.thumbnails:
+        instance.thumbnails = {}
+        UserProfile.objects.filter(pk=instance.pk).update(thumbnails={})
+
+
+# Request instrumentation (see myapp.instrumentation)
+
+@receiver(connection_created)
+def hook_query_metrics(sender, connection, **kwargs):
+    instrumentation.install_query_hook(connection)
@@ -0,0 +1,286 @@
+"""
+Synthetic data for load testing.
+
+SyntheticDataGenerator builds a dataset of any size: users, categories,
+tags, articles and threaded comments. Assignments follow a Zipf
+distribution, so a few categories and tags hold most of the articles and
+a few articles draw most of the comments, much like real traffic. Rows are
+written with bulk_create() in chunks, and every user shares one password
+hash computed up front. Apart from timestamps, which are relative to the
+time of the run, a given --articles/--seed pair produces the same data on
+an empty database.
+
+bulk_create() skips the signal handlers, so counters are reconciled, the
+search index is rebuilt and the response cache is invalidated once at the
+end (see run()).
+"""
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import cache
+from .counters import reconcile
+from .models import Article, Category, Comment, Tag, UserProfile
+from .search import get_backend as get_search_backend
+
+WORDS = (
+    'django python api cache query index database server client request response model view '
+    'template serializer token user article comment tag category search stream batch latency '
+    'throughput memory cursor page thread reply travel food health business design mobile '
+    'review tutorial tips market growth design pattern deploy docker cloud test bench profile '
+    'fast slow scale shard replica write read lock queue worker task signal event metric trace '
+    'log error retry timeout network packet socket async await loop future promise render layout'
+).split()
+
+# Tags per article and how likely each count is
+TAG_COUNTS = (0, 1, 2, 3, 4, 5)
+TAG_COUNT_WEIGHTS = (5, 20, 30, 25, 12, 8)
+
+USER_TYPES = ('regular', 'author', 'admin')
+USER_TYPE_WEIGHTS = (75, 24, 1)
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative weights for random.choices() giving rank r a 1/r**exponent share"""
+    return list(accumulate(1 / rank ** exponent for rank in range(1, n + 1)))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Let bulk_create() keep the created_at/updated_at values set on the objects.
+
+    auto_now/auto_now_add are switched off on the model fields for the
+    duration, which affects the whole process; only use this in scripts.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class SyntheticDataGenerator:
+    """
+    Generate `articles` articles plus proportional users, categories, tags
+    and comments.
+
+    Sizes left as None scale with `articles`. `comments_per_article` is a
+    mean; the actual count per article is heavy-tailed.
+    """
+
+    def __init__(self, articles=1000, users=None, categories=None, tags=None,
+                 comments_per_article=4.0, max_depth=6, seed=0, chunk_size=2000,
+                 days=3 * 365, zipf_exponent=1.1, password='Synthetic123!', log=print):
+        self.articles = articles
+        self.users = users or max(10, articles // 20)
+        self.categories = categories or max(5, int(articles ** 0.5 / 4))
+        self.tags = tags or max(8, int(articles ** 0.5))
+        self.comments_per_article = comments_per_article
+        self.max_depth = max_depth
+        self.chunk_size = chunk_size
+        self.days = days
+        self.zipf_exponent = zipf_exponent
+        self.password = password
+        self.log = log
+        self.rng = random.Random(seed)
+        self.now = timezone.now().replace(microsecond=0)
+        self.stats = {'users': 0, 'categories': 0, 'tags': 0, 'articles': 0, 'article_tags': 0, 'comments': 0}
+
+    # Text
+
+    def words(self, count):
+        return ' '.join(self.rng.choices(WORDS, k=count))
+
+    def build_text_pools(self):
+        self.paragraphs = [self.words(self.rng.randint(40, 120)).capitalize() + '.' for _ in range(300)]
+        self.sentences = [self.words(self.rng.randint(4, 25)).capitalize() + '.' for _ in range(500)]
+
+    def title(self):
+        return self.words(self.rng.randint(3, 9)).title()
+
+    def article_content(self):
+        return '\n\n'.join(self.rng.sample(self.paragraphs, self.rng.randint(1, 6)))
+
+    def comment_content(self):
+        return ' '.join(self.rng.sample(self.sentences, self.rng.randint(1, 3)))
+
+    # Rows
+
+    def create_users(self):
+        offset = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        # Hashing is deliberately slow; every synthetic user shares one hash
+        password = make_password(self.password)
+        user_ids = []
+        for start in range(0, self.users, self.chunk_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'user{offset + i}', email=f'user{offset + i}@example.com',
+                         password=password, date_joined=self.now)
+                    for i in range(start, min(start + self.chunk_size, self.users))
+                ])
+                UserProfile.objects.bulk_create([
+                    UserProfile(user=user, user_type=self.rng.choices(USER_TYPES, USER_TYPE_WEIGHTS)[0])
+                    for user in users
+                ])
+            user_ids.extend(user.pk for user in users)
+        self.stats['users'] = len(user_ids)
+        return user_ids
+
+    def create_categories(self):
+        offset = (Category.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        categories = Category.objects.bulk_create([
+            Category(name=f'{self.words(2).title()} {offset + i}', slug=f'category-{offset + i}',
+                     description=self.words(12), created_at=self.now, updated_at=self.now)
+            for i in range(self.categories)
+        ], batch_size=self.chunk_size)
+        self.stats['categories'] = len(categories)
+        return [category.pk for category in categories]
+
+    def create_tags(self):
+        offset = (Tag.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        tags = Tag.objects.bulk_create([
+            Tag(tag_name=f'{self.words(1).title()} {offset + i}', slug=f'tag-{offset + i}')
+            for i in range(self.tags)
+        ], batch_size=self.chunk_size)
+        self.stats['tags'] = len(tags)
+        return [tag.pk for tag in tags]
+
+    def pick_tags(self, tag_ids, tag_weights):
+        count = min(self.rng.choices(TAG_COUNTS, TAG_COUNT_WEIGHTS)[0], len(tag_ids))
+        picked = set()
+        while len(picked) < count:
+            picked.add(self.rng.choices(tag_ids, cum_weights=tag_weights)[0])
+        return picked
+
+    def comment_count(self):
+        # Pareto(2) minus one has mean 1: most articles get a few comments, some get hundreds
+        return min(int((self.rng.paretovariate(2) - 1) * self.comments_per_article), 1000)
+
+    def comment_thread(self, article):
+        """
+        (parent index, depth, created_at) for each comment of `article`.
+
+        New comments mostly reply to recent ones, which makes deep threads.
+        """
+        comments = []
+        created_at = article.created_at
+        for _ in range(self.comment_count()):
+            created_at = min(created_at + timedelta(minutes=self.rng.expovariate(1 / 240)), self.now)
+            parent, depth = None, 0
+            if comments and self.rng.random() > 0.35:
+                candidate = len(comments) - 1 - min(int(self.rng.expovariate(0.5)), len(comments) - 1)
+                if comments[candidate][1] < self.max_depth:
+                    parent, depth = candidate, comments[candidate][1] + 1
+            comments.append((parent, depth, created_at))
+        return comments
+
+    def create_article_chunk(self, start, stop, offset, user_ids, category_ids, category_weights,
+                             tag_ids, tag_weights, user_weights):
+        span = timedelta(days=self.days).total_seconds()
+        first = self.now - timedelta(days=self.days)
+        articles = []
+        for i in range(start, stop):
+            title = self.title()
+            # Spread publication times over `days`, oldest first, so ids follow created_at
+            created_at = first + timedelta(seconds=span * (i + self.rng.random()) / self.articles)
+            articles.append(Article(
+                title=title,
+                slug=f'{slugify(title)[:180]}-{offset + i}',
+                content=self.article_content(),
+                author_id=self.rng.choices(user_ids, cum_weights=user_weights)[0],
+                category_id=self.rng.choices(category_ids, cum_weights=category_weights)[0],
+                created_at=created_at,
+                updated_at=created_at,
+            ))
+        for article in articles:
+            article.render_content()
+        Article.objects.bulk_create(articles)
+
+        through = Article.tags.through
+        links = [
+            through(article_id=article.pk, tag_id=tag_id)
+            for article in articles for tag_id in self.pick_tags(tag_ids, tag_weights)
+        ]
+        through.objects.bulk_create(links, batch_size=self.chunk_size)
+
+        # Comments are inserted one thread depth at a time so parents have ids
+        levels = {}
+        for article in articles:
+            created = []
+            for parent, depth, created_at in self.comment_thread(article):
+                comment = Comment(
+                    article_id=article.pk,
+                    user_id=self.rng.choices(user_ids, cum_weights=user_weights)[0],
+                    content=self.comment_content(),
+                    is_approved=self.rng.random() > 0.05,
+                    created_at=created_at,
+                    updated_at=created_at,
+                )
+                levels.setdefault(depth, []).append((comment, created[parent] if parent is not None else None))
+                created.append(comment)
+        comment_total = 0
+        for depth in sorted(levels):
+            comments = []
+            for comment, parent in levels[depth]:
+                comment.parent_id = parent.pk if parent is not None else None
+                comments.append(comment)
+            Comment.objects.bulk_create(comments, batch_size=self.chunk_size)
+            comment_total += len(comments)
+
+        self.stats['articles'] += len(articles)
+        self.stats['article_tags'] += len(links)
+        self.stats['comments'] += comment_total
+
+    def create_articles(self, user_ids, category_ids, tag_ids):
+        # Shuffle so the popular ranks are not simply the lowest ids
+        for ids in (user_ids, category_ids, tag_ids):
+            self.rng.shuffle(ids)
+        user_weights = zipf_cum_weights(len(user_ids), self.zipf_exponent)
+        category_weights = zipf_cum_weights(len(category_ids), self.zipf_exponent)
+        tag_weights = zipf_cum_weights(len(tag_ids), self.zipf_exponent)
+        offset = (Article.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+        for start in range(0, self.articles, self.chunk_size):
+            stop = min(start + self.chunk_size, self.articles)
+            with transaction.atomic():
+                self.create_article_chunk(start, stop, offset, user_ids, category_ids, category_weights,
+                                          tag_ids, tag_weights, user_weights)
+            self.log(f'  {stop}/{self.articles} articles, {self.stats["comments"]} comments')
+
+    def run(self):
+        """Generate everything and bring derived data up to date; returns row counts"""
+        self.build_text_pools()
+        with explicit_timestamps(Category, Article, Comment):
+            user_ids = self.create_users()
+            category_ids = self.create_categories()
+            tag_ids = self.create_tags()
+            self.log(f'Created {len(user_ids)} users, {len(category_ids)} categories, {len(tag_ids)} tags')
+            self.create_articles(user_ids, category_ids, tag_ids)
+
+        self.log('Reconciling counters')
+        reconcile()
+        self.log('Rebuilding the search index')
+        get_search_backend().rebuild(chunk_size=self.chunk_size)
+        cache.invalidate(cache.ARTICLES, cache.CATEGORIES, cache.TAGS, cache.USERS)
+        return self.stats
+
+
+def generate(articles, seed=0, **options):
+    """Shortcut for SyntheticDataGenerator(articles, seed=seed, ...).run()"""
+    return SyntheticDataGenerator(articles, seed=seed, **options).run()
@@ -0,0 +1,51 @@
+"""
+Versions for the template fragment cache.
+
+The templates cache their expensive blocks with Django's {% cache %} tag,
+keyed on whatever the block shows, so an entry is never served after its
+content changed:
+
+- a single row's block varies on the row's updated_at and the related
+  names it prints,
+- blocks listing many rows (the category sidebar, popular tags, comment
+  threads) vary on {% cache_version %}, the response cache versions of
+  the tags they depend on (see myapp.cache). The signal handlers already
+  give those tags a new version whenever a row, or a counter shown next
+  to it, changes.
+
+FRAGMENT_CACHE_TIMEOUT bounds how long an entry lives; 0 disables the
+fragment cache.
+"""
+from django import template
+from django.contrib.auth.models import User
+
+from .. import cache
+from ..cache import response_cache
+from ..models import Article, Category, Tag
+
+register = template.Library()
+
+
+def cache_tag(value):
+    """The response cache tag for a model instance; strings are tags already"""
+    if isinstance(value, Article):
+        return cache.article_tag(value.pk)
+    if isinstance(value, Tag):
+        return cache.tag_tag(value.slug)
+    if isinstance(value, Category):
+        return cache.category_tag(value.pk)
+    if isinstance(value, User):
+        return cache.user_tag(value.pk)
+    return str(value)
+
+
+@register.simple_tag
+def cache_version(*values):
+    """
+    One string combining the current versions of the given cache tags,
+    e.g. {% cache_version 'categories' as version %} or
+    {% cache_version article 'users' as version %}
+    """
+    tags = [cache_tag(value) for value in values]
+    versions = response_cache.current_versions(set(tags), create=True)
+    return '-'.join(str(versions[tag]) for tag in tags)
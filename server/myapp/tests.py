@@ -1,3 +1,1439 @@
-from django.test import TestCase
+import copy
+import csv
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import authentication, metrics, moderation, rendering, thumbnails
+from .benchmarks import BenchmarkRunner, compare as compare_benchmarks, server_timing
+from .cache import response_cache
+from .comment_tree import CommentTree
+from .counters import reconcile
+from .instrumentation import RequestMetrics
+from .middleware import ReplicaRoutingMiddleware
+from .models import Article, Category, Comment, Tag, UserProfile
+from .routers import ReplicaRouter, replica_reads, use_primary
+from .search import get_backend as get_search_backend
+from .serializers import CommentSerializer, UserBasicSerializer, UserProfileSerializer
+from .synthetic import SyntheticDataGenerator
+
+
+class QueryCountMixin:
+    """
+    Helpers for catching N+1 queries in listings.
+
+    assertQueryCountConstant() requests a URL, adds more rows, requests it
+    again and fails if the number of SQL queries went up with the row count.
+    """
+
+    def count_queries(self, url, **extra):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return len(context.captured_queries), context
+
+    def assertQueryCountConstant(self, url, add_rows, rounds=2, **extra):
+        extra.setdefault('HTTP_ACCEPT', 'application/json')
+        add_rows()
+        baseline, _ = self.count_queries(url, **extra)
+        for _ in range(rounds):
+            add_rows()
+            count, context = self.count_queries(url, **extra)
+            if count != baseline:
+                queries = '\n'.join(query['sql'] for query in context.captured_queries)
+                self.fail(
+                    f'{url} ran {baseline} queries before adding rows and {count} after; '
+                    f'the query count must not grow with the number of rows:\n{queries}'
+                )
+
+
+class ArticleFixtureMixin:
+    """Shared fixtures for article tests"""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'Author123!')
+        UserProfile.objects.create(user=self.author, user_type='author')
+        self.category = Category.objects.create(name='Technology', description='Tech')
+        self.tags = [Tag.objects.create(tag_name=f'Tag {i}') for i in range(3)]
+        self.counter = 0
+
+    def add_articles(self, count=3):
+        for _ in range(count):
+            self.counter += 1
+            author = User.objects.create_user(f'writer{self.counter}', password='Writer123!')
+            article = Article.objects.create(
+                title=f'Searchable article {self.counter}',
+                content='Some content about django',
+                author=author if self.counter % 2 else self.author,
+                category=Category.objects.create(name=f'Category {self.counter}', description='-'),
+            )
+            article.tags.set(self.tags)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ArticleQueryCountTests(ArticleFixtureMixin, QueryCountMixin, TestCase):
+    """Article listings must run a fixed number of queries"""
+
+    def test_article_viewset_list(self):
+        self.assertQueryCountConstant('/api/articles/', self.add_articles)
+
+    def test_article_list_view(self):
+        self.assertQueryCountConstant('/articles/', self.add_articles)
+
+    def test_my_articles(self):
+        self.client.force_login(self.author)
+        self.assertQueryCountConstant('/api/articles/my_articles/', self.add_articles)
+
+    def test_tag_articles(self):
+        self.client.force_login(self.author)
+        url = f'/api/tags/{self.tags[0].slug}/articles/'
+        self.assertQueryCountConstant(url, self.add_articles)
+
+    def test_tag_detail(self):
+        url = f'/tags/{self.tags[0].slug}/'
+        self.assertQueryCountConstant(url, self.add_articles)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    ARTICLE_PAGE_SIZE=2, API_MAX_PAGE_SIZE=3,
+)
+class KeysetPaginationTests(ArticleFixtureMixin, TestCase):
+    """Listings page on (created_at, id) with opaque cursors"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(5)
+        # Ties on created_at are broken by id
+        Article.objects.filter(pk__in=Article.objects.order_by('pk').values('pk')[:3]).update(
+            created_at=timezone.now()
+        )
+        self.newest = list(Article.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walk_forward_and_back(self):
+        pages = []
+        data = self.get('/api/articles/')
+        self.assertIsNone(data['previous'])
+        while True:
+            pages.append([article['id'] for article in data['results']])
+            if not data['next']:
+                break
+            data = self.get(data['next'])
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), self.newest)
+
+        back = self.get(data['previous'])
+        self.assertEqual([article['id'] for article in back['results']], pages[1])
+
+    def test_inserts_do_not_shift_pages(self):
+        first = self.get('/api/articles/')
+        self.add_articles(1)
+        second = self.get(first['next'])
+        self.assertEqual([article['id'] for article in second['results']], self.newest[2:4])
+
+    def test_page_size_and_bad_cursor(self):
+        self.assertEqual(len(self.get('/api/articles/', page_size=10)['results']), 3)
+        self.assertEqual(len(self.get('/api/articles/', page_size='x')['results']), 2)
+        self.assertEqual(len(self.get('/api/articles/', page_size=0)['results']), 2)
+        self.assertEqual(self.client.get('/api/articles/', {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CommentTreeTests(ArticleFixtureMixin, QueryCountMixin, TestCase):
+    """Comment threads are loaded in one query and nest to any depth"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(1)
+        self.article = Article.objects.get()
+
+    def add_thread(self):
+        parent = Comment.objects.create(article=self.article, user=self.author, content='root')
+        for depth in range(3):
+            parent = Comment.objects.create(article=self.article, user=self.author, content=f'reply {depth}', parent=parent)
+
+    def test_article_comments_query_count(self):
+        url = f'/api/articles/{self.article.pk}/comments/'
+        self.assertQueryCountConstant(url, self.add_thread)
+
+    def test_article_detail_query_count(self):
+        self.client.force_login(self.article.author)
+        url = f'/articles/{self.article.slug}/'
+        self.assertQueryCountConstant(url, self.add_thread)
+
+    def test_nested_replies(self):
+        self.add_thread()
+        hidden = Comment.objects.create(
+            article=self.article, user=self.author, content='spam',
+            parent=Comment.objects.get(content='root'), is_approved=False,
+        )
+        tree = CommentTree.for_article(self.article)
+        self.assertEqual(len(tree.roots), 1)
+
+        data = CommentSerializer(tree.roots, many=True).data
+        root = data[0]
+        # The hidden reply is neither listed nor counted
+        self.assertEqual(root['reply_count'], 1)
+        self.assertNotIn(hidden.id, [reply['id'] for reply in root['replies']])
+        self.assertEqual(root['replies'][0]['replies'][0]['replies'][0]['content'], 'reply 2')
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    COMMENT_PAGE_SIZE=2, REPLY_PAGE_SIZE=2,
+)
+class CommentPaginationTests(ArticleFixtureMixin, QueryCountMixin, TestCase):
+    """The article page carries one page of top-level comments; replies load lazily"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(1)
+        self.article = Article.objects.get()
+        self.client.force_login(self.article.author)
+        self.url = f'/articles/{self.article.slug}/'
+
+    def add_comments(self):
+        root = Comment.objects.create(article=self.article, user=self.author, content='root')
+        for i in range(3):
+            Comment.objects.create(article=self.article, user=self.author, content=f'reply {i}', parent=root)
+        return root
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_page_and_cursor(self):
+        roots = [self.add_comments() for _ in range(3)]
+        data = self.get(self.url)
+        self.assertEqual([c['id'] for c in data['comments']], [roots[2].id, roots[1].id])
+        self.assertEqual(data['comments'][0]['reply_count'], 3)
+        self.assertEqual(data['comments'][0]['replies'], [])
+        self.assertIsNone(data['comments_previous'])
+
+        older = self.get(data['comments_next'])
+        self.assertEqual([c['id'] for c in older['comments']], [roots[0].id])
+        self.assertIsNone(older['comments_next'])
+
+    def test_replies_endpoint(self):
+        root = self.add_comments()
+        Comment.objects.create(article=self.article, user=self.author, content='hidden', parent=root, is_approved=False)
+        page = self.get(f'/api/comments/{root.pk}/replies/')
+        self.assertEqual([r['content'] for r in page['results']], ['reply 0', 'reply 1'])
+        page = self.get(page['next'])
+        self.assertEqual([r['content'] for r in page['results']], ['reply 2'])
+        self.assertIsNone(page['next'])
+
+    def test_query_count_independent_of_replies(self):
+        self.assertQueryCountConstant(self.url, self.add_comments)
+        root = self.add_comments()
+        self.assertQueryCountConstant(f'/api/comments/{root.pk}/replies/', self.add_comments)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ArticleSearchTests(ArticleFixtureMixin, TestCase):
+    """The search index follows article, tag and author changes"""
+
+    def search(self, query):
+        response = self.client.get('/api/articles/search/', {'q': query}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return [article['title'] for article in response.json()]
+
+    def test_ranking_and_stemming(self):
+        Article.objects.create(title='Gardening notes', content='We talk about running a lot here',
+                               author=self.author, category=self.category)
+        Article.objects.create(title='Running shoes', content='Review', author=self.author, category=self.category)
+        self.assertEqual(self.search('runs'), ['Running shoes', 'Gardening notes'])
+        self.assertEqual(self.search('shoe'), ['Running shoes'])
+
+    def test_index_follows_changes(self):
+        article = Article.objects.create(title='Plain', content='Body', author=self.author, category=self.category)
+        article.tags.add(self.tags[0])
+        self.assertEqual(self.search('Tag 0'), ['Plain'])
+        self.assertEqual(self.search('author'), ['Plain'])
+
+        self.tags[0].tag_name = 'Renamed'
+        self.tags[0].save()
+        self.assertEqual(self.search('renamed'), ['Plain'])
+
+        article.tags.clear()
+        self.assertEqual(self.search('renamed'), [])
+
+        article.delete()
+        self.assertEqual(self.search('plain'), [])
+
+    @override_settings(SEARCH_RESULT_LIMIT=2)
+    def test_limit(self):
+        for i in range(3):
+            Article.objects.create(title=f'Limited {i}', content='Body', author=self.author, category=self.category)
+        url = '/api/articles/search/'
+        for limit, expected in (('-1', 1), ('0', 1), ('1', 1), ('100', 2)):
+            response = self.client.get(url, {'q': 'limited', 'limit': limit}, HTTP_ACCEPT='application/json')
+            self.assertEqual(len(response.json()), expected, limit)
+        response = self.client.get(url, {'q': 'limited', 'limit': 'all'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_command(self):
+        Article.objects.create(title='Rebuilt', content='Body', author=self.author, category=self.category)
+        get_search_backend().clear()
+        self.assertEqual(self.search('rebuilt'), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('rebuilt'), ['Rebuilt'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CounterTests(ArticleFixtureMixin, TestCase):
+    """Denormalized counters follow creates, deletes and M2M changes"""
+
+    def assertCounts(self, category=None, tags=None):
+        if category is not None:
+            self.category.refresh_from_db()
+            self.assertEqual(self.category.article_count, category)
+        if tags is not None:
+            self.assertEqual([Tag.objects.get(pk=tag.pk).article_count for tag in self.tags], tags)
+
+    def test_article_counters(self):
+        article = Article.objects.create(title='One', content='-', author=self.author, category=self.category)
+        self.assertCounts(category=1)
+        article.tags.set(self.tags[:2])
+        self.assertCounts(tags=[1, 1, 0])
+        article.tags.remove(self.tags[0])
+        self.tags[2].article_set.add(article)
+        self.assertCounts(tags=[0, 1, 1])
+        article.tags.clear()
+        self.assertCounts(tags=[0, 0, 0])
+
+        article.tags.set(self.tags)
+        other = Category.objects.create(name='Other', description='-')
+        article.category = other
+        article.save()
+        other.refresh_from_db()
+        self.assertEqual(other.article_count, 1)
+        self.assertCounts(category=0)
+
+        article.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.article_count, 0)
+        self.assertCounts(tags=[0, 0, 0])
+
+    def test_comment_counters(self):
+        article = Article.objects.create(title='One', content='-', author=self.author, category=self.category)
+        root = Comment.objects.create(article=article, user=self.author, content='root')
+        reply = Comment.objects.create(article=article, user=self.author, content='reply', parent=root)
+        article.refresh_from_db()
+        root.refresh_from_db()
+        self.assertEqual((article.comment_count, root.reply_count), (2, 1))
+
+        # Saving a stale instance must not overwrite the counter
+        stale = Article.objects.get(pk=article.pk)
+        Comment.objects.create(article=article, user=self.author, content='late')
+        stale.title = 'Renamed'
+        stale.save()
+        article.refresh_from_db()
+        self.assertEqual(article.comment_count, 3)
+
+        reply.delete()
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 0)
+
+    def test_reply_count_counts_approved_replies(self):
+        article = Article.objects.create(title='One', content='-', author=self.author, category=self.category)
+        root = Comment.objects.create(article=article, user=self.author, content='root')
+        reply = Comment.objects.create(article=article, user=self.author, content='spam', parent=root,
+                                       is_approved=False)
+        self.assertEqual(Comment.objects.get(pk=root.pk).reply_count, 0)
+        reply.is_approved = True
+        reply.save()
+        self.assertEqual(Comment.objects.get(pk=root.pk).reply_count, 1)
+
+        # Bulk moderation recounts the parents
+        moderation.reject(Comment.objects.filter(pk=reply.pk), self.author)
+        self.assertEqual(Comment.objects.get(pk=root.pk).reply_count, 0)
+        moderation.approve(Comment.objects.filter(pk=reply.pk), self.author)
+        self.assertEqual(Comment.objects.get(pk=root.pk).reply_count, 1)
+        self.assertEqual(reconcile(dry_run=True)['Comment.reply_count'], 0)
+
+        Comment.objects.filter(pk=reply.pk).update(is_approved=False)
+        Comment.objects.get(pk=reply.pk).delete()
+        self.assertEqual(reconcile()['Comment.reply_count'], 1)
+        self.assertEqual(Comment.objects.get(pk=root.pk).reply_count, 0)
+
+    def test_moved_comment(self):
+        first = Article.objects.create(title='One', content='-', author=self.author, category=self.category)
+        second = Article.objects.create(title='Two', content='-', author=self.author, category=self.category)
+        roots = [Comment.objects.create(article=first, user=self.author, content='root') for _ in range(2)]
+        reply = Comment.objects.create(article=first, user=self.author, content='reply', parent=roots[0])
+
+        reply.parent = roots[1]
+        reply.save()
+        self.assertEqual([Comment.objects.get(pk=root.pk).reply_count for root in roots], [0, 1])
+
+        reply.article = second
+        reply.parent = None
+        reply.save()
+        self.assertEqual([Comment.objects.get(pk=root.pk).reply_count for root in roots], [0, 0])
+        self.assertEqual([Article.objects.get(pk=article.pk).comment_count for article in (first, second)], [2, 1])
+        self.assertEqual(reconcile(dry_run=True)['Article.comment_count'], 0)
+
+    def test_reconcile_command(self):
+        article = Article.objects.create(title='One', content='-', author=self.author, category=self.category)
+        article.tags.set(self.tags)
+        Tag.objects.update(article_count=7)
+        Category.objects.update(article_count=0)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounts(category=1, tags=[1, 1, 1])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ResponseCacheTests(ArticleFixtureMixin, TestCase):
+    """Cached payloads are dropped as soon as a dependency changes"""
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_hit_and_invalidation(self):
+        self.add_articles(2)
+        tag_url = f'/tags/{self.tags[0].slug}/'
+        self.assertEqual(self.get(tag_url)['X-Cache'], 'MISS')
+        self.assertEqual(self.get(tag_url)['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/api/categories/')['X-Cache'], 'MISS')
+
+        article = Article.objects.first()
+        article.title = 'Changed'
+        article.save()
+        response = self.get(tag_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Changed', [item['title'] for item in response.json()['articles']])
+
+        self.assertEqual(self.get('/api/categories/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/categories/')['X-Cache'], 'HIT')
+
+    def test_tag_detail_follows_comment_counts(self):
+        self.add_articles(1)
+        article = Article.objects.get()
+        tag_url = f'/tags/{self.tags[0].slug}/'
+        self.get(tag_url)
+        Comment.objects.create(article=article, user=self.author, content='New comment')
+        response = self.get(tag_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['articles'][0]['comment_count'], 1)
+
+    def test_stats_are_for_admins(self):
+        staff = User.objects.create_user('staff', password='Staff123!', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/api/debug/cache-stats/').status_code, 403)
+        UserProfile.objects.filter(user=self.author).update(user_type='admin')
+        self.client.force_login(self.author)
+        self.assertIn('hit_ratio', self.get('/api/debug/cache-stats/').json())
+
+    def test_query_params_are_part_of_the_key(self):
+        self.add_articles(3)
+        self.assertEqual(self.get('/articles/?page_size=1')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/articles/?page_size=2')['X-Cache'], 'MISS')
+        self.assertEqual(len(self.get('/articles/?page_size=2').json()['results']), 2)
+
+    def test_related_rename_invalidates_detail(self):
+        self.add_articles(1)
+        article = Article.objects.get()
+        self.client.force_login(article.author)
+        url = f'/articles/{article.slug}/'
+        self.get(url)
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+        article.category.name = 'Renamed'
+        article.category.save()
+        response = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['article']['category_name'], 'Renamed')
+
+        Comment.objects.create(article=article, user=self.author, content='New comment')
+        self.assertEqual(len(self.get(url).json()['comments']), 1)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ConditionalGetTests(ArticleFixtureMixin, TestCase):
+    """Unchanged payloads are answered with 304 Not Modified"""
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_article_list(self):
+        self.add_articles(2)
+        for url in ('/api/articles/', '/articles/', f'/tags/{self.tags[0].slug}/'):
+            first = self.client.get(url, HTTP_ACCEPT='application/json')
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+            article = Article.objects.first()
+            article.content = 'Edited'
+            article.save()
+            self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_article_detail(self):
+        self.add_articles(1)
+        article = Article.objects.get()
+        url = f'/api/articles/{article.pk}/'
+        first = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        article.tags.remove(self.tags[0])
+        second = self.revalidate(url, first)
+        self.assertEqual(second.status_code, 200)
+
+        Comment.objects.create(article=article, user=self.author, content='Hi')
+        self.assertEqual(self.revalidate(url, second).status_code, 200)
+
+    def test_deletion_is_never_not_modified(self):
+        self.add_articles(2)
+        first = self.client.get('/api/articles/', HTTP_ACCEPT='application/json')
+        # Only the ETag: tag versions cannot say when something changed
+        self.assertNotIn('Last-Modified', first)
+        Article.objects.first().delete()
+        response = self.client.get('/api/articles/', HTTP_ACCEPT='application/json',
+                                   HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.revalidate('/api/articles/', first).status_code, 200)
+
+    def test_author_changes(self):
+        self.add_articles(2)
+        article = Article.objects.first()
+        urls = ('/api/articles/', f'/api/articles/{article.pk}/', f'/tags/{self.tags[0].slug}/')
+        responses = {url: self.client.get(url, HTTP_ACCEPT='application/json') for url in urls}
+        self.author.username = 'renamed'
+        self.author.save()
+        for url, first in responses.items():
+            response = self.revalidate(url, first)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertIn(b'renamed', response.content)
+
+    def test_query_string_is_part_of_the_etag(self):
+        self.add_articles(2)
+        first = self.client.get('/api/articles/', HTTP_ACCEPT='application/json')
+        self.assertEqual(self.revalidate('/api/articles/?page_size=1', first).status_code, 200)
+
+    def test_not_modified_skips_the_database(self):
+        self.add_articles(3)
+        for url in ('/api/articles/', f'/tags/{self.tags[0].slug}/'):
+            first = self.client.get(url, HTTP_ACCEPT='application/json')
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.revalidate(url, first).status_code, 304)
+            # The tag page only looks up the tag itself
+            self.assertLessEqual(len(context.captured_queries), 1, url)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], EXPORT_CHUNK_SIZE=2)
+class ExportTests(ArticleFixtureMixin, TestCase):
+    """Exports stream every row with its related data"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(3)
+        article = Article.objects.order_by('pk').first()
+        Comment.objects.create(article=article, user=self.author, content='Hello, "world"')
+        self.admin = User.objects.create_user('admin', 'admin@example.com', 'Admin123!')
+        UserProfile.objects.create(user=self.admin, user_type='admin')
+
+    def stream(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        self.client.force_login(self.admin)
+        rows = [json.loads(line) for line in self.stream('/api/export/articles/').splitlines()]
+        self.assertEqual([row['id'] for row in rows], sorted(Article.objects.values_list('pk', flat=True)))
+        self.assertEqual(rows[0]['tags'], [tag.slug for tag in self.tags])
+        self.assertEqual(rows[0]['comment_count'], 1)
+
+    def test_csv(self):
+        self.client.force_login(self.admin)
+        rows = list(csv.DictReader(StringIO(self.stream('/api/export/comments/?fmt=csv'))))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['content'], 'Hello, "world"')
+        self.assertEqual(rows[0]['user'], 'author')
+
+    def test_admin_only_and_validation(self):
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get('/api/export/articles/').status_code, 403)
+        # Staff flags do not make an admin
+        self.client.force_login(User.objects.create_superuser('staff', 'staff@example.com', 'Staff123!'))
+        self.assertEqual(self.client.get('/api/export/articles/').status_code, 403)
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/export/users/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_data', 'articles', '--format', 'csv', stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['tags'], '|'.join(tag.slug for tag in self.tags))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], IMPORT_BATCH_SIZE=2)
+class ImportTests(ArticleFixtureMixin, TestCase):
+    """Bulk import creates valid rows, reports invalid ones and keeps derived data in sync"""
+
+    def post(self, lines):
+        body = '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines)
+        return self.client.post('/api/articles/import/', body, content_type='application/x-ndjson',
+                                HTTP_ACCEPT='application/json')
+
+    def row(self, title, **extra):
+        return {'title': title, 'content': 'Imported body', 'category': self.category.slug,
+                'tags': [self.tags[0].slug], **extra}
+
+    def test_import(self):
+        self.client.force_login(self.author)
+        Article.objects.create(title='Taken', slug='taken', content='-', author=self.author, category=self.category)
+        response = self.post([
+            self.row('Imported one'),
+            '{not json',
+            self.row('Imported one'),
+            self.row('Bad tag', tags=['missing']),
+            self.row('Explicit', slug='taken'),
+            '',
+            self.row('Other author', author='writer1'),
+        ])
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual(result['created'], 3)
+        self.assertEqual([error['line'] for error in result['errors']], [2, 4, 5])
+
+        imported = Article.objects.filter(content='Imported body')
+        self.assertEqual(sorted(imported.values_list('slug', flat=True)),
+                         ['imported-one', 'imported-one-2', 'other-author'])
+        # Non-admins always import as themselves
+        self.assertEqual(set(imported.values_list('author', flat=True)), {self.author.pk})
+        self.assertEqual(Tag.objects.get(pk=self.tags[0].pk).article_count, 3)
+        self.assertEqual(Category.objects.get(pk=self.category.pk).article_count, 4)
+        self.assertEqual(self.client.get('/api/articles/search/', {'q': 'imported'},
+                                         HTTP_ACCEPT='application/json').json()[0]['excerpt'], 'Imported body')
+
+    def test_malformed_fields_are_row_errors(self):
+        self.client.force_login(self.author)
+        response = self.post([
+            self.row('Number tags', tags=5),
+            self.row('String tags', tags=self.tags[0].slug),
+            self.row('Number category', category=7),
+            self.row('Fine'),
+        ])
+        self.assertEqual(response.status_code, 201)
+        result = response.json()
+        self.assertEqual(result['created'], 1)
+        self.assertEqual([error['line'] for error in result['errors']], [1, 2, 3])
+        self.assertEqual(result['errors'][0]['error'], 'tags must be a list of tag slugs')
+
+    def test_export_round_trip(self):
+        self.add_articles(2)
+        exported = StringIO()
+        call_command('export_data', 'articles', stdout=exported)
+        lines = [json.loads(line) for line in exported.getvalue().splitlines()]
+        for line in lines:
+            del line['slug']
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as f:
+            f.write('\n'.join(json.dumps(line) for line in lines))
+            f.flush()
+            out = StringIO()
+            call_command('import_articles', f.name, stdout=out, stderr=StringIO())
+        self.assertIn('Imported 2 article(s), 0 failed', out.getvalue())
+        self.assertEqual(Article.objects.count(), 4)
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+
+
+class SyntheticDataTests(TestCase):
+    """The synthetic data generator is reproducible and leaves derived data consistent"""
+
+    def test_generate(self):
+        stats = SyntheticDataGenerator(200, seed=7, chunk_size=50, log=lambda message: None).run()
+        self.assertEqual(Article.objects.count(), 200)
+        self.assertEqual(stats['comments'], Comment.objects.count())
+        self.assertFalse(any(reconcile(dry_run=True).values()))
+        self.assertTrue(Comment.objects.filter(parent__parent__isnull=False).exists())
+        # Zipf: the most popular category holds far more than an even share
+        top = Category.objects.order_by('-article_count').first()
+        self.assertGreater(top.article_count, 2 * 200 / Category.objects.count())
+
+        titles = list(Article.objects.order_by('pk').values_list('title', flat=True)[:20])
+        Article.objects.all().delete()
+        SyntheticDataGenerator(200, seed=7, chunk_size=50, log=lambda message: None).run()
+        self.assertEqual(list(Article.objects.order_by('pk').values_list('title', flat=True)[:20]), titles)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], RESPONSE_CACHE_TIMEOUT=0)
+class BenchmarkTests(TestCase):
+    """Every benchmarked endpoint answers successfully and regressions are detected"""
+
+    def test_runner(self):
+        SyntheticDataGenerator(30, seed=1, log=lambda message: None).run()
+        with redirect_stdout(StringIO()):
+            results = BenchmarkRunner(iterations=2, warmup=0).run()
+        for name, result in results['endpoints'].items():
+            self.assertEqual(result['status_codes'], [200], name)
+            self.assertGreater(result['p50_ms'], 0, name)
+
+        slower = copy.deepcopy(results)
+        slower['endpoints']['tag-list']['p95_ms'] *= 2
+        slower['endpoints']['tag-list']['queries'] += 1
+        _, regressions = compare_benchmarks(results, slower, threshold=0.5)
+        self.assertEqual({(name, metric) for name, metric, *_ in regressions},
+                         {('tag-list', 'p95_ms'), ('tag-list', 'queries')})
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], DUPLICATE_QUERY_THRESHOLD=3)
+class InstrumentationTests(ArticleFixtureMixin, TestCase):
+    """Requests report their timings and repeated queries"""
+
+    def test_server_timing_and_log(self):
+        self.add_articles(2)
+        with self.assertLogs('myapp.requests', 'INFO') as logs:
+            response = self.client.get('/api/articles/', HTTP_ACCEPT='application/json')
+        timings = server_timing(response)
+        self.assertEqual(set(timings), {'db', 'serialize', 'render', 'total'})
+        self.assertGreater(timings['serialize'], 0)
+        self.assertGreaterEqual(timings['total'], timings['db'] + timings['serialize'])
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'article-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['sql_queries'], 0)
+
+    def test_duplicate_queries(self):
+        for i in range(3):
+            article = Article.objects.create(title=f'Post {i}', content='-', author=self.author, category=self.category)
+            Comment.objects.create(article=article, user=self.author, content='-')
+        comments = list(Comment.objects.all())
+        metrics = RequestMetrics()
+        with connection.execute_wrapper(metrics.record_query):
+            for comment in comments:
+                comment.article.title  # one query per comment
+            list(Comment.objects.filter(pk__in=[comments[0].pk]))
+            list(Comment.objects.filter(pk__in=[comment.pk for comment in comments]))
+        duplicates = metrics.duplicate_queries(2)
+        self.assertEqual([count for count, _ in duplicates], [3, 2])
+        self.assertIn('IN (...)', duplicates[1][1])
+
+    @override_settings(DUPLICATE_QUERY_THRESHOLD=1)
+    def test_duplicate_query_warning(self):
+        with self.assertLogs('myapp.queries', 'WARNING') as logs:
+            self.client.get('/api/categories/', HTTP_ACCEPT='application/json')
+        self.assertEqual(json.loads(logs.records[0].getMessage())['view'], 'category-list')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class MetricsTests(ArticleFixtureMixin, TestCase):
+    """/metrics exposes request, login, cache and moderation metrics of every process"""
+
+    def scrape(self, **extra):
+        response = self.client.get('/metrics', **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def value(self, text, sample):
+        for line in text.splitlines():
+            if line.startswith(sample + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_metrics(self):
+        self.add_articles(1)
+        Comment.objects.create(article=Article.objects.get(), user=self.author, content='-', is_approved=False)
+        before = self.scrape()
+        self.client.get('/api/articles/', HTTP_ACCEPT='application/json')
+        self.client.post('/api/auth/login/', {'username': 'author', 'password': 'wrong'}, content_type='application/json')
+        text = self.scrape()
+
+        route = 'http_request_duration_seconds_count{method="GET",route="article-list",view="ArticleViewSet"}'
+        self.assertEqual(self.value(text, route) - self.value(before, route), 1)
+        self.assertEqual(self.value(text, 'login_attempts_total') - self.value(before, 'login_attempts_total'), 1)
+        self.assertEqual(self.value(text, 'login_failures_total') - self.value(before, 'login_failures_total'), 1)
+        self.assertEqual(self.value(text, 'comments_pending'), 1)
+        self.assertIn('db_queries_per_request_bucket{route="article-list",view="ArticleViewSet",le="+Inf"}', text)
+        self.assertIn('response_cache_hit_ratio ', text)
+
+    def test_multiple_processes(self):
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            other = {'counters': [['login_attempts_total', [], 5]], 'histograms': [],
+                     'cache': {'article-list': {'hits': 3, 'misses': 1}}}
+            with open(os.path.join(directory, '99999-1.json'), 'w') as f:
+                json.dump(other, f)
+            local = self.value(self.scrape(), 'login_attempts_total')
+            metrics.registry.flush()
+            self.assertTrue(os.path.exists(os.path.join(directory, metrics.registry.file_name)))
+            # The other process's file is added to this process's live numbers
+            self.assertGreaterEqual(local, 5)
+            self.assertIn('response_cache_requests_total{endpoint="article-list",result="hit"} 3', self.scrape())
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ClaimsAuthenticationTests(ArticleFixtureMixin, TestCase):
+    """JWT requests are authenticated from the token claims and the cached user status"""
+
+    def login(self):
+        response = self.client.post('/api/auth/login/', {'username': 'author', 'password': 'Author123!'},
+                                    content_type='application/json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def test_no_auth_queries(self):
+        token = self.login()
+        self.assertEqual(AccessToken(token)['user_type'], 'author')
+        self.client.get('/api/tags/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/tags/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('auth_user', tables)
+        self.assertNotIn('myapp_userprofile', tables)
+
+    def test_admin_is_a_profile_role(self):
+        staff = User.objects.create_user('staff', password='Staff123!', is_staff=True)
+        UserProfile.objects.create(user=staff, user_type='regular')
+        self.assertFalse(authentication.is_admin(staff))
+        UserProfile.objects.filter(user=staff).update(user_type='owner')
+        self.assertTrue(authentication.is_admin(User.objects.get(pk=staff.pk)))
+
+    def test_owner_or_admin_from_claims(self):
+        self.add_articles(2)
+        other = Article.objects.exclude(author=self.author).get()
+        token = self.login()
+        response = self.client.patch(f'/articles/{other.slug}/', {'title': 'Taken'}, content_type='application/json',
+                                     HTTP_ACCEPT='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 403)
+        # Role changes reach existing tokens through the status cache
+        UserProfile.objects.filter(user=self.author).update(user_type='admin')
+        authentication.forget_status(self.author.pk)
+        response = self.client.patch(f'/articles/{other.slug}/', {'title': 'Taken'}, content_type='application/json',
+                                     HTTP_ACCEPT='application/json', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_revocation(self):
+        token = self.login()
+        self.author.is_active = False
+        self.author.save()
+        self.assertEqual(self.client.get('/api/tags/', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 401)
+
+    def test_token_without_claims(self):
+        token = RefreshToken.for_user(self.author).access_token
+        self.assertEqual(self.client.get('/api/tags/', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginTests(ArticleFixtureMixin, TestCase):
+    """Logins find the account in one query and hash the password once"""
+
+    def login(self, **data):
+        with CaptureQueriesContext(connection) as context, \
+                mock.patch('django.contrib.auth.base_user.make_password', wraps=make_password) as hashed, \
+                mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as checked:
+            response = self.client.post('/api/auth/login/', data, content_type='application/json',
+                                        HTTP_ACCEPT='application/json')
+        self.assertEqual(hashed.call_count + checked.call_count, 1)
+        return response, len(context.captured_queries)
+
+    def test_username_or_email(self):
+        for data in ({'username': 'author'}, {'email': 'author@example.com'}):
+            response, queries = self.login(password='Author123!', **data)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['user']['profile']['user_type'], 'author')
+            self.assertEqual(queries, 1)
+
+    def test_unknown_account_costs_one_hash(self):
+        response, queries = self.login(email='nobody@example.com', password='Author123!')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(queries, 1)
+        response, _ = self.login(username='author', password='wrong')
+        self.assertEqual(response.status_code, 400)
+
+    def test_failures_are_signalled(self):
+        failures = []
+
+        def receiver(sender, credentials, request=None, **kwargs):
+            failures.append((credentials, request.path))
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.login(username='author', password='wrong')
+        self.login(email='nobody@example.com', password='Author123!')
+        self.assertEqual(failures, [({'username': 'author'}, '/api/auth/login/'),
+                                    ({'username': 'nobody@example.com'}, '/api/auth/login/')])
+
+    def test_other_backends_are_honoured(self):
+        backends = ['django.contrib.auth.backends.AllowAllUsersModelBackend']
+        with self.settings(AUTHENTICATION_BACKENDS=backends), \
+                mock.patch('django.contrib.auth.backends.AllowAllUsersModelBackend.authenticate',
+                           return_value=None) as backend:
+            response = self.client.post('/api/auth/login/', {'email': 'author@example.com', 'password': 'Author123!'},
+                                        content_type='application/json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(backend.call_args.kwargs['username'], 'author')
+
+    def test_rehash_on_login(self):
+        with self.settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.ScryptPasswordHasher',
+                                             'django.contrib.auth.hashers.MD5PasswordHasher']):
+            response = self.client.post('/api/auth/login/', {'username': 'author', 'password': 'Author123!'},
+                                        content_type='application/json', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.password.startswith('scrypt$'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncViewTests(ArticleFixtureMixin, TestCase):
+    """The /api/async/ endpoints return the same payloads as their sync counterparts"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(3)
+        self.article = Article.objects.first()
+        root = Comment.objects.create(article=self.article, user=self.author, content='Root')
+        Comment.objects.create(article=self.article, user=self.author, content='Reply', parent=root)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200, response.content[:500])
+        return response.json()
+
+    def test_same_payloads(self):
+        pk, slug = self.article.pk, self.tags[0].slug
+        page = self.get('/api/async/articles/?page_size=2')
+        page['next'] = page['next'].replace('/api/async/', '/api/')
+        self.assertEqual(page, self.get('/api/articles/?page_size=2'))
+        self.assertEqual(self.get(f'/api/async/articles/{pk}/'), self.get(f'/api/articles/{pk}/'))
+        self.assertEqual(self.get(f'/api/async/articles/{pk}/comments/'), self.get(f'/api/articles/{pk}/comments/'))
+        self.assertEqual(self.get(f'/api/async/tags/{slug}/'), self.get(f'/tags/{slug}/'))
+        self.assertEqual(self.client.get('/api/async/articles/0/').status_code, 404)
+        self.assertEqual(self.client.get('/api/async/articles/?cursor=bad').status_code, 404)
+
+    async def test_async_client(self):
+        response = await self.async_client.get('/api/async/articles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 3)
+        # Queries run by the async ORM in its worker thread are still measured
+        timing = server_timing(response)
+        self.assertIn('db', timing)
+        self.assertIn(' queries"', response['Server-Timing'])
+        self.assertNotIn('"0 queries"', response['Server-Timing'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DatabaseStatsTests(TestCase):
+    """Connection settings, SQLite pragmas and pool gauges are exposed for monitoring"""
+
+    def test_stats(self):
+        self.assertIn(self.client.get('/api/debug/db-stats/').status_code, (401, 403))
+        admin = User.objects.create_user('admin', 'admin@example.com', 'Admin123!')
+        UserProfile.objects.create(user=admin, user_type='owner')
+        self.client.force_login(admin)
+        stats = self.client.get('/api/debug/db-stats/', HTTP_ACCEPT='application/json').json()['default']
+        self.assertEqual(stats['vendor'], 'sqlite')
+        self.assertTrue(stats['conn_health_checks'])
+        # init_command applied the configured pragmas; 1 is NORMAL
+        self.assertEqual(stats['pragmas']['synchronous'], 1)
+        self.assertEqual(stats['pragmas']['cache_size'], -64000)
+
+    def test_labelled_gauges(self):
+        gauges = [('db_pool_size', 'Pool size', 3, (('alias', 'default'),)),
+                  ('db_pool_size', 'Pool size', 1, (('alias', 'replica'),))]
+        text = metrics.render(gauges)
+        self.assertEqual(text.count('# TYPE db_pool_size gauge'), 1)
+        self.assertIn('db_pool_size{alias="default"} 3', text)
+        self.assertIn('db_pool_size{alias="replica"} 1', text)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Safe requests read from replicas unless the client wrote recently"""
+
+    def route(self, request):
+        routed = []
+
+        def view(request):
+            routed.append(ReplicaRouter().db_for_read(Article))
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+        response = ReplicaRoutingMiddleware(view)(request)
+        return routed[0], response
+
+    def test_routing(self):
+        factory = RequestFactory()
+        db, _ = self.route(factory.get('/api/articles/'))
+        self.assertEqual(db, 'replica1')
+
+        db, response = self.route(factory.post('/api/comments/'))
+        self.assertEqual(db, 'default')
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        request = factory.get('/api/articles/')
+        request.COOKIES[settings.REPLICA_STICKY_COOKIE] = '1'
+        db, _ = self.route(request)
+        self.assertEqual(db, 'default')
+
+    def test_token_users_stick_without_cookies(self):
+        caches['default'].clear()
+        factory = RequestFactory()
+
+        def bearer(user_id):
+            token = AccessToken()
+            token['user_id'] = user_id
+            return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+        db, response = self.route(factory.post('/api/comments/', **bearer(7)))
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        db, _ = self.route(factory.get('/api/articles/', **bearer(7)))
+        self.assertEqual(db, 'default')
+        db, _ = self.route(factory.get('/api/articles/', **bearer(8)))
+        self.assertEqual(db, 'replica1')
+        db, _ = self.route(factory.get('/api/articles/', HTTP_AUTHORIZATION='Bearer invalid'))
+        self.assertEqual(db, 'replica1')
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=60)
+    def test_cache_rebuilds_read_the_primary(self):
+        caches['default'].clear()
+        routed = []
+
+        def build():
+            routed.append(ReplicaRouter().db_for_read(Article))
+            return {}, ()
+        token = replica_reads.set(True)
+        try:
+            response_cache.get_or_set('test', 'response:test', build)
+        finally:
+            replica_reads.reset(token)
+        self.assertEqual(routed, ['default'])
+
+    def test_primary_outside_requests(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Article), 'default')
+        token = replica_reads.set(True)
+        try:
+            with use_primary():
+                self.assertEqual(router.db_for_read(Article), 'default')
+            self.assertEqual(router.db_for_write(Article), 'default')
+        finally:
+            replica_reads.reset(token)
+        self.assertFalse(router.allow_migrate('replica1', 'myapp'))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryPlanTests(ArticleFixtureMixin, TestCase):
+    """The hot listing queries walk an index in order instead of sorting the filtered rows"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(4)
+        self.article = Article.objects.first()
+        Comment.objects.create(article=self.article, user=self.author, content='-', is_approved=False)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('TEMP B-TREE', plan, 'the query sorts instead of reading the index in order')
+
+    def test_plans(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is SQLite specific')
+        newest = ('-created_at', '-id')
+        self.assertUsesIndex(Article.objects.filter(category=self.category).order_by(*newest)[:10],
+                             'article_category_created_idx')
+        self.assertUsesIndex(Article.objects.filter(author=self.author).order_by(*newest)[:10],
+                             'article_author_created_idx')
+        self.assertUsesIndex(Comment.objects.filter(article=self.article, parent__isnull=True).order_by(*newest)[:10],
+                             'comment_article_parent_idx')
+        self.assertUsesIndex(moderation.pending()[:10], 'comment_pending_idx')
+        self.assertUsesIndex(moderation.pending().filter(moderation.available_to(self.author))[:10],
+                             'comment_pending_idx')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class FragmentCacheTests(ArticleFixtureMixin, TestCase):
+    """Template fragments are reused until what they show changes"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(2)
+        self.article = Article.objects.first()
+        self.comment = Comment.objects.create(article=self.article, user=self.author, content='First!')
+        self.client.force_login(self.author)
+        self.url = f'/articles/{self.article.slug}/'
+
+    def page(self, url=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url or self.url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode(), len(context.captured_queries)
+
+    def test_cached_fragments_skip_their_queries(self):
+        _, cold = self.page()
+        content, warm = self.page()
+        # The category sidebar and the popular tags box
+        self.assertEqual(cold - warm, 2)
+        for text in (self.article.title, self.tags[0].tag_name, self.category.name, 'First!'):
+            self.assertIn(text, content)
+
+    def test_changes_show_up(self):
+        self.page()
+        self.article.content = 'Rewritten body'
+        self.article.save()
+        self.category.name = 'Science'
+        self.category.save()
+        self.comment.is_approved = False
+        self.comment.save()
+        content, _ = self.page()
+        self.assertIn('Rewritten body', content)
+        self.assertIn('Science', content)
+        self.assertIn('Pending Approval', content)
+
+    def test_comment_pages_cached_per_url(self):
+        Comment.objects.bulk_create([
+            Comment(article=self.article, user=self.author, content=f'comment {i}') for i in range(30)
+        ])
+        first, _ = self.page()
+        smaller, _ = self.page(f'{self.url}?page_size=5')
+        self.assertEqual(smaller.count('class="comment"'), 5)
+        self.assertGreater(first.count('class="comment"'), 5)
+        # Query params that don't pick the page share the cached fragment
+        _, cold = self.page(f'{self.url}?page_size=5&utm_source=feed')
+        _, warm = self.page(f'{self.url}?page_size=5&utm_source=mail')
+        self.assertEqual(cold, warm)
+
+    def test_tag_changes_show_up(self):
+        self.page()
+        self.tags[0].tag_name = 'Renamed tag'
+        self.tags[0].save()
+        content, _ = self.page()
+        # In the article's tag list and the popular tags box
+        self.assertEqual(content.count('Renamed tag'), 2)
+        # Deleting a tag sends no m2m_changed, so the article itself is untouched
+        self.tags[0].delete()
+        content, _ = self.page()
+        self.assertNotIn('Renamed tag', content)
+
+    def test_disabled(self):
+        with override_settings(FRAGMENT_CACHE_TIMEOUT=0):
+            _, cold = self.page()
+            _, warm = self.page()
+        self.assertEqual(cold, warm)
+
+
+@override_settings(THUMBNAIL_WORKERS=0)
+class ThumbnailTests(ArticleFixtureMixin, TestCase):
+    """Profile pictures get content-hashed, metadata-free thumbnails"""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.profile = self.author.userprofile
+
+    def upload(self, profile, color='red'):
+        image = Image.new('RGB', (400, 300), color)
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', exif=exif)
+        profile.profile_pic = SimpleUploadedFile('me.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        profile.refresh_from_db()
+        return profile.thumbnails
+
+    def test_thumbnails(self):
+        thumbnails = self.upload(self.profile)
+        self.assertEqual(thumbnails['source'], self.profile.profile_pic.name)
+        self.assertEqual(set(thumbnails['sizes']), set(settings.THUMBNAIL_SIZES))
+        for size, pixels in settings.THUMBNAIL_SIZES.items():
+            for image_format, name in thumbnails['sizes'][size].items():
+                with default_storage.open(name) as file, Image.open(file) as image:
+                    self.assertEqual(image.format, image_format.upper())
+                    self.assertEqual(image.size, (pixels, pixels))
+                    self.assertEqual(dict(image.getexif()), {})
+
+    def test_names_follow_content(self):
+        first = self.upload(self.profile)
+        other = UserProfile.objects.create(user=User.objects.create_user('other'))
+        self.assertEqual(self.upload(other)['sizes'], first['sizes'])
+        self.assertNotEqual(self.upload(other, color='blue')['sizes'], first['sizes'])
+
+        self.profile.profile_pic = None
+        self.profile.save()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.thumbnails, {})
+
+    def test_serializers(self):
+        thumbnails = self.upload(self.profile)
+        data = UserProfileSerializer(self.profile).data
+        self.assertEqual(data['thumbnails']['large']['webp'], settings.MEDIA_URL + thumbnails['sizes']['large']['webp'])
+        self.add_articles(1)
+        comment = Comment.objects.create(article=Article.objects.get(), user=self.author, content='-')
+        avatar = CommentSerializer(comment).data['user']['avatar']
+        self.assertEqual(set(avatar), set(settings.THUMBNAIL_FORMATS))
+        self.assertIsNone(UserBasicSerializer(User.objects.create_user('nobody')).data['avatar'])
+
+    def test_unreadable_upload(self):
+        self.profile.profile_pic = SimpleUploadedFile('me.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('myapp.thumbnails', 'ERROR'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.profile.save()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.thumbnails, {})
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_generated_in_background(self):
+        with mock.patch('myapp.thumbnails.generate', return_value={'sizes': {}}) as generate:
+            future = thumbnails.submit(self.profile.pk)
+            self.assertEqual(future.result(timeout=5), {'sizes': {}})
+        generate.assert_called_once_with(self.profile.pk)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RenderingTests(ArticleFixtureMixin, TestCase):
+    """Article Markdown is rendered and sanitized once, when the content changes"""
+
+    def create(self, content):
+        return Article.objects.create(title='Rendered', content=content, author=self.author, category=self.category)
+
+    def test_render(self):
+        article = self.create('## Intro\n\nSome *text* & more.<script>alert(1)</script> [x](javascript:alert(1))')
+        self.assertIn('<h2>Intro</h2>', article.content_html)
+        self.assertIn('<em>text</em>', article.content_html)
+        self.assertNotIn('<script', article.content_html)
+        self.assertNotIn('javascript:', article.content_html)
+        self.assertTrue(article.excerpt.startswith('Intro Some text & more.'))
+
+        with override_settings(EXCERPT_LENGTH=20):
+            self.assertLessEqual(len(self.create('word ' * 100).excerpt), 20)
+
+    def test_rendered_only_when_content_changes(self):
+        article = self.create('First')
+        with mock.patch('myapp.rendering.render_html', wraps=rendering.render_html) as render:
+            article = Article.objects.get(pk=article.pk)
+            article.title = 'Renamed'
+            article.save()
+            Article.objects.only('title').get(pk=article.pk).save()
+            render.assert_not_called()
+
+            article.content = '**Second**'
+            article.save(update_fields=['content'])
+            render.assert_called_once()
+        article.refresh_from_db()
+        self.assertEqual(article.content_html, '<p><strong>Second</strong></p>')
+        self.assertEqual(article.excerpt, 'Second')
+
+    def test_backfill(self):
+        self.add_articles(3)
+        Article.objects.update(content_html='', excerpt='')
+        with redirect_stdout(StringIO()):
+            call_command('render_articles', batch_size=2)
+        for article in Article.objects.all():
+            self.assertEqual(article.content_html, rendering.render_html(article.content))
+            self.assertTrue(article.excerpt)
+
+    def test_migration_backfills_existing_articles(self):
+        self.add_articles(2)
+        Article.objects.update(content_html='', excerpt='')
+        migration = import_module('myapp.migrations.0013_render_existing_articles')
+        migration.render_articles(django_apps, None)
+        for article in Article.objects.all():
+            self.assertEqual(article.content_html, rendering.render_html(article.content))
+            self.assertTrue(article.excerpt)
+
+    def test_templates_use_rendered_html(self):
+        article = self.create('## Heading')
+        self.client.force_login(self.author)
+        response = self.client.get(f'/articles/{article.slug}/', HTTP_ACCEPT='text/html')
+        self.assertContains(response, '<h2>Heading</h2>', html=True)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ArticleListSerializerTests(ArticleFixtureMixin, TestCase):
+    """Listings use the compact representation and honour ?fields="""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(2)
+        self.article = Article.objects.first()
+        self.article.content = 'A long paragraph of text. ' * 2000
+        self.article.save()
+
+    def get(self, url, **params):
+        response = self.client.get(url, params, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_compact_listing(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.get('/api/articles/')
+        article = response.json()['results'][0]
+        self.assertEqual(set(article), {'id', 'title', 'slug', 'excerpt', 'author', 'author_username', 'category',
+                                        'category_name', 'tags', 'comment_count', 'created_at'})
+        expected = Article.objects.get(pk=article['id'])
+        self.assertEqual(article['author'], expected.author_id)
+        self.assertEqual(article['author_username'], expected.author.username)
+        self.assertEqual(article['category'], expected.category.slug)
+        self.assertEqual(article['category_name'], expected.category.name)
+        self.assertEqual(sorted(article['tags']), sorted(expected.tags.values_list('slug', flat=True)))
+        # The bodies are not even read from the database
+        self.assertNotIn('"content"', context.captured_queries[0]['sql'])
+
+        detail = self.get(f'/api/articles/{self.article.pk}/')
+        self.assertLess(len(response.content) * 10, len(detail.content))
+
+    def test_sparse_fieldsets(self):
+        for url in ('/api/articles/', '/api/async/articles/'):
+            results = self.get(url, fields='id,title,bogus').json()['results']
+            self.assertEqual(set(results[0]), {'id', 'title'}, url)
+        data = self.get(f'/tags/{self.tags[0].slug}/', fields='slug').json()
+        self.assertEqual({tuple(article) for article in data['articles']}, {('slug',)})
+        # No known name: everything
+        results = self.get('/api/articles/', fields='bogus').json()['results']
+        self.assertIn('excerpt', results[0])
+
+    def test_other_listings(self):
+        self.client.force_login(self.author)
+        for url in ('/api/articles/my_articles/', f'/api/tags/{self.tags[0].slug}/articles/'):
+            self.assertNotIn('content', self.get(url).json()[0], url)
+        self.assertNotIn('content', self.get('/api/articles/search/', q='Article').json()[0])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ModerationTests(ArticleFixtureMixin, TestCase):
+    """The moderation queue: keyset pages, claims and bulk decisions in one UPDATE"""
+
+    def setUp(self):
+        super().setUp()
+        self.add_articles(2)
+        self.article = Article.objects.first()
+        self.spammer = User.objects.create_user('spammer', password='Spammer123!')
+        self.pending = [
+            Comment.objects.create(article=self.article, user=self.spammer if i % 2 else self.author,
+                                   content=f'{"spam" if i % 2 else "fine"} {i}', is_approved=False)
+            for i in range(6)
+        ]
+        Comment.objects.create(article=self.article, user=self.author, content='approved')
+        self.moderators = [User.objects.create_user(f'mod{i}', password='Mod12345!') for i in range(2)]
+        for moderator in self.moderators:
+            UserProfile.objects.create(user=moderator, user_type='admin')
+        self.client.force_login(self.moderators[0])
+
+    def post(self, url, data, status=200):
+        response = self.client.post(url, data, content_type='application/json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def queue(self, **params):
+        response = self.client.get('/api/comments/pending/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pending_pages(self):
+        seen = []
+        url = '/api/comments/pending/?page_size=4'
+        while url:
+            data = self.client.get(url).json()
+            seen.extend(comment['id'] for comment in data['results'])
+            url = data['next']
+        self.assertEqual(seen, [comment.pk for comment in reversed(self.pending)])
+        spam = self.queue(user=self.spammer.pk, contains='spam')['results']
+        self.assertEqual(len(spam), 3)
+        self.assertEqual(self.client.get('/api/comments/pending/', {'created_after': 'soon'}).status_code, 400)
+
+    def test_bulk_decisions_run_one_update(self):
+        ids = [comment.pk for comment in self.pending[:2]]
+        url = f'/articles/{self.article.slug}/'
+        self.client.get(url, HTTP_ACCEPT='application/json')
+        with CaptureQueriesContext(connection) as context:
+            data = self.post('/api/comments/approve/', {'ids': ids})
+        self.assertEqual(data['count'], 2)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        approved = Comment.objects.filter(pk__in=ids)
+        self.assertTrue(all(comment.is_approved and comment.moderated_by == self.moderators[0] for comment in approved))
+        # The cached article payload was invalidated
+        comments = {comment['id']: comment for comment in self.client.get(url, HTTP_ACCEPT='application/json').json()['comments']}
+        self.assertTrue(comments[ids[0]]['is_approved'])
+
+        data = self.post('/api/comments/reject/', {'filters': {'user': self.spammer.pk, 'contains': 'spam'}})
+        self.assertEqual(data['count'], 2)  # pending[1] was approved above
+        self.assertEqual(len(self.queue()['results']), 2)
+        # Rejected comments stay hidden but leave the queue
+        self.assertFalse(Comment.objects.get(pk=self.pending[3].pk).is_approved)
+
+    def test_claims(self):
+        first = self.post('/api/comments/claim/', {'count': 4})['results']
+        self.assertEqual(len(first), 4)
+        self.client.force_login(self.moderators[1])
+        second = self.post('/api/comments/claim/', {'count': 4})['results']
+        self.assertEqual(len(second), 2)
+        self.assertFalse({comment['id'] for comment in first} & {comment['id'] for comment in second})
+
+        # Comments held by someone else are skipped, singly or in bulk
+        theirs = first[0]['id']
+        self.post(f'/api/comments/{theirs}/approve/', {}, status=409)
+        self.assertEqual(self.post('/api/comments/reject/', {'filters': {}})['count'], 2)
+
+        # A lapsed lease frees the comments
+        Comment.objects.filter(pk=theirs).update(claimed_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([comment['id'] for comment in self.post('/api/comments/claim/', {})['results']], [theirs])
+
+        self.client.force_login(self.moderators[0])
+        self.assertEqual(self.post('/api/comments/release/', {})['released'], 3)
+        self.assertEqual(Comment.objects.filter(claimed_by=self.moderators[0]).count(), 0)
+
+    def test_validation_and_permissions(self):
+        self.post('/api/comments/approve/', {}, status=400)
+        self.post('/api/comments/approve/', {'ids': [1], 'filters': {}}, status=400)
+        with override_settings(MODERATION_MAX_IDS=2):
+            self.post('/api/comments/approve/', {'ids': [1, 2, 3]}, status=400)
+        self.post('/api/comments/999999/approve/', {}, status=404)
+        for ids in ('abc', 5, ['x'], []):
+            self.post('/api/comments/release/', {'ids': ids}, status=400)
+        self.post('/api/comments/release/', [1, 2], status=400)
+        with override_settings(MODERATION_MAX_IDS=2):
+            self.post('/api/comments/release/', {'ids': [1, 2, 3]}, status=400)
+        self.assertEqual(self.post('/api/comments/release/', {'ids': ['1']})['released'], 0)
+        self.post(f'/api/comments/{self.pending[0].pk}/reject/', {})
+
+        self.client.force_login(self.author)
+        self.post('/api/comments/approve/', {'filters': {}}, status=403)
+        self.assertEqual(self.client.get('/api/comments/pending/').status_code, 403)
+        self.assertEqual(self.client.get('/comments/pending/', HTTP_ACCEPT='text/html').status_code, 403)
@@ -0,0 +1,168 @@
+"""
+Profile picture thumbnails.
+
+When a UserProfile gets a new profile_pic, generate() reads the upload
+once, decodes it once with Pillow (JPEGs straight at the smallest scale
+that still covers the largest thumbnail) and writes a square crop for
+every THUMBNAIL_SIZES entry in each of THUMBNAIL_FORMATS. EXIF orientation
+is applied first and nothing else is carried over, so thumbnails have no
+EXIF, GPS or ICC metadata.
+
+File names come from a hash of the original's contents
+(thumbnails/<hash>-<pixels>.<ext>): a file never changes once written, so
+it can be served with a far-future Cache-Control, and a new picture gets
+new names. The names are recorded in UserProfile.thumbnails, which the
+serializers turn into URLs with urls().
+
+schedule() hands the work to a small thread pool once the upload's
+transaction commits, so the upload request does not wait for the
+resizing; Pillow releases the GIL while it decodes, resizes and encodes.
+With THUMBNAIL_WORKERS = 0 thumbnails are generated inline instead. The
+generate_thumbnails command builds them for existing profiles.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from . import cache
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def thumbnail_name(digest, pixels, image_format):
+    return f'{settings.THUMBNAIL_DIR}/{digest}-{pixels}.{EXTENSIONS[image_format]}'
+
+
+def render(data):
+    """Encode every thumbnail of the image in `data`: {(pixels, format): bytes}"""
+    largest = max(settings.THUMBNAIL_SIZES.values())
+    with Image.open(BytesIO(data)) as original:
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no alpha channel; flatten onto white
+            image = image.convert('RGBA')
+            flat = Image.new('RGB', image.size, 'white')
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        else:
+            image = image.convert('RGB')
+
+    # Crop and scale once; the smaller sizes are scaled down from the largest
+    square = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+    encoded = {}
+    for pixels in sorted(set(settings.THUMBNAIL_SIZES.values()), reverse=True):
+        thumbnail = square if pixels == largest else square.resize((pixels, pixels), Image.Resampling.LANCZOS)
+        for image_format in settings.THUMBNAIL_FORMATS:
+            buffer = BytesIO()
+            thumbnail.save(buffer, format=image_format.upper(), quality=settings.THUMBNAIL_QUALITY, optimize=True)
+            encoded[pixels, image_format] = buffer.getvalue()
+    return encoded
+
+
+def generate(profile_pk):
+    """
+    Write the thumbnails of the profile's current picture and record them
+    on the profile. Returns the recorded value, or None when the profile
+    has no picture or got a different one in the meantime.
+    """
+    profile = UserProfile.objects.filter(pk=profile_pk).first()
+    if profile is None or not profile.profile_pic:
+        return None
+    source = profile.profile_pic.name
+    with profile.profile_pic.open('rb') as upload:
+        data = upload.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+
+    names = {
+        (pixels, image_format): thumbnail_name(digest, pixels, image_format)
+        for pixels in settings.THUMBNAIL_SIZES.values() for image_format in settings.THUMBNAIL_FORMATS
+    }
+    # The same picture uploaded again already has its files
+    missing = {key: name for key, name in names.items() if not default_storage.exists(name)}
+    if missing:
+        encoded = render(data)
+        for key, name in missing.items():
+            names[key] = default_storage.save(name, ContentFile(encoded[key]))
+
+    thumbnails = {
+        'source': source,
+        'sizes': {
+            size: {image_format: names[pixels, image_format] for image_format in settings.THUMBNAIL_FORMATS}
+            for size, pixels in settings.THUMBNAIL_SIZES.items()
+        },
+    }
+    # Only if the picture is still the one just processed
+    if not UserProfile.objects.filter(pk=profile_pk, profile_pic=source).update(thumbnails=thumbnails):
+        return None
+    # Nested users in cached payloads carry their avatar
+    cache.invalidate(cache.USERS, cache.user_tag(profile.user_id))
+    return thumbnails
+
+
+def generate_or_log(profile_pk):
+    """
+    generate(), logging failures instead of raising them: the upload that
+    scheduled it has already committed, so an unreadable picture is no
+    reason to fail anything else
+    """
+    try:
+        return generate(profile_pk)
+    except Exception:
+        logger.exception('Generating the thumbnails of profile %s failed', profile_pk)
+        return None
+
+
+def run(profile_pk):
+    """generate_or_log() on a worker thread, which has its own database connection"""
+    close_old_connections()
+    try:
+        return generate_or_log(profile_pk)
+    finally:
+        close_old_connections()
+
+
+def submit(profile_pk):
+    """Generate the thumbnails now: on the pool (returns a Future) or inline without workers"""
+    if settings.THUMBNAIL_WORKERS <= 0:
+        # Inline, on the caller's connection
+        return generate_or_log(profile_pk)
+    return executor().submit(run, profile_pk)
+
+
+def schedule(profile):
+    """Generate the profile's thumbnails once the current transaction commits"""
+    transaction.on_commit(lambda: submit(profile.pk))
+
+
+def urls(thumbnails, request=None):
+    """{size: {format: url}} for a UserProfile.thumbnails value"""
+    result = {}
+    for size, formats in (thumbnails or {}).get('sizes', {}).items():
+        result[size] = {}
+        for image_format, name in formats.items():
+            url = default_storage.url(name)
+            result[size][image_format] = request.build_absolute_uri(url) if request is not None else url
+    return result
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import views
+from . import async_views, views
 from rest_framework_simplejwt.views import TokenRefreshView
 
 router = DefaultRouter()
@@ -24,6 +24,20 @@ urlpatterns = [
     
     # API URLs for debugging
     path('api/debug/validation-errors/', views.ValidationErrorsView.as_view(), name='validation_errors'),
+    path('api/debug/cache-stats/', views.CacheStatsView.as_view(), name='cache_stats'),
+    path('api/debug/db-stats/', views.DatabaseStatsView.as_view(), name='db_stats'),
+
+    # Async read endpoints (see myapp.async_views)
+    path('api/async/articles/', async_views.article_list, name='async-article-list'),
+    path('api/async/articles/<int:pk>/', async_views.article_detail, name='async-article-detail'),
+    path('api/async/articles/<int:pk>/comments/', async_views.article_comments, name='async-article-comments'),
+    path('api/async/tags/<slug:slug>/', async_views.tag_detail, name='async-tag-detail'),
+
+    # Prometheus metrics
+    path('metrics', views.metrics_view, name='metrics'),
+
+    # Bulk export
+    path('api/export/<str:kind>/', views.ExportView.as_view(), name='export'),
     
     # Main pages
     path('', views.homeView.as_view(), name='home'),  
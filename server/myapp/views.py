@@ -1,3 +1,6 @@
+import logging
+
+from django.conf import settings
 from django.shortcuts import render
 from rest_framework import viewsets, generics, permissions, status
 from rest_framework.views import APIView
@@ -7,36 +10,63 @@ from django.shortcuts import get_object_or_404,redirect
 from .models import Article, UserProfile, Comment,Category,Tag
 from .serializers import RegisterSerializer, LoginSerializer, UserProfileSerializer,TagSerializer
 from rest_framework.renderers import JSONRenderer, TemplateHTMLRenderer
-from django.http import HttpResponse
-from .serializers import ArticleSerializer, CommentSerializer
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from .serializers import ArticleListSerializer, ArticleSerializer, CommentSerializer
+from .serializers import ModerationActionSerializer, ModerationClaimSerializer, ModerationCommentSerializer
+from .serializers import ModerationFilterSerializer, ModerationReleaseSerializer
 from .serializers import CategorySerializer
+from .pagination import ArticleCursorPagination, CommentCursorPagination, ReplyCursorPagination
+from .querysets import article_queryset
+from .comment_tree import CommentTree
+from .search import search_articles
+from . import export
+from .importer import import_articles
+from .parsers import NDJSONParser
+from . import database, metrics, moderation
+from rest_framework.parsers import JSONParser
+from . import cache
+from .cache import CachedResponseMixin, response_cache
+from . import conditional
+from .conditional import ConditionalGetMixin
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from django.db.models import Q
-from django.db.models import Count
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import ClaimsRefreshToken, is_admin
 
 # Create your views here.
 
+logger = logging.getLogger(__name__)
+
+# Everything an article listing is built from (see myapp.cache)
+ARTICLE_LIST_CACHE_TAGS = [cache.ARTICLES, cache.CATEGORIES, cache.TAGS, cache.USERS]
+
+
+def popular_tags():
+    """ The most used tags for the template sidebars; lazy, so a cached fragment never runs it """
+    return Tag.objects.order_by('-article_count')[:10]
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     """
     Custom permission to only allow owners of an object to perform certain actions
     """
     def has_object_permission(self, request, view, obj):
-        # Check if user is admin
-        try:
-            is_admin = request.user.userprofile.user_type in ['admin','owner']
-            if is_admin:
-                return True
-        except:
-            pass
+        # Check if user is admin; the role is on the token, so no profile query
+        if is_admin(request.user):
+            return True
 
-        #Check if user the user or author
-        if hasattr(obj,'user'):
-            return obj.user == request.user
-        elif hasattr(obj, 'author'):
-            return obj.author == request.user
+        #Check if user the user or author; ids avoid loading the related user
+        if hasattr(obj,'user_id'):
+            return obj.user_id == request.user.pk
+        elif hasattr(obj, 'author_id'):
+            return obj.author_id == request.user.pk
         return False
 
+class IsAdmin(permissions.BasePermission):
+    """Admin and owner profiles only (see authentication.is_admin)"""
+    def has_permission(self, request, view):
+        return is_admin(request.user)
+
 # Authentication Views
 class RegisterView(generics.CreateAPIView):
     """ API endpoint for registering new users """
@@ -54,9 +84,8 @@ class RegisterView(generics.CreateAPIView):
         return serializer.save()
     
     def post(self, request, *args, **kwargs):
-        # Debug info
-        print("Content type:", request.content_type)
-        print("Request data:", request.data)
+        # Never log request.data here: it contains the password
+        logger.debug("Registration request, content type %s", request.content_type)
         
         # Check if this is a form submission or API request
         # More robust method to detect API requests
@@ -69,7 +98,7 @@ class RegisterView(generics.CreateAPIView):
             if serializer.is_valid():
                 user = self.perform_create(serializer)
                 # Generate token for the user
-                refresh = RefreshToken.for_user(user)
+                refresh = ClaimsRefreshToken.for_user(user)
                 # Return both user data and token
                 response_data = {
                     'user': serializer.data,
@@ -78,7 +107,7 @@ class RegisterView(generics.CreateAPIView):
                 }
                 return Response(response_data, status=status.HTTP_201_CREATED)
             else:
-                print("Validation errors:", serializer.errors)
+                logger.info("Registration rejected: %s", serializer.errors)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         else:
             # Handle regular form submission
@@ -115,6 +144,55 @@ class ValidationErrorsView(APIView):
         }
         return Response(error_examples)
 
+class CacheStatsView(APIView):
+    """API endpoint reporting response cache hit/miss counts for this process"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        return Response(response_cache.stats.snapshot())
+
+class DatabaseStatsView(APIView):
+    """API endpoint reporting this process's database connections, pool and pragmas"""
+    permission_classes = [IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        return Response(database.database_stats())
+
+class ExportView(APIView):
+    """
+    Stream every article or comment as NDJSON (default) or CSV.
+
+    /api/export/<articles|comments>/?fmt=csv; `fmt` rather than `format`,
+    which DRF reserves for picking a renderer.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request, kind, *args, **kwargs):
+        fmt = request.query_params.get('fmt', 'ndjson')
+        try:
+            lines = export.export(kind, fmt)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(lines, content_type=export.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+
+def metrics_view(request):
+    """
+    Prometheus metrics for every worker process (see myapp.metrics).
+
+    Plain Django view: scrapers send no JWT, and with METRICS_TOKEN set
+    they must send it as a bearer token instead.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    gauges = [
+        ('comments_pending', 'Comments waiting for moderation', moderation.pending().count()),
+    ] + database.pool_gauges()
+    return HttpResponse(metrics.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 class LoginView(APIView):
     """ API endpoint for user login """
     permission_classes = [permissions.AllowAny]
@@ -127,15 +205,17 @@ class LoginView(APIView):
     
     def post(self, request):
         try:
-            # Debug info to help troubleshoot content type issues
-            print("Content type:", request.content_type)
-            print("Request data:", request.data)
+            # Content type helps troubleshoot form vs JSON logins; never log the data itself
+            logger.debug("Login request, content type %s", request.content_type)
+            metrics.registry.inc('login_attempts_total')
             
-            serializer = LoginSerializer(data=request.data)
+            # The plain HttpRequest, which user_login_failed receivers expect
+            serializer = LoginSerializer(data=request.data, context={'request': request._request})
             
             # Check if serializer is valid without raising exception to get detailed errors
             if not serializer.is_valid():
-                print("Validation errors:", serializer.errors)
+                logger.info("Login rejected: %s", serializer.errors)
+                metrics.registry.inc('login_failures_total')
                 # For API requests, return detailed validation errors
                 is_api_request = request.content_type and 'json' in request.content_type.lower() or \
                                  request.accepted_renderer.format == 'json'
@@ -150,9 +230,6 @@ class LoginView(APIView):
             # Get the user from the serializer
             user = serializer.validated_data['user']
             
-            # Generate token for the user
-            refresh = RefreshToken.for_user(user)
-            
             # Check if this is an API request
             is_api_request = request.content_type and 'json' in request.content_type.lower() or \
                            request.accepted_renderer.format == 'json'
@@ -168,8 +245,8 @@ class LoginView(APIView):
                             'user_type': user.userprofile.user_type if hasattr(user, 'userprofile') else 'regular'
                         }
                     },
-                    'token': str(refresh.access_token),
-                    'refresh': str(refresh)
+                    'token': serializer.validated_data['token'],
+                    'refresh': serializer.validated_data['refresh']
                 }
                 return Response(response_data, status=status.HTTP_200_OK)
             else:
@@ -178,7 +255,8 @@ class LoginView(APIView):
         except Exception as e:
             # More detailed error handling
             error_message = str(e)
-            print(f"Login error: {error_message}")
+            logger.exception("Login error: %s", error_message)
+            metrics.registry.inc('login_failures_total')
             
             # Check if this is an API request
             is_api_request = request.content_type and 'json' in request.content_type.lower() or \
@@ -216,7 +294,7 @@ class homeView(APIView):
             
             # Get recent articles if the Article model is being used
             try:
-                articles = Article.objects.all().order_by('-created_at')[:6]
+                articles = article_queryset(ArticleListSerializer)[:6]
             except:
                 articles = []
                 
@@ -226,9 +304,7 @@ class homeView(APIView):
                 'articles': articles
             })
         except Exception as e:
-            print(f"Error in homeView: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error in homeView: %s", e)
             # Return a simple response for debugging
             return Response({
                 'error': 'An error occurred while loading your profile. Please try again.'
@@ -295,11 +371,46 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         types = [{"value": choice[0], "label": choice[1]} for choice in UserProfile.USER_TYPE_CHOICES]
         return Response(types)
 
-class ArticleViewSet(viewsets.ModelViewSet):
+class ArticleViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """ API endpoint for managing articles """
-    queryset = Article.objects.all().order_by('-created_at')
+    queryset = Article.objects.all().order_by('-created_at', '-id')
     serializer_class = ArticleSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = ArticleCursorPagination
+    cache_endpoint = 'article-viewset-list'
+    # Listings use the compact representation; the full article is at its detail endpoint
+    list_actions = ('list', 'my_articles', 'search')
+
+    def get_serializer_class(self):
+        if self.action in self.list_actions:
+            return ArticleListSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        return article_queryset(self.get_serializer_class())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = conditional.cache_validators(request, self.cache_endpoint, ARTICLE_LIST_CACHE_TAGS)
+        not_modified = self.not_modified(validators)
+        if not_modified:
+            return not_modified
+
+        def build():
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data).data, ()
+        return Response(self.cached_data(build, tags=ARTICLE_LIST_CACHE_TAGS))
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        tags = [cache.article_tag(instance.pk), cache.USERS, *cache.article_dependencies(instance)]
+        validators = conditional.cache_validators(request, 'article-viewset-detail', tags, instance.pk)
+        not_modified = self.not_modified(validators)
+        if not_modified:
+            return not_modified
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
     
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -308,43 +419,67 @@ class ArticleViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         """ Get all comments for an article """
         article = self.get_object()
-        comments = Comment.objects.filter(article=article).order_by('-created_at')
+        comments = CommentTree.for_article(article).newest_first()
         serializer = CommentSerializer(comments, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[NDJSONParser, JSONParser], permission_classes=[permissions.IsAuthenticated])
+    def bulk_import(self, request):
+        """
+        Create many articles from an NDJSON body (or a JSON list).
+
+        Admins may set each row's author; everyone else imports as themselves.
+        Invalid rows are skipped and listed in the response with their line number.
+        """
+        data = request.data
+        if isinstance(data, dict):
+            return Response({'error': 'Expected NDJSON lines or a JSON list'}, status=status.HTTP_400_BAD_REQUEST)
+        result = import_articles(data, author=request.user, allow_author=is_admin(request.user))
+        if result['created']:
+            response_status = status.HTTP_201_CREATED
+        elif result['errors']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_200_OK
+        return Response(result, status=response_status)
+
     @action(detail=False, methods=['get'])
     def my_articles(self, request):
         """ Get all articles created by the authenticated user """
-        articles = Article.objects.filter(author=request.user).order_by('-created_at')
-        serializer = ArticleSerializer(articles, many=True)
+        articles = article_queryset(self.get_serializer_class(), Article.objects.filter(author=request.user))
+        serializer = self.get_serializer(articles, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """ Search articles by title, content, or author """
+        """ Search articles by title, content, tags or author, most relevant first """
         query = request.query_params.get('q', '')
         if query:
-            articles = Article.objects.filter(
-                Q(title__icontains=query) | 
-                Q(content__icontains=query) | 
-                Q(author__username__icontains=query)|
-                Q(tags__name__icontains=query)
-            ).distinct().order_by('-created_at')
+            limit = settings.SEARCH_RESULT_LIMIT
+            try:
+                limit = int(request.query_params.get('limit', limit))
+            except ValueError:
+                return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            limit = max(1, min(limit, settings.SEARCH_RESULT_LIMIT))
+            articles = search_articles(query, limit, queryset=article_queryset(self.get_serializer_class()))
             
             serializer = self.get_serializer(articles, many=True)
             return Response(serializer.data)
         return Response({"error": "Search query parameter is required"}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ArticleListView(generics.ListAPIView):
+class ArticleListView(ConditionalGetMixin, CachedResponseMixin, generics.ListAPIView):
     """ View for listing articles with filtering """
-    serializer_class = ArticleSerializer
+    serializer_class = ArticleListSerializer
     permission_classes = [permissions.AllowAny]
     renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
     template_name = 'article_list.html'
+    pagination_class = ArticleCursorPagination
+    cache_endpoint = 'article-list'
 
     def get_queryset(self):
-        queryset = Article.objects.all().order_by('-created_at')
+        queryset = article_queryset(self.get_serializer_class())
         category_slug = self.request.query_params.get('category')
         if category_slug:
             category = get_object_or_404(Category, slug=category_slug)
@@ -363,61 +498,103 @@ class ArticleListView(generics.ListAPIView):
         return queryset
         
     def get(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        
         # For API requests
         if request.accepted_renderer.format == 'json':
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+            queryset = self.get_queryset()
+            validators = conditional.cache_validators(request, self.cache_endpoint, ARTICLE_LIST_CACHE_TAGS)
+            not_modified = self.not_modified(validators)
+            if not_modified:
+                return not_modified
+
+            def build():
+                page = self.paginate_queryset(queryset)
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data).data, ()
+            return Response(self.cached_data(build, tags=ARTICLE_LIST_CACHE_TAGS))
         
-        # For template requests
+        page = self.paginate_queryset(self.get_queryset())
+        
+        # For template requests; the sidebars are lazy querysets rendered in cached fragments
         categories = Category.objects.all()
         
         return Response({
-            'articles': queryset,
+            'articles': page,
+            'next_page': self.paginator.get_next_link(),
+            'previous_page': self.paginator.get_previous_link(),
             'categories': categories,
+            'popular_tags': popular_tags(),
             'search_query': request.query_params.get('search', ''),
             'current_category': request.query_params.get('category', ''),
             'current_tag': request.query_params.get('tag', '')
         })
 
 
-class ArticleDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ArticleDetailView(ConditionalGetMixin, CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     """ View for retrieving, updating and deleting an article """
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsOwnerOrAdmin]
     lookup_field = 'slug'  # Use slug for lookups
     renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
-    template_name = 'article_detail.html'
+    template_name = 'article_details.html'
+    cache_endpoint = 'article-detail'
+
+    def get_queryset(self):
+        return article_queryset(self.get_serializer_class())
+
+    def comment_page(self, article):
+        """
+        One page of the article's top-level comments, newest first.
+
+        ?cursor= walks through the older pages; replies are loaded on demand
+        from /api/comments/<id>/replies/ using each comment's reply_count.
+        """
+        paginator = CommentCursorPagination()
+        queryset = Comment.objects.filter(article=article, parent__isnull=True).select_related('user__userprofile')
+        comments = paginator.paginate_queryset(queryset, self.request, view=self)
+        return comments, paginator
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        
-        # Get comments for this article
-        comments = Comment.objects.filter(article=instance).order_by('-created_at')
-        comments_serializer = CommentSerializer(comments, many=True)
         
         # For API requests
         if request.accepted_renderer.format == 'json':
-            return Response({
+            tags = [cache.article_tag(instance.pk), cache.USERS, *cache.article_dependencies(instance)]
+            validators = conditional.cache_validators(request, self.cache_endpoint, tags, instance.pk)
+            not_modified = self.not_modified(validators)
+            if not_modified:
+                return not_modified
+
+            def build():
+                serializer = self.get_serializer(instance)
+                comments, paginator = self.comment_page(instance)
+                comments_serializer = CommentSerializer(comments, many=True, context={'include_replies': False})
+                data = {
                     'article': serializer.data,
-                    'comments': comments_serializer.data
-            })
+                    'comments': comments_serializer.data,
+                    'comments_next': paginator.get_next_link(),
+                    'comments_previous': paginator.get_previous_link(),
+                }
+                return data, cache.article_dependencies(instance)
+            return Response(self.cached_data(build, tags=tags, key_parts=[instance.pk]))
         
-        # For template requests    
-        from django.db.models import Count
-        categories = Category.objects.annotate(article_count=Count('article'))
+        # Get the first page of top-level comments for this article
+        comments, paginator = self.comment_page(instance)
+        
+        # For template requests; the sidebars are lazy querysets rendered in cached fragments
+        categories = Category.objects.all()
         
         return Response({
             'article': instance,
             'comments': comments,
+            'next_comments': paginator.get_next_link(),
+            'previous_comments': paginator.get_previous_link(),
+            # Keys the comments fragment with the cursor; other query params don't pick the page
+            'comments_page_size': paginator.page_size_value,
             'categories': categories,
+            'popular_tags': popular_tags(),
             'can_edit': request.user.is_authenticated and (
-                request.user == instance.author or 
-                hasattr(request.user, 'userprofile') and 
-                request.user.userprofile.user_type in ['admin', 'owner']
+                request.user.pk == instance.author_id or is_admin(request.user)
             )
         })
     
@@ -603,35 +780,37 @@ class TagViewSet(viewsets.ModelViewSet):
     def articles(self, request, slug=None):
         """ Get all articles with a specific tag """
         tag = self.get_object()
-        articles = Article.objects.filter(tags=tag).order_by('-created_at')
-        serializer = ArticleSerializer(articles, many=True)
+        articles = article_queryset(ArticleListSerializer, Article.objects.filter(tags=tag))
+        serializer = ArticleListSerializer(articles, many=True, context=self.get_serializer_context())
         return Response(serializer.data)
         
-class TagListView(generics.ListAPIView):
+class TagListView(CachedResponseMixin, generics.ListAPIView):
     """ View for listing tags """
     serializer_class = TagSerializer
     permission_classes = [permissions.AllowAny]
     renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
     template_name = 'tags/tag_list.html'
+    cache_endpoint = 'tag-list'
     
     def get_queryset(self):
-        # Returns all tags with article count
-        return Tag.objects.annotate(article_count=Count('article')).order_by('-article_count')
+        # Returns all tags, most used first
+        return Tag.objects.order_by('-article_count')
     
     def get(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         
         # API request
         if request.accepted_renderer.format == 'json':
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+            def build():
+                return self.get_serializer(queryset, many=True).data, ()
+            return Response(self.cached_data(build, tags=[cache.TAGS]))
         
         # Template request
         return Response({
             'tags': queryset
         })
     
-class TagDetailView(generics.RetrieveAPIView):
+class TagDetailView(ConditionalGetMixin, CachedResponseMixin, generics.RetrieveAPIView):
     """ View for showing articles by tag """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -639,38 +818,51 @@ class TagDetailView(generics.RetrieveAPIView):
     lookup_field = 'slug'
     renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
     template_name = 'tags/tag_detail.html'
+    cache_endpoint = 'tag-detail'
     
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        
-        # Get articles with this tag
-        articles = Article.objects.filter(tags=instance).order_by('-created_at')
-        
+
         # API request
         if request.accepted_renderer.format == 'json':
-            article_serializer = ArticleSerializer(articles, many=True)
-            return Response({
-                'tag': serializer.data,
-                'articles': article_serializer.data
-            })
+            tags = [cache.tag_tag(instance.slug), cache.ARTICLES, cache.CATEGORIES, cache.USERS]
+            validators = conditional.cache_validators(request, self.cache_endpoint, tags, instance.slug)
+            not_modified = self.not_modified(validators)
+            if not_modified:
+                return not_modified
+
+            def build():
+                articles = article_queryset(ArticleListSerializer, Article.objects.filter(tags=instance))
+                article_serializer = ArticleListSerializer(articles, many=True, context=self.get_serializer_context())
+                data = {
+                    'tag': self.get_serializer(instance).data,
+                    'articles': article_serializer.data
+                }
+                return data, ()
+            return Response(self.cached_data(build, tags=tags, key_parts=[instance.slug]))
         
-        # Get popular tags
-        popular_tags = Tag.objects.annotate(article_count=Count('article')).order_by('-article_count')[:10]
+        # Get articles with this tag
+        articles = article_queryset(ArticleListSerializer, Article.objects.filter(tags=instance))
         
         # Template request
         return Response({
             'tag': instance,
             'articles': articles,
-            'popular_tags': popular_tags,
+            'popular_tags': popular_tags(),
         })
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """ API endpoint for managing categories """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]  # Allow public access to categories without authentication
     lookup_field = 'slug'
+    cache_endpoint = 'category-list'
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            return self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data, ()
+        return Response(self.cached_data(build, tags=[cache.CATEGORIES]))
     
     # All users can view categories, but only authenticated users can manage them
     def get_permissions(self):
@@ -690,8 +882,8 @@ class CategoryListView(generics.ListAPIView):
     template_name = 'categories/category_list.html'
     
     def get_queryset(self):
-        # Returns all categories with article count
-        return Category.objects.annotate(article_count=Count('article')).order_by('-article_count')
+        # Returns all categories, largest first
+        return Category.objects.order_by('-article_count')
     
     def get(self, request, *args, **kwargs):
         queryset = self.get_queryset()
@@ -711,12 +903,26 @@ class CommentViewSet(viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.AllowAny]  # Any user can perform CRUD operations on comments
+    pagination_class = CommentCursorPagination
+    # Numeric ids only, so /comments/approve/ can never be read as a comment's URL
+    lookup_value_regex = r'\d+'
+    moderation_actions = ('approve', 'reject', 'pending', 'claim', 'release', 'approve_many', 'reject_many')
+
+    def get_permissions(self):
+        if self.action in self.moderation_actions:
+            return [IsAdmin()]
+        return super().get_permissions()
+
+    def get_serializer_class(self):
+        if self.action in ('pending', 'claim'):
+            return ModerationCommentSerializer
+        return super().get_serializer_class()
     
     def get_queryset(self):
         """
         Filter comments by article or parent comment
         """
-        queryset = Comment.objects.all().order_by('-created_at')
+        queryset = Comment.objects.select_related('user__userprofile').order_by('-created_at', '-id')
         article_id = self.request.query_params.get('article', None)
         
         if article_id:
@@ -728,41 +934,115 @@ class CommentViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(parent__isnull=True)
             
         return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # Lists only carry reply_count; replies come from the replies action
+        if self.action in ('list', 'replies'):
+            context['include_replies'] = False
+        return context
     
     def perform_create(self, serializer):
         """
         Save the current user as the comment author
         """
         serializer.save(user=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """
+        Approved direct replies to a comment, oldest first, one page at a time
+        """
+        parent = self.get_object()
+        queryset = Comment.objects.filter(parent=parent, is_approved=True).select_related('user__userprofile')
+        paginator = ReplyCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
         
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """
         Approve a specific comment
         """
-        comment = self.get_object()
-        comment.is_approved = True
-        comment.save()
-        return Response({'status': 'comment approved'})
+        return self.moderate_one(pk, moderation.approve, 'comment approved')
         
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         """
         Reject a specific comment
         """
-        comment = self.get_object()
-        comment.is_approved = False
-        comment.save()
-        return Response({'status': 'comment rejected'})
+        return self.moderate_one(pk, moderation.reject, 'comment rejected')
+
+    def moderate_one(self, pk, moderate, message):
+        if moderate(Comment.objects.filter(pk=pk), self.request.user):
+            return Response({'status': message})
+        if not Comment.objects.filter(pk=pk).exists():
+            raise NotFound()
+        return Response({'error': 'The comment is claimed by another moderator'}, status=status.HTTP_409_CONFLICT)
         
     @action(detail=False, methods=['get'])
     def pending(self, request):
         """
-        Return all comments pending approval
+        The moderation queue, newest first, one page at a time. Takes the
+        ModerationFilterSerializer fields as query parameters.
         """
-        pending_comments = Comment.objects.filter(is_approved=False)
-        serializer = self.get_serializer(pending_comments, many=True)
-        return Response(serializer.data)
+        filters = ModerationFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        queryset = moderation.pending().filter(moderation.queue_filter(**filters.validated_data))
+        page = self.paginate_queryset(queryset.select_related('user__userprofile'))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def claim(self, request):
+        """
+        Lease a batch of queued comments to the current moderator:
+        {"count": 50, "filters": {...}}, both optional
+        """
+        serializer = ModerationClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        queryset = moderation.pending().filter(moderation.queue_filter(**serializer.validated_data.get('filters', {})))
+        claimed, until = moderation.claim(request.user, serializer.validated_data.get('count'), queryset)
+        return Response({
+            'claimed_until': until,
+            'results': self.get_serializer(claimed.select_related('user__userprofile'), many=True).data,
+        })
+
+    @action(detail=False, methods=['post'])
+    def release(self, request):
+        """
+        Give up the current moderator's claims: {"ids": [...]}, or all of them
+        """
+        serializer = ModerationReleaseSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data.get('ids')
+        queryset = Comment.objects.filter(pk__in=ids) if ids else None
+        return Response({'released': moderation.release(request.user, queryset)})
+
+    @action(detail=False, methods=['post'], url_path='approve')
+    def approve_many(self, request):
+        """
+        Approve comments in bulk: {"ids": [...]} or {"filters": {...}}
+        """
+        return self.moderate_many(moderation.approve, 'comments approved')
+
+    @action(detail=False, methods=['post'], url_path='reject')
+    def reject_many(self, request):
+        """
+        Reject comments in bulk: {"ids": [...]} or {"filters": {...}}
+        """
+        return self.moderate_many(moderation.reject, 'comments rejected')
+
+    def moderate_many(self, moderate, message):
+        serializer = ModerationActionSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        if 'ids' in serializer.validated_data:
+            # Any comment, so an earlier decision can be reversed
+            queryset = Comment.objects.filter(pk__in=serializer.validated_data['ids'])
+        else:
+            queryset = moderation.pending().filter(moderation.queue_filter(**serializer.validated_data['filters']))
+        return Response({'status': message, 'count': moderate(queryset, self.request.user)})
 
 # Comment management views with templates
 class CommentListView(APIView):
@@ -780,15 +1060,19 @@ class CommentListView(APIView):
 
 
 class PendingCommentsView(APIView):
-    """View for listing pending comments"""
+    """View for the moderation queue (see myapp.moderation), one page at a time"""
     renderer_classes = [TemplateHTMLRenderer]
     template_name = 'comments/comment_list.html'
-    permission_classes = [permissions.AllowAny]  # No permission required
+    permission_classes = [IsAdmin]
     
     def get(self, request, format=None):
-        comments = Comment.objects.filter(is_approved=False).order_by('-created_at')
+        paginator = CommentCursorPagination()
+        queryset = moderation.pending().select_related('article', 'user')
+        comments = paginator.paginate_queryset(queryset, request, view=self)
         return Response({
             'comments': comments,
             'title': 'Pending Comments',
-            'pending': True
+            'pending': True,
+            'next_page': paginator.get_next_link(),
+            'previous_page': paginator.get_previous_link(),
         })
\ No newline at end of file
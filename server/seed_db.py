@@ -4,7 +4,10 @@ Database seeding script for PlateVite Blog Platform.
 This script creates default users, categories, tags, and sample content.
 """
 
+import argparse
 import os
+import time
+
 import django
 
 # Setup Django environment
@@ -189,6 +192,22 @@ def create_sample_comments():
     except Exception as e:
         print(f"❌ Error creating comments: {e}")
 
+def create_synthetic_data(articles, seed=0, chunk_size=2000, comments_per_article=4.0):
+    """Bulk-generate a large, realistic dataset for load testing."""
+    from myapp.synthetic import SyntheticDataGenerator
+
+    print(f"\n=== Generating {articles} synthetic articles (seed {seed}) ===\n")
+    started = time.monotonic()
+    stats = SyntheticDataGenerator(
+        articles,
+        seed=seed,
+        chunk_size=chunk_size,
+        comments_per_article=comments_per_article,
+        log=lambda message: print(f"ℹ️ {message}"),
+    ).run()
+    elapsed = time.monotonic() - started
+    print(f"✅ Created {', '.join(f'{count} {name}' for name, count in stats.items())} in {elapsed:.1f}s")
+
 def run_all():
     """Run all seeding functions."""
     print("\n=== Starting database seeding ===\n")
@@ -203,5 +222,18 @@ def run_all():
     print("Regular user: username='user', password='User123!'")
     print("Author: username='author', password='Author123!'")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=0,
+                        help='Also generate this many synthetic articles for load testing')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the synthetic data')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per bulk insert')
+    parser.add_argument('--comments-per-article', type=float, default=4.0,
+                        help='Mean number of comments per synthetic article')
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     run_all()
+    if args.articles:
+        create_synthetic_data(args.articles, args.seed, args.chunk_size, args.comments_per_article)